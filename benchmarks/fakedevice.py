@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Dispositivo simulado para los benchmarks de Redmi A2 Lite Tool.
+
+Ofrece lo mismo por dos vías, ambas con latencia y ancho de banda configurables:
+- un servidor adb falso (protocolo host: `host:devices`, `host:transport`,
+  `shell:`, `exec:`, `reboot:` y `sync:`) para el transporte nativo;
+- los ejecutables falsos `fake_bin/adb` y `fake_bin/fastboot` para el modo
+  subprocess (se ponen delante en PATH).
+
+`/sdcard` se mapea a la carpeta `BENCH_DEVICE_ROOT`. Los comandos de shell se
+ejecutan con `sh` sobre esa carpeta (find, stat, tar... del sistema), así que
+hace falta un sistema POSIX.
+
+Configuración por variables de entorno:
+    BENCH_DEVICE_ROOT      carpeta que hace de /sdcard
+    BENCH_SERIALS          seriales separados por comas (BENCH0001)
+    BENCH_LATENCY_MS       latencia por petición (round trip USB), en ms
+    BENCH_BANDWIDTH_MBPS   ancho de banda en MB/s (0 = sin límite)
+    BENCH_FASTBOOT_LOG     si se define, `fastboot` anota ahí cada llamada
+
+Uso: python fakedevice.py server --port 15037
+"""
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import time
+
+PROPS = {
+    'ro.product.model': 'Redmi A2 Lite',
+    'ro.product.device': 'water',
+    'ro.build.version.release': '12',
+    'ro.build.version.sdk': '31',
+}
+CHUNK = 64 * 1024
+MAX_DOWNLOAD_SIZE = 256 * 1024 * 1024
+
+
+def config():
+    return {
+        'root': os.environ.get('BENCH_DEVICE_ROOT', os.path.join(os.getcwd(), 'device')),
+        'serials': [s for s in os.environ.get('BENCH_SERIALS', 'BENCH0001').split(',') if s],
+        'latency': float(os.environ.get('BENCH_LATENCY_MS', '0')) / 1000,
+        'bandwidth': float(os.environ.get('BENCH_BANDWIDTH_MBPS', '0')) * 1e6,
+    }
+
+
+class Throttle:
+    """Limita un flujo de bytes a `bandwidth` bytes/s (0 = sin límite)."""
+
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        self.start = time.monotonic()
+        self.bytes = 0
+
+    def __call__(self, n):
+        if not self.bandwidth:
+            return
+        self.bytes += n
+        delay = self.start + self.bytes / self.bandwidth - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def getprop_output(serial):
+    props = dict(PROPS, **{'ro.serialno': serial})
+    return ''.join(f'[{k}]: [{v}]\n' for k, v in props.items()).encode()
+
+
+def device_shell(command, root):
+    """Lanza `command` con `sh` sobre `root` (en lugar de /sdcard)."""
+    return subprocess.Popen(['sh', '-c', command.replace('/sdcard', root)], stdout=subprocess.PIPE)
+
+
+def copy_throttled(src, dst, throttle):
+    while True:
+        data = src.read(CHUNK)
+        if not data:
+            return
+        throttle(len(data))
+        dst.write(data)
+
+
+# Servidor adb falso
+
+class AdbHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.cfg = self.server.cfg
+        self.serial = self.cfg['serials'][0] if self.cfg['serials'] else ''
+        self.server.connections.add(self.request)
+
+    def finish(self):
+        self.server.connections.discard(self.request)
+
+    def _recv_exact(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _message(self):
+        return self._recv_exact(int(self._recv_exact(4), 16)).decode()
+
+    def _okay(self, payload=None):
+        data = b'OKAY'
+        if payload is not None:
+            data += b'%04x' % len(payload) + payload
+        self.request.sendall(data)
+
+    def _fail(self, reason):
+        reason = reason.encode()
+        self.request.sendall(b'FAIL' + b'%04x' % len(reason) + reason)
+
+    def handle(self):
+        try:
+            while True:
+                service = self._message()
+                if service == 'host:version':
+                    return self._okay(b'0029')
+                if service == 'host:devices':
+                    return self._okay(''.join(f'{s}\tdevice\n' for s in self.cfg['serials']).encode())
+                if service.startswith('host:transport:'):
+                    serial = service.split(':', 2)[2]
+                    if serial not in self.cfg['serials']:
+                        return self._fail(f"device '{serial}' not found")
+                    self.serial = serial
+                    self._okay()
+                    continue
+                if service in ('host:transport-any', 'host:transport-usb'):
+                    self._okay()
+                    continue
+                time.sleep(self.cfg['latency'])
+                if service.startswith(('shell:', 'exec:')):
+                    self._okay()
+                    return self._shell(service.split(':', 1)[1])
+                if service.startswith('reboot:'):
+                    return self._okay()
+                if service == 'sync:':
+                    self._okay()
+                    return self._sync()
+                return self._fail(f'unknown service {service}')
+        except (EOFError, OSError):
+            return
+
+    def _shell(self, command):
+        if command == 'getprop':
+            return self.request.sendall(getprop_output(self.serial))
+        if command.startswith('getprop '):
+            value = dict(PROPS, **{'ro.serialno': self.serial}).get(command.split()[1], '')
+            return self.request.sendall(f'{value}\n'.encode())
+        throttle = Throttle(self.cfg['bandwidth'])
+        proc = device_shell(command, self.cfg['root'])
+        try:
+            while True:
+                data = proc.stdout.read1(CHUNK)
+                if not data:
+                    break
+                throttle(len(data))
+                self.request.sendall(data)
+        finally:
+            proc.kill()
+            proc.wait()
+
+    def _sync(self):
+        while True:
+            header = self._recv_exact(8)
+            ident, length = header[:4], struct.unpack('<I', header[4:])[0]
+            if ident == b'QUIT':
+                return
+            path = self._recv_exact(length).decode().replace('/sdcard', self.cfg['root'])
+            time.sleep(self.cfg['latency'])
+            if ident == b'STAT':
+                try:
+                    st = os.stat(path)
+                    self.request.sendall(b'STAT' + struct.pack('<III', st.st_mode, st.st_size, int(st.st_mtime)))
+                except OSError:
+                    self.request.sendall(b'STAT' + struct.pack('<III', 0, 0, 0))
+            elif ident == b'RECV':
+                self._sync_recv(path)
+            elif ident == b'SEND':
+                self._sync_send(path)
+            else:
+                return
+
+    def _sync_recv(self, path):
+        throttle = Throttle(self.cfg['bandwidth'])
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    data = f.read(CHUNK)
+                    if not data:
+                        break
+                    throttle(len(data))
+                    self.request.sendall(b'DATA' + struct.pack('<I', len(data)) + data)
+        except OSError as e:
+            reason = str(e).encode()
+            return self.request.sendall(b'FAIL' + struct.pack('<I', len(reason)) + reason)
+        self.request.sendall(b'DONE' + struct.pack('<I', 0))
+
+    def _sync_send(self, spec):
+        path = spec.rsplit(',', 1)[0]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        throttle = Throttle(self.cfg['bandwidth'])
+        with open(path, 'wb') as f:
+            while True:
+                header = self._recv_exact(8)
+                length = struct.unpack('<I', header[4:])[0]
+                if header[:4] != b'DATA':
+                    break
+                throttle(length)
+                f.write(self._recv_exact(length))
+        os.utime(path, (length, length))
+        self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port, cfg=None):
+        self.cfg = cfg or config()
+        self.connections = set()
+        super().__init__(('127.0.0.1', port), AdbHandler)
+
+    def drop_connections(self):
+        """Corta las conexiones abiertas, como un reinicio del dispositivo o del servidor adb."""
+        for sock in list(self.connections):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# Ejecutables falsos (modo subprocess)
+
+def _take_serial(args, cfg):
+    if len(args) >= 2 and args[0] == '-s':
+        return args[1], args[2:]
+    return (cfg['serials'][0] if cfg['serials'] else ''), args
+
+
+def fake_adb(args):
+    cfg = config()
+    serial, args = _take_serial(args, cfg)
+    if not args:
+        return 1
+    sub, rest = args[0], args[1:]
+    if sub == 'version':
+        print('Android Debug Bridge version 1.0.41 (fake)')
+        return 0
+    if sub in ('start-server', 'kill-server'):
+        return 0
+    if sub == 'devices':
+        print('List of devices attached')
+        for s in cfg['serials']:
+            print(f'{s}\tdevice')
+        print()
+        return 0
+    if serial not in cfg['serials']:
+        print(f"adb: device '{serial}' not found", file=sys.stderr)
+        return 1
+    time.sleep(cfg['latency'])
+    out = sys.stdout.buffer
+    if sub in ('shell', 'exec-out'):
+        command = ' '.join(rest)
+        if command == 'getprop':
+            out.write(getprop_output(serial))
+            return 0
+        proc = device_shell(command, cfg['root'])
+        copy_throttled(proc.stdout, out, Throttle(cfg['bandwidth']))
+        return proc.wait()
+    if sub == 'pull':
+        paths = [p for p in rest if p != '-a']
+        *sources, dest = paths
+        throttle = Throttle(cfg['bandwidth'])
+        for src in sources:
+            local = src.replace('/sdcard', cfg['root'])
+            target = os.path.join(dest, os.path.basename(local)) if os.path.isdir(dest) else dest
+            if os.path.isdir(local):
+                shutil.copytree(local, target, dirs_exist_ok=True)
+                continue
+            with open(local, 'rb') as fsrc, open(target, 'wb') as fdst:
+                copy_throttled(fsrc, fdst, throttle)
+            shutil.copystat(local, target)
+        return 0
+    if sub == 'push':
+        *sources, dest = rest
+        dest = dest.replace('/sdcard', cfg['root'])
+        throttle = Throttle(cfg['bandwidth'])
+        for src in sources:
+            target = dest
+            if len(sources) > 1 or dest.endswith('/') or os.path.isdir(dest):
+                os.makedirs(dest, exist_ok=True)
+                target = os.path.join(dest, os.path.basename(src))
+            with open(src, 'rb') as fsrc, open(target, 'wb') as fdst:
+                copy_throttled(fsrc, fdst, throttle)
+            shutil.copystat(src, target)
+        return 0
+    if sub == 'sideload':
+        with open(rest[0], 'rb') as f:
+            copy_throttled(f, open(os.devnull, 'wb'), Throttle(cfg['bandwidth']))
+        return 0
+    if sub == 'reboot':
+        return 0
+    print(f'adb (fake): comando no soportado: {sub}', file=sys.stderr)
+    return 1
+
+
+def fake_fastboot(args):
+    cfg = config()
+    log = os.environ.get('BENCH_FASTBOOT_LOG')
+    if log:
+        with open(log, 'a', encoding='utf-8') as f:
+            f.write(' '.join(args) + '\n')
+    serial, args = _take_serial(args, cfg)
+    if not args:
+        return 1
+    sub, rest = args[0], args[1:]
+    if sub == 'devices':
+        for s in cfg['serials']:
+            print(f'{s}\tfastboot')
+        return 0
+    time.sleep(cfg['latency'])
+    if sub == 'getvar':
+        values = {'max-download-size': hex(MAX_DOWNLOAD_SIZE), 'product': 'water'}
+        print(f'{rest[0]}: {values.get(rest[0], "")}', file=sys.stderr)
+        return 0
+    if sub == 'flash':
+        partition, image = rest[0], rest[1]
+        start = time.monotonic()
+        with open(image, 'rb') as f, open(os.devnull, 'wb') as sink:
+            copy_throttled(f, sink, Throttle(cfg['bandwidth']))
+        print(f"Sending '{partition}' OKAY [{time.monotonic() - start:.3f}s]")
+        print(f"Writing '{partition}' OKAY")
+        return 0
+    if sub in ('reboot', 'flashing', 'oem', 'continue'):
+        return 0
+    print(f'fastboot (fake): comando no soportado: {sub}', file=sys.stderr)
+    return 1
+
+
+def main(argv):
+    if len(argv) >= 1 and argv[0] == 'server':
+        port = int(argv[argv.index('--port') + 1]) if '--port' in argv else 15037
+        with FakeAdbServer(port) as server:
+            server.serve_forever()
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
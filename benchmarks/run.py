@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de Redmi A2 Lite Tool contra un dispositivo simulado.
+
+Levanta el servidor adb falso de `fakedevice.py`, pone `fake_bin/` (adb y
+fastboot falsos) delante en PATH, genera un árbol de archivos en el "teléfono"
+y mide:
+
+- startup:        `python tool.py --help`
+- info:           `info` por transporte nativo y subprocess, y en proceso (`run_job`)
+- backup_small:   backup de muchos archivos pequeños (pull por sync y `--stream`)
+- backup_large:   backup de un archivo grande (pull por sync y `--stream`)
+- flash_package:  `flash-package` de principio a fin (hash + flash de N imágenes)
+- gui_dispatch:   latencia desde que la GUI encola un trabajo hasta que empieza/termina
+
+Los resultados se guardan en `benchmarks/results/<fecha>[-etiqueta].json`;
+`--compare ARCHIVO` muestra la diferencia con una ejecución anterior.
+
+Uso: python benchmarks/run.py [--only backup_small] [--latency-ms 2] [--bandwidth-mbps 35]
+"""
+import hashlib
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO = BENCH_DIR.parent
+TOOL = REPO / 'tool.py'
+sys.path.insert(0, str(REPO))  # `tool` y `gui` para los escenarios en proceso
+SERIAL = 'BENCH0001'
+SCENARIOS = ('startup', 'info', 'backup_small', 'backup_large', 'flash_package', 'gui_dispatch')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_random(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        left = size
+        while left:
+            chunk = min(left, 1024 * 1024)
+            f.write(os.urandom(chunk))
+            left -= chunk
+
+
+def make_device_tree(root, small_files, small_kb, large_mb):
+    """`small/`: muchos archivos pequeños repartidos en carpetas; `large/`: un archivo grande."""
+    for i in range(small_files):
+        write_random(root / 'small' / f'd{i // 100:03d}' / f'f{i:05d}.bin', small_kb * 1024)
+    write_random(root / 'large' / 'big.bin', large_mb * 1024 * 1024)
+
+
+def summarize(samples, unit='s'):
+    return {
+        'unit': unit, 'n': len(samples),
+        'median': statistics.median(samples), 'min': min(samples), 'max': max(samples),
+        'mean': statistics.fmean(samples),
+    }
+
+
+class Bench:
+    """Entorno de una ejecución: dispositivo simulado, servidor adb falso y variables de entorno."""
+
+    def __init__(self, workdir, repeat, latency_ms, bandwidth_mbps, sizes):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.sizes = sizes
+        self.device_root = workdir / 'device'
+        self.port = free_port()
+        self.env = dict(
+            os.environ,
+            PATH=os.pathsep.join([str(BENCH_DIR / 'fake_bin'), os.environ.get('PATH', '')]),
+            BENCH_DEVICE_ROOT=str(self.device_root),
+            BENCH_SERIALS=SERIAL,
+            BENCH_LATENCY_MS=str(latency_ms),
+            BENCH_BANDWIDTH_MBPS=str(bandwidth_mbps),
+            ANDROID_ADB_SERVER_ADDRESS='127.0.0.1',
+            ANDROID_ADB_SERVER_PORT=str(self.port),
+            REDMI_TOOL_CACHE=str(workdir / 'cache'),
+        )
+        self.server = None
+
+    def __enter__(self):
+        make_device_tree(self.device_root, self.sizes['small_files'], self.sizes['small_kb'], self.sizes['large_mb'])
+        self.server = subprocess.Popen([sys.executable, str(BENCH_DIR / 'fakedevice.py'), 'server', '--port', str(self.port)],
+                                       env=self.env)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise click.ClickException('el servidor adb falso no arrancó')
+                time.sleep(0.05)
+        # `tool` lee la configuración del entorno al importarse (escenarios en proceso).
+        os.environ.update(self.env)
+        return self
+
+    def __exit__(self, *exc):
+        if self.server is not None:
+            self.server.kill()
+            self.server.wait()
+
+    def tool(self, *args, env=None):
+        """Ejecuta `python tool.py ARGS` y devuelve la duración en segundos."""
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, str(TOOL), *map(str, args)], env=env or self.env,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise click.ClickException(f'tool.py {" ".join(map(str, args))} falló:\n{proc.stdout.decode(errors="replace")}')
+        return elapsed
+
+    def timed(self, func):
+        return [func() for _ in range(self.repeat)]
+
+    def tree_bytes(self, sub):
+        return sum(p.stat().st_size for p in (self.device_root / sub).rglob('*') if p.is_file())
+
+    def tree_files(self, sub):
+        return sum(1 for p in (self.device_root / sub).rglob('*') if p.is_file())
+
+
+def bench_startup(b):
+    return {'help': summarize(b.timed(lambda: b.tool('--help')))}
+
+
+def bench_info(b):
+    import tool
+
+    tool.PROPS_TTL = 0  # medir el round trip, no la caché de propiedades
+
+    def in_process():
+        job = tool.Job(['-s', SERIAL, 'info'])
+        job.on_output = lambda _job, _text: None
+        start = time.perf_counter()
+        if tool.run_job(job) != 0:
+            raise click.ClickException('info en proceso falló')
+        return time.perf_counter() - start
+
+    return {
+        'native': summarize(b.timed(lambda: b.tool('--transport', 'native', '-s', SERIAL, 'info'))),
+        'subprocess': summarize(b.timed(lambda: b.tool('--transport', 'subprocess', '-s', SERIAL, 'info'))),
+        'in_process': summarize(b.timed(in_process)),
+    }
+
+
+def _bench_backup(b, sub, other):
+    size, files = b.tree_bytes(sub), b.tree_files(sub)
+    results = {}
+    for mode, extra in (('sync', []), ('stream', ['--stream'])):
+        def once():
+            dst = b.workdir / f'backup-{sub}-{mode}'
+            shutil.rmtree(dst, ignore_errors=True)
+            return b.tool('-s', SERIAL, 'backup', dst, '--full', '--exclude', other, *extra)
+
+        stats = summarize(b.timed(once))
+        stats['mb_s'] = size / 1e6 / stats['median']
+        stats['files_s'] = files / stats['median']
+        results[mode] = stats
+    return results
+
+
+def bench_backup_small(b):
+    return _bench_backup(b, 'small', 'large')
+
+
+def bench_backup_large(b):
+    return _bench_backup(b, 'large', 'small')
+
+
+def bench_flash_package(b):
+    images = b.workdir / 'images'
+    actions = []
+    for i in range(b.sizes['images']):
+        img = images / f'part{i}.img'
+        write_random(img, b.sizes['image_mb'] * 1024 * 1024)
+        actions.append({'partition': f'part{i}', 'image': str(img),
+                        'sha256': hashlib.sha256(img.read_bytes()).hexdigest()})
+    manifest = images / 'manifest.json'
+    manifest.write_text(json.dumps({'actions': actions}), encoding='utf-8')
+    total = b.sizes['images'] * b.sizes['image_mb'] * 1024 * 1024
+
+    def once():
+        # Caché de hashes vacía en cada repetición: mide el caso en frío.
+        shutil.rmtree(b.workdir / 'cache', ignore_errors=True)
+        return b.tool('-s', SERIAL, 'flash-package', manifest, '--confirm')
+
+    stats = summarize(b.timed(once))
+    stats['mb_s'] = total / 1e6 / stats['median']
+    return {'end_to_end': stats}
+
+
+def bench_gui_dispatch(b):
+    try:
+        import gui
+    except ImportError as e:  # sin tkinter
+        return {'skipped': str(e)}
+    started, finished = {}, {}
+    done = threading.Event()
+    jobs = b.repeat * 10
+
+    def on_update(job):
+        now = time.perf_counter()
+        if job.state == 'ejecutando':
+            started.setdefault(job, now)
+        elif job.state in ('ok', 'error', 'cancelado'):
+            finished[job] = now
+            if len(finished) == jobs:
+                done.set()
+
+    engine = gui.JobEngine(on_output=lambda _job, _text: None, on_update=on_update)
+    submitted = {}
+    for _ in range(jobs):
+        t = time.perf_counter()
+        job = engine.submit(['-s', SERIAL, 'info'], device=SERIAL)
+        submitted[job] = t
+    if not done.wait(60):
+        raise click.ClickException('los trabajos de la GUI no terminaron')
+    failed = [job for job in submitted if job.exit_code != 0]
+    if failed:
+        raise click.ClickException(f'{len(failed)} trabajos de la GUI fallaron')
+    # Mismo dispositivo: los trabajos van en serie, así que se mide cada uno desde que
+    # le toca (fin del anterior o encolado) hasta que arranca y hasta que termina.
+    order = sorted(submitted, key=lambda j: started[j])
+    ready = [max(submitted[j], finished[order[i - 1]] if i else 0) for i, j in enumerate(order)]
+    return {
+        'start_latency': summarize([started[j] - r for j, r in zip(order, ready)]),
+        'run_time': summarize([finished[j] - started[j] for j in order]),
+    }
+
+
+def compare(current, baseline):
+    """Tabla de medianas: base, actual y diferencia porcentual."""
+    lines = [f'{"métrica":<34} {"base":>10} {"actual":>10} {"Δ%":>8}']
+    for scenario, metrics in current['results'].items():
+        for name, stats in metrics.items():
+            base = baseline.get('results', {}).get(scenario, {}).get(name)
+            if not isinstance(stats, dict) or not isinstance(base, dict):
+                continue
+            delta = (stats['median'] - base['median']) / base['median'] * 100 if base['median'] else 0.0
+            lines.append(f'{scenario + "." + name:<34} {base["median"]:>10.4f} {stats["median"]:>10.4f} {delta:>+8.1f}')
+    return '\n'.join(lines)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--only', multiple=True, type=click.Choice(SCENARIOS), help='Escenarios a ejecutar (por defecto todos)')
+@click.option('--repeat', type=click.IntRange(min=1), default=5, show_default=True, help='Repeticiones por medida')
+@click.option('--latency-ms', type=float, default=2.0, show_default=True, help='Latencia simulada por petición')
+@click.option('--bandwidth-mbps', type=float, default=35.0, show_default=True, help='Ancho de banda simulado (0 = sin límite)')
+@click.option('--small-files', type=int, default=500, show_default=True, help='Archivos pequeños en el árbol del dispositivo')
+@click.option('--small-kb', type=int, default=8, show_default=True, help='Tamaño de cada archivo pequeño (KB)')
+@click.option('--large-mb', type=int, default=64, show_default=True, help='Tamaño del archivo grande (MB)')
+@click.option('--images', type=int, default=3, show_default=True, help='Imágenes en el paquete de flash-package')
+@click.option('--image-mb', type=int, default=16, show_default=True, help='Tamaño de cada imagen (MB)')
+@click.option('--label', default='', help='Etiqueta para el archivo de resultados')
+@click.option('--out-dir', type=click.Path(file_okay=False, path_type=Path), default=BENCH_DIR / 'results', show_default=True)
+@click.option('--compare', 'baseline', type=click.File('r', encoding='utf-8'), help='Resultados anteriores con los que comparar')
+def main(only, repeat, latency_ms, bandwidth_mbps, small_files, small_kb, large_mb, images, image_mb, label, out_dir, baseline):
+    """Ejecuta los benchmarks y guarda los resultados en JSON."""
+    sizes = {'small_files': small_files, 'small_kb': small_kb, 'large_mb': large_mb, 'images': images, 'image_mb': image_mb}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='redmi-bench-') as tmp, \
+            Bench(Path(tmp), repeat, latency_ms, bandwidth_mbps, sizes) as b:
+        for scenario in only or SCENARIOS:
+            click.echo(f'== {scenario}')
+            results[scenario] = globals()[f'bench_{scenario}'](b)
+            for name, stats in results[scenario].items():
+                if isinstance(stats, dict):
+                    extra = ''.join(f'  {k}={stats[k]:.1f}' for k in ('mb_s', 'files_s') if k in stats)
+                    click.echo(f'   {name:<14} mediana {stats["median"] * 1000:9.1f} ms  '
+                               f'(min {stats["min"] * 1000:.1f}, max {stats["max"] * 1000:.1f}){extra}')
+                else:
+                    click.echo(f'   {name}: {stats}')
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'), 'label': label, 'git': git_revision(),
+        'python': platform.python_version(), 'platform': platform.platform(),
+        'config': dict(sizes, repeat=repeat, latency_ms=latency_ms, bandwidth_mbps=bandwidth_mbps),
+        'results': results,
+    }
+    out_dir.mkdir(parents=True, exist_ok=True)
+    name = datetime.now().strftime('%Y%m%d-%H%M%S') + (f'-{label}' if label else '') + '.json'
+    (out_dir / name).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+    click.echo(f'Resultados guardados en {out_dir / name}')
+    if baseline:
+        click.echo(compare(report, json.load(baseline)))
+
+
+if __name__ == '__main__':
+    main()
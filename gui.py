@@ -6,11 +6,84 @@ Interfaz gráfica usando Tkinter (incluido con Python, sin costo).
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import tkinter.simpledialog as simpledialog
-import subprocess
-import sys
-from pathlib import Path
-import json
+import queue
 import threading
+import time
+
+import tool
+
+DEFAULT_DEVICE = '(predeterminado)'
+# Comandos que no hablan con ningún dispositivo: no llevan --serial ni esperan turno.
+NO_DEVICE_COMMANDS = {'check-tools', 'devices'}
+# Vista de salida: líneas retenidas (las más antiguas se descartan) y cadencia de refresco.
+MAX_LOG_LINES = 5000
+DRAIN_INTERVAL_MS = 50
+DRAIN_BUDGET_S = 0.02
+
+
+class JobEngine:
+    """Cola de trabajos de `tool.py` ejecutados en este proceso.
+
+    Hasta `max_workers` trabajos a la vez y como mucho uno por dispositivo: los
+    trabajos sobre el mismo dispositivo esperan su turno, los de dispositivos
+    distintos corren en paralelo.
+    """
+
+    def __init__(self, max_workers=4, on_output=None, on_update=None):
+        self.max_workers = max_workers
+        self.on_output = on_output
+        self.on_update = on_update
+        self.jobs = []
+        self._pending = []
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def submit(self, args, title=None, device=None):
+        job = tool.Job(args, title=title, device=device)
+        job.on_output = self.on_output
+        job.on_update = self.on_update
+        with self._lock:
+            self.jobs.append(job)
+            self._pending.append(job)
+        if self.on_update:
+            self.on_update(job)
+        self._schedule()
+        return job
+
+    def cancel(self, job):
+        with self._lock:
+            queued = job in self._pending
+            if queued:
+                self._pending.remove(job)
+        job.cancel()
+        if queued:
+            job.set_state('cancelado')
+
+    def _conflicts(self, job):
+        # `device=None` marca trabajos que no usan dispositivo (check-tools, devices).
+        return job.device is not None and any(r.device == job.device for r in self._running)
+
+    def _schedule(self):
+        started = []
+        with self._lock:
+            for job in list(self._pending):
+                if len(self._running) >= self.max_workers:
+                    break
+                if self._conflicts(job):
+                    continue
+                self._pending.remove(job)
+                self._running.add(job)
+                started.append(job)
+        for job in started:
+            threading.Thread(target=self._work, args=(job,), daemon=True).start()
+
+    def _work(self, job):
+        try:
+            tool.run_job(job)
+        finally:
+            with self._lock:
+                self._running.discard(job)
+            self._schedule()
 
 
 class RedmiGUI:
@@ -24,7 +97,17 @@ class RedmiGUI:
         style = ttk.Style()
         style.theme_use('clam')
         
+        self.engine = JobEngine(on_output=self.job_output, on_update=self.job_updated)
+        self.job_rows = {}
+        self.job_started = set()
+        # Última línea incompleta de cada trabajo (se prefija cuando llega el salto de línea).
+        self.job_partial = {}
+        # Los hilos de trabajo nunca tocan widgets: encolan eventos que el bucle de Tk
+        # vacía por lotes en `drain_events`.
+        self.events = queue.SimpleQueue()
         self.create_widgets()
+        self.refresh_devices()
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_events)
     
     def create_widgets(self):
         # Frame principal
@@ -38,6 +121,15 @@ class RedmiGUI:
         subtitle = ttk.Label(main_frame, text="Utilidad para dispositivos Android (ADB/Fastboot)")
         subtitle.pack(pady=5)
         
+        # Selector de dispositivo
+        dev_frame = ttk.Frame(main_frame)
+        dev_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(dev_frame, text="Dispositivo:").pack(side=tk.LEFT, padx=5)
+        self.device_var = tk.StringVar(value=DEFAULT_DEVICE)
+        self.device_box = ttk.Combobox(dev_frame, textvariable=self.device_var, state='readonly', width=30)
+        self.device_box.pack(side=tk.LEFT, padx=5)
+        ttk.Button(dev_frame, text="Actualizar", command=self.refresh_devices).pack(side=tk.LEFT, padx=5)
+        
         # Separador
         ttk.Separator(main_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
         
@@ -60,6 +152,18 @@ class RedmiGUI:
         # Tab 5: Flasheo
         self.create_flash_tab(notebook)
         
+        # Trabajos
+        ttk.Label(main_frame, text="Trabajos:").pack(anchor=tk.W)
+        self.jobs_view = ttk.Treeview(main_frame, columns=('device', 'state', 'progress'), height=4)
+        self.jobs_view.heading('#0', text='Comando')
+        self.jobs_view.heading('device', text='Dispositivo')
+        self.jobs_view.heading('state', text='Estado')
+        self.jobs_view.heading('progress', text='Progreso')
+        self.jobs_view.column('device', width=140)
+        self.jobs_view.column('state', width=100)
+        self.jobs_view.column('progress', width=100)
+        self.jobs_view.pack(fill=tk.X, pady=5)
+        
         # Output log
         ttk.Separator(main_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
         
@@ -71,6 +175,7 @@ class RedmiGUI:
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=tk.X, pady=10)
         ttk.Button(btn_frame, text="Limpiar log", command=self.clear_output).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancelar trabajo", command=self.cancel_job).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Salir", command=self.root.quit).pack(side=tk.RIGHT, padx=5)
     
     def create_info_tab(self, notebook):
@@ -114,29 +219,123 @@ class RedmiGUI:
         ttk.Button(frame, text="📦 Flash Paquete (JSON)", command=self.flash_package).pack(pady=5, fill=tk.X)
         ttk.Button(frame, text="🔓 Desbloquear Bootloader", command=self.unlock_bootloader).pack(pady=5, fill=tk.X)
     
-    def run_cmd(self, args, title="Salida"):
-        """Ejecuta comando en thread separado para no bloquear UI."""
+    def refresh_devices(self):
+        """Rellena el selector con los dispositivos adb y fastboot conectados."""
         def execute():
             try:
-                result = subprocess.run(
-                    [sys.executable, 'tool.py'] + args,
-                    capture_output=True,
-                    text=True,
-                    timeout=120,
-                    cwd=Path(__file__).parent
-                )
-                output = result.stdout + (result.stderr if result.stderr else "")
-                self.log_output(f"\n[{title}]\n{'='*60}\n{output}\n{'='*60}\n")
-            except Exception as e:
-                self.log_output(f"\n❌ ERROR: {e}\n")
-        
-        thread = threading.Thread(target=execute, daemon=True)
-        thread.start()
+                serials = tool.list_adb_devices() + tool.list_fastboot_devices()
+            except (Exception, SystemExit):
+                serials = []
+            self.events.put(('devices', [DEFAULT_DEVICE] + list(dict.fromkeys(serials))))
+        
+        threading.Thread(target=execute, daemon=True).start()
+    
+    def run_cmd(self, args, title="Salida"):
+        """Encola el comando en el motor de trabajos (se ejecuta en este proceso, sin bloquear UI)."""
+        device = None
+        if args[0] not in NO_DEVICE_COMMANDS:
+            selected = self.device_var.get()
+            device = selected if selected and selected != DEFAULT_DEVICE else DEFAULT_DEVICE
+            if device != DEFAULT_DEVICE:
+                args = ['--serial', device] + args
+        self.engine.submit(args, title=title, device=device)
+    
+    def job_updated(self, job):
+        # El estado se copia ahora: al vaciar la cola el trabajo puede haber terminado ya.
+        self.events.put(('job', (job, job.state)))
+    
+    def job_output(self, job, text):
+        self.events.put(('output', (job, text)))
+    
+    def drain_events(self):
+        """Vacía la cola de eventos en el hilo de Tk: un solo insert por lote de salida."""
+        chunks = []
+        jobs = {}
+        deadline = time.monotonic() + DRAIN_BUDGET_S
+        try:
+            while time.monotonic() < deadline:
+                kind, payload = self.events.get_nowait()
+                if kind == 'text':
+                    chunks.append(payload)
+                elif kind == 'output':
+                    chunks.append(self._prefixed(*payload))
+                elif kind == 'job':
+                    job, state = payload
+                    jobs[job] = None
+                    if state in ('ok', 'error', 'cancelado') and job in self.job_partial:
+                        chunks.append(self._prefixed(job, '\n'))
+                    chunks.append(self._job_banner(job, state))
+                elif kind == 'devices':
+                    self.device_box['values'] = payload
+        except queue.Empty:
+            pass
+        for job in jobs:
+            self._show_job(job)
+        text = ''.join(chunks)
+        if text:
+            self._append_output(text)
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_events)
+    
+    def _prefixed(self, job, text):
+        """Antepone `[dispositivo]` (o el título si no hay) a cada línea completa del trabajo.
+
+        Con trabajos en paralelo sobre varios dispositivos su salida se intercala
+        en la misma vista; el prefijo permite distinguirla.
+        """
+        label = job.device if job.device not in (None, DEFAULT_DEVICE) else job.title
+        lines = (self.job_partial.pop(job, '') + text).split('\n')
+        rest = lines.pop()
+        if rest:
+            self.job_partial[job] = rest
+        return ''.join(f'[{label}] {line}\n' for line in lines)
+    
+    def _job_banner(self, job, state):
+        """Cabecera/pie del trabajo según el estado que tenía al encolar el evento."""
+        if state == 'ejecutando' and job not in self.job_started:
+            self.job_started.add(job)
+            return f"\n[{job.title}]\n{'='*60}\n"
+        if state in ('ok', 'error', 'cancelado') and job in self.job_started:
+            self.job_started.discard(job)
+            return f"{'='*60}\n[{job.title}: {state}]\n"
+        return ''
+    
+    def _show_job(self, job):
+        """Refleja estado y progreso del trabajo en la lista."""
+        iid = self.job_rows.get(job)
+        progress = ''
+        if job.progress:
+            done, total = job.progress
+            progress = f'{done}/{total}'
+        values = (job.device or '-', job.state, progress)
+        if iid is None:
+            iid = self.jobs_view.insert('', tk.END, text=job.title, values=values)
+            self.job_rows[job] = iid
+            self.jobs_view.see(iid)
+        else:
+            self.jobs_view.item(iid, values=values)
+    
+    def cancel_job(self):
+        """Cancela los trabajos seleccionados en la lista."""
+        rows = {iid: job for job, iid in self.job_rows.items()}
+        for iid in self.jobs_view.selection():
+            job = rows.get(iid)
+            if job is not None and job.state in ('en cola', 'ejecutando'):
+                self.engine.cancel(job)
     
     def log_output(self, text):
-        """Añade texto al output log."""
+        """Añade texto al output log (seguro desde cualquier hilo)."""
+        self.events.put(('text', text))
+    
+    def _append_output(self, text):
+        """Inserta un lote de salida y recorta la vista a las últimas `MAX_LOG_LINES` líneas."""
+        lines = text.count('\n')
+        if lines > MAX_LOG_LINES:
+            text = '\n'.join(text.split('\n')[-MAX_LOG_LINES - 1:])
         self.output.config(state=tk.NORMAL)
         self.output.insert(tk.END, text)
+        excess = int(self.output.index('end-1c').split('.')[0]) - MAX_LOG_LINES
+        if excess > 0:
+            self.output.delete('1.0', f'{excess + 1}.0')
         self.output.see(tk.END)
         self.output.config(state=tk.DISABLED)
     
@@ -0,0 +1,63 @@
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import fakedevice  # noqa: E402
+import tool  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _cli_context():
+    """`cli` fija el tracer, la flota y el serial en el contexto actual: se restauran tras cada test."""
+    saved = [(var, var.get()) for var in (tool._tracer_var, tool._fleet_var, tool._serial_var)]
+    yield
+    for var, value in saved:
+        var.set(value)
+
+
+@pytest.fixture
+def fake_adb(tmp_path, monkeypatch):
+    """Servidor adb falso (benchmarks/fakedevice.py) en un puerto libre; `/sdcard` es `server.root`."""
+    root = tmp_path / 'device'
+    root.mkdir()
+    cfg = {'root': str(root), 'serials': ['FAKE0001'], 'latency': 0, 'bandwidth': 0}
+    server = fakedevice.FakeAdbServer(0, cfg)
+    server.root = root
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(tool, 'ADB_SERVER_PORT', server.server_address[1])
+    monkeypatch.setattr(tool, '_native', {'client': None, 'probed': False})
+    monkeypatch.setitem(tool.TRANSPORT, 'mode', 'native')
+    yield server
+    client = tool._native['client']
+    if client is not None:
+        client.close()
+    server.drop_connections()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(fake_adb):
+    c = tool.AdbClient(port=fake_adb.server_address[1])
+    yield c
+    c.close()
+
+
+@pytest.fixture
+def fake_tracker(monkeypatch):
+    """`DeviceTracker` sin hilos: el test le da los estados con `_update(fuente, {serial: estado})`."""
+    tracker = tool.DeviceTracker()
+
+    @contextmanager
+    def shared():
+        yield tracker
+
+    monkeypatch.setattr(tool, 'device_tracker', shared)
+    return tracker
@@ -0,0 +1,83 @@
+import os
+import threading
+import zipfile
+
+from click.testing import CliRunner
+
+import tool
+
+
+def test_is_excluded():
+    assert tool.is_excluded('DCIM/Camera/a.jpg', ['DCIM'])
+    assert tool.is_excluded('x/.thumbnails/1.jpg', ['.thumbnails'])
+    assert tool.is_excluded('WhatsApp/Media/a', ['WhatsApp/Media/'])
+    assert not tool.is_excluded('WhatsApp/Databases/a', ['WhatsApp/Media'])
+    assert not tool.is_excluded('MyDCIM/a', ['DCIM'])
+    assert not tool.is_excluded('a/b', ['', '/'])
+
+
+def test_plan_backup(tmp_path):
+    (tmp_path / 'same').write_text('x')
+    remote = {'same': (1, 10), 'changed': (2, 20), 'new': (3, 30)}
+    manifest = {'same': (1, 10), 'changed': (2, 19), 'gone': (4, 40), 'DCIM/old': (1, 1)}
+    changed, deleted = tool.plan_backup(remote, manifest, tmp_path, exclude=['DCIM'])
+    assert changed == ['changed', 'new']
+    assert deleted == ['gone']
+    changed, deleted = tool.plan_backup(remote, manifest, tmp_path, exclude=['DCIM'], full=True)
+    assert changed == ['changed', 'new', 'same']
+    assert deleted == ['gone']
+
+
+def _backup(dst, *extra):
+    result = CliRunner().invoke(tool.cli, ['backup', str(dst), '--exclude', 'none', *extra])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_incremental_backup_and_full_deletes(fake_adb, tmp_path):
+    (fake_adb.root / 'a').mkdir()
+    (fake_adb.root / 'a' / 'keep').write_text('1')
+    (fake_adb.root / 'a' / 'gone').write_text('2')
+    dst = tmp_path / 'bk'
+    _backup(dst)
+    local = dst / 'sdcard' / 'a'
+    assert (local / 'gone').read_text() == '2'
+    assert '0 nuevos/modificados' in _backup(dst)
+    (fake_adb.root / 'a' / 'gone').unlink()
+    _backup(dst, '--full')
+    assert not (local / 'gone').exists()
+    assert (local / 'keep').read_text() == '1'
+
+
+def test_stream_backup_to_zip(fake_adb, tmp_path):
+    (fake_adb.root / 'd').mkdir()
+    (fake_adb.root / 'd' / 'f.txt').write_bytes(b'contenido')
+    dst = tmp_path / 'bk'
+    _backup(dst, '--stream', '--compress')
+    with zipfile.ZipFile(f'{dst}.zip') as zf:
+        assert zf.read('sdcard/d/f.txt') == b'contenido'
+    assert (dst / 'sdcard' / 'd' / 'f.txt').read_bytes() == b'contenido'
+
+
+def _close_in_thread(writer, **kwargs):
+    thread = threading.Thread(target=writer.close, kwargs=kwargs, daemon=True)
+    thread.start()
+    thread.join(5)
+    return not thread.is_alive()
+
+
+def test_archive_writer_close_with_open_entry(tmp_path):
+    writer = tool.ArchiveWriter(str(tmp_path / 'x'))
+    writer.begin_file('x', 0)
+    writer.write(b'abc')
+    assert _close_in_thread(writer)
+    with zipfile.ZipFile(writer.path) as zf:
+        assert zf.namelist() == ['x']
+
+
+def test_archive_writer_error_does_not_hang(tmp_path):
+    writer = tool.ArchiveWriter(str(tmp_path / 'y'))
+    writer.write(b'datos sin begin_file')  # el hilo falla
+    assert _close_in_thread(writer, abort=True)
+    assert writer._error is not None
+    assert os.path.exists(writer.path)
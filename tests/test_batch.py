@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+import tool
+
+SCRIPT = """# comentario
+info
+
+no-such-command
+'sin cerrar
+info
+"""
+
+
+def _records(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+
+@pytest.mark.parametrize('on_error, steps', [('stop', 2), ('continue', 4)])
+def test_batch_records_and_on_error(fake_adb, tmp_path, on_error, steps):
+    script = tmp_path / 'pasos.txt'
+    script.write_text(SCRIPT, encoding='utf-8')
+    result = CliRunner().invoke(tool.cli, ['batch', str(script), '--on-error', on_error])
+    assert result.exit_code == 2
+    records = _records(result.output)
+    assert [r['step'] for r in records] == list(range(1, steps + 1))
+    first = records[0]
+    assert set(first) == {'step', 'line', 'args', 'exit_code', 'ok', 'elapsed', 'output'}
+    assert (first['line'], first['args'], first['exit_code'], first['ok']) == (2, ['info'], 0, True)
+    assert 'ro.serialno: FAKE0001' in first['output']
+    assert (records[1]['line'], records[1]['exit_code'], records[1]['ok']) == (4, 2, False)
+    if on_error == 'continue':
+        assert records[2]['args'] is None and 'mal formada' in records[2]['output']
+        assert records[3]['ok']
+
+
+def test_session_reads_stdin(fake_adb):
+    result = CliRunner().invoke(tool.cli, ['session'], input='info\nsession\n')
+    assert result.exit_code == 2
+    records = _records(result.output)
+    assert records[0]['ok']
+    assert records[1]['exit_code'] == 2 and 'no se puede anidar' in records[1]['output']
+
+
+def test_which_ok_caches_only_found_tools(tmp_path, monkeypatch):
+    monkeypatch.setattr(tool, '_found_tools', set())
+    monkeypatch.setenv('PATH', str(tmp_path))
+    assert not tool.which_ok('fake-tool')
+    exe = tmp_path / 'fake-tool'
+    exe.write_text('#!/bin/sh\n')
+    exe.chmod(0o755)
+    assert tool.which_ok('fake-tool')
+    exe.unlink()
+    assert tool.which_ok('fake-tool')
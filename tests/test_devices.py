@@ -0,0 +1,81 @@
+import threading
+import time
+
+from click.testing import CliRunner
+
+import tool
+
+
+def _later(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.start()
+    return timer
+
+
+def test_wait_for_follows_events(fake_tracker):
+    fake_tracker._update('adb', {'S1': 'device'})
+    fake_tracker._update('fastboot', {})
+    assert fake_tracker.wait_for('S1', {'device'}, 1) == ('S1', 'device')
+    _later(0.05, fake_tracker._update, 'adb', {})
+    _later(0.1, fake_tracker._update, 'fastboot', {'S1': 'fastboot'})
+    start = time.monotonic()
+    assert fake_tracker.wait_for('S1', {'bootloader'}, 5) == ('S1', 'fastboot')
+    assert time.monotonic() - start < 2  # despierta con el evento, no al vencer
+
+
+def test_wait_for_waits_for_every_source(fake_tracker):
+    fake_tracker._update('adb', {})
+    # Sin la primera lista de fastboot aún no se sabe si S1 está desconectado.
+    assert fake_tracker.wait_for('S1', {'disconnected'}, 0.2) is None
+    fake_tracker._update('fastboot', {})
+    assert fake_tracker.wait_for('S1', {'disconnected'}, 0.2) == ('S1', 'disconnected')
+
+
+def test_wait_for_any_device_and_timeout(fake_tracker):
+    fake_tracker._update('adb', {'B': 'unauthorized'})
+    fake_tracker._update('fastboot', {})
+    assert fake_tracker.wait_for(None, {'device'}, 0.2) is None
+    _later(0.05, fake_tracker._update, 'adb', {'A': 'device', 'B': 'unauthorized'})
+    assert fake_tracker.wait_for(None, {'device'}, 5) == ('A', 'device')
+
+
+def test_tracker_polls_both_sources(monkeypatch):
+    adb = [{'S1': 'device'}, {}]
+    fastboot = [[], [], ['S1']]
+    monkeypatch.setattr(tool, 'adb_ok', lambda: True)
+    monkeypatch.setattr(tool, 'which_ok', lambda name: True)
+    monkeypatch.setattr(tool, 'native_client', lambda: None)
+    monkeypatch.setattr(tool, 'adb_device_states', lambda: adb.pop(0) if len(adb) > 1 else adb[0])
+    monkeypatch.setattr(tool, 'list_fastboot_devices', lambda: fastboot.pop(0) if len(fastboot) > 1 else fastboot[0])
+    with tool.DeviceTracker() as tracker:
+        assert tracker.wait_for('S1', {'fastboot'}, 5) == ('S1', 'fastboot')
+        assert tracker.serials() == {'S1'}
+
+
+def test_device_tracker_is_shared(monkeypatch):
+    started = []
+
+    class Tracker(tool.DeviceTracker):
+        def __enter__(self):
+            started.append(self)
+            return self
+
+    monkeypatch.setattr(tool, 'DeviceTracker', Tracker)
+    with tool.device_tracker() as first, tool.device_tracker() as second:
+        assert first is second
+    with tool.device_tracker():
+        pass
+    assert len(started) == 2
+    assert started[0]._stop.is_set() and started[1]._stop.is_set()
+
+
+def test_wait_for_command(fake_tracker):
+    fake_tracker._update('adb', {})
+    fake_tracker._update('fastboot', {})
+    _later(0.05, fake_tracker._update, 'adb', {'S1': 'recovery'})
+    result = CliRunner().invoke(tool.cli, ['--serial', 'S1', 'wait-for', 'recovery', '--timeout', '5'])
+    assert result.exit_code == 0, result.output
+    assert 'S1: recovery' in result.output
+    result = CliRunner().invoke(tool.cli, ['--serial', 'S1', 'wait-for', 'device', '--timeout', '0.2'])
+    assert result.exit_code == 1
+    assert 'Tiempo agotado' in result.output
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+import tool
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def partition(fake_adb, tmp_path, monkeypatch):
+    """Una 'partición' que es un archivo local: el servidor falso ejecuta `dd` en el host."""
+    path = tmp_path / 'part.img'
+    path.write_bytes(os.urandom(MB) + bytes(MB) + os.urandom(MB + 12345))
+    monkeypatch.setattr(tool, 'partition_size', lambda device, su=False: os.path.getsize(device))
+    return path
+
+
+def _dump(partition, out, *extra):
+    result = CliRunner().invoke(tool.cli, ['dump-partition', str(partition), str(out), '--chunk-size', '1', *extra])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_dump_partition(partition, tmp_path):
+    out = tmp_path / 'out.img'
+    _dump(partition, out)
+    assert out.read_bytes() == partition.read_bytes()
+    journal = tool.DumpJournal(f'{out}.journal').load()
+    assert [c['i'] for c in journal.chunks] == [0, 1, 2, 3]
+    assert journal.chunks[1].get('zero')
+    assert 'ya está completo' in _dump(partition, out)
+
+
+def test_dump_resumes_from_last_valid_chunk(partition, tmp_path):
+    out = tmp_path / 'out.img'
+    _dump(partition, out)
+    journal_path = tmp_path / 'out.img.journal'
+    lines = journal_path.read_text().splitlines()
+    # Corte a mitad del bloque 3: sin total, línea final incompleta.
+    journal_path.write_text('\n'.join(lines[:3]) + '\n' + lines[3][:10])
+    with open(out, 'r+b') as f:  # y el bloque 1 (de ceros) ya no lo es
+        f.seek(MB + 100)
+        f.write(b'x')
+    output = _dump(partition, out)
+    assert 'Reanudando: 1/2 bloques' in output
+    assert out.read_bytes() == partition.read_bytes()
+    assert tool.DumpJournal(journal_path).load().digest
+
+
+def test_dump_compressed_resume(partition, tmp_path):
+    out = tmp_path / 'out.img.gz'
+    _dump(partition, out, '--compress')
+    journal_path = tmp_path / 'out.img.gz.journal'
+    entries = [json.loads(line) for line in journal_path.read_text().splitlines()]
+    with open(out, 'r+b') as f:  # se pierde la cola del último bloque
+        f.truncate(entries[-2]['offset'] + 10)
+    journal_path.write_text(''.join(json.dumps(e) + '\n' for e in entries[:-1]))
+    assert 'Reanudando: 3/4 bloques' in _dump(partition, out, '--compress')
+    with gzip.open(out) as f:
+        assert f.read() == partition.read_bytes()
+
+
+def test_dump_rejects_other_dump(partition, tmp_path):
+    out = tmp_path / 'out.img'
+    _dump(partition, out)
+    result = CliRunner().invoke(tool.cli, ['dump-partition', str(partition), str(out), '--chunk-size', '2'])
+    assert result.exit_code != 0
+    assert 'es de otro volcado' in result.output
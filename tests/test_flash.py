@@ -0,0 +1,120 @@
+import os
+import struct
+import zipfile
+
+import pytest
+
+import tool
+
+B = tool.SPARSE_BLOCK
+
+
+def _image(path):
+    data = (os.urandom(B * 3) + bytes(B * 50) + b'\xab\xcd\xef\x01' * (B // 4 * 7)
+            + os.urandom(B * 20) + bytes(B * 10) + os.urandom(1234))
+    path.write_bytes(data)
+    return data
+
+
+def _apply(pieces, total_blocks, base):
+    """Aplica las piezas sparse sobre `base`, como haría el bootloader."""
+    out = bytearray(base)
+    for piece in pieces:
+        with open(piece, 'rb') as f:
+            header = tool.SPARSE_HEADER.unpack(f.read(tool.SPARSE_HEADER.size))
+            assert header[0] == tool.SPARSE_MAGIC and header[6] == total_blocks
+            block = 0
+            for _ in range(header[7]):
+                kind, _, count, size = tool.CHUNK_HEADER.unpack(f.read(tool.CHUNK_HEADER.size))
+                if kind == tool.CHUNK_RAW:
+                    out[block * B:(block + count) * B] = f.read(count * B)
+                elif kind == tool.CHUNK_FILL:
+                    out[block * B:(block + count) * B] = f.read(4) * (count * B // 4)
+                else:
+                    assert size == tool.CHUNK_HEADER.size
+                block += count
+            assert block == total_blocks and f.read() == b''
+    return bytes(out)
+
+
+def test_scan_blocks(tmp_path):
+    _image(tmp_path / 'img')
+    runs = tool.scan_blocks(tmp_path / 'img')
+    assert runs[:4] == [[tool.CHUNK_RAW, 0, 3, 0], [tool.CHUNK_FILL, 3, 50, 0],
+                        [tool.CHUNK_FILL, 53, 7, struct.unpack('<I', b'\xab\xcd\xef\x01')[0]],
+                        [tool.CHUNK_RAW, 60, 20, 0]]
+    assert runs[-1] == [tool.CHUNK_RAW, 90, 1, 0]  # bloque final incompleto
+
+
+@pytest.mark.parametrize('zeros', ['fill', 'dont-care'])
+@pytest.mark.parametrize('limit', [10 ** 9, 40 * 1024, 8 * 1024])
+def test_sparse_pieces_rebuild_image(tmp_path, zeros, limit):
+    data = _image(tmp_path / 'img')
+    total = -(-len(data) // B)
+    pieces = tool.plan_sparse(tool.scan_blocks(tmp_path / 'img'), total, limit, zeros)
+    paths = []
+    for i, piece in enumerate(pieces):
+        path = tmp_path / f'p{i}'
+        tool.write_sparse_piece(tmp_path / 'img', piece, total, path)
+        assert os.path.getsize(path) == piece['size'] <= limit
+        paths.append(path)
+    base = b'\x55' * (total * B)
+    rebuilt = _apply(paths, total, base)
+    expected = data + bytes(total * B - len(data))
+    for i in range(total):
+        got, want = rebuilt[i * B:(i + 1) * B], expected[i * B:(i + 1) * B]
+        if zeros == 'dont-care' and want == bytes(B):
+            assert got == base[:B]
+        else:
+            assert got == want
+
+
+def test_plan_sparse_limit_too_small():
+    with pytest.raises(Exception, match='max-download-size'):
+        tool.plan_sparse([[tool.CHUNK_RAW, 0, 1, 0]], 1, 100)
+
+
+def test_image_source_zip_member(tmp_path):
+    archive = tmp_path / 'rom.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('images/boot.img', b'boot' * 100, compress_type=zipfile.ZIP_STORED)
+        zf.writestr('images/vbmeta.img', b'vb' * 100, compress_type=zipfile.ZIP_DEFLATED)
+    stored = tool.ImageSource(f'{archive}!images/boot.img')
+    assert stored.exists() and stored.stored and stored.size == 400
+    assert stored._hash_member() == tool.sha256_file(_extract(stored, tmp_path / 'b'))
+    deflated = tool.ImageSource(f'{archive}!images/vbmeta.img')
+    assert not deflated.stored
+    assert _extract(deflated, tmp_path / 'v').read_bytes() == b'vb' * 100
+    assert not tool.ImageSource(f'{archive}!images/nope.img').exists()
+    assert [a['partition'] for a in tool.actions_from_zip(str(archive))] == ['boot', 'vbmeta']
+
+
+def _extract(source, dest):
+    source._extract_to(dest)
+    return dest
+
+
+def test_scratch_cache_evicts_unpinned_lru(tmp_path):
+    cache = tool.ScratchCache(tmp_path / 'scratch', max_bytes=250)
+    writes = []
+
+    def writer(n):
+        def write(path):
+            writes.append(n)
+            path.write_bytes(b'x' * n)
+        return write
+
+    with cache.materialize('a', 100, writer(100)) as held:
+        for key in 'bc':
+            with cache.materialize(key, 100, writer(100)):
+                pass
+        assert os.path.exists(held)  # en uso: no se desaloja
+    with cache.materialize('c', 100, writer(100)):
+        pass
+    assert len(writes) == 3  # `c` seguía en caché
+    assert sum(e['size'] for e in _index(cache).values()) <= 250
+
+
+def _index(cache):
+    with cache._index() as index:
+        return dict(index)
@@ -0,0 +1,40 @@
+import re
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+import tool
+
+
+def test_run_fleet_exit_code_is_worst_failure(capsys):
+    seen = []
+
+    def step(code):
+        serial = tool.current_serial()
+        seen.append(serial)
+        if serial == 'B':
+            sys.exit(code)
+        if serial == 'C':
+            raise RuntimeError('sin conexión')
+
+    with pytest.raises(SystemExit) as excinfo:
+        tool.run_fleet(step, ['A', 'B', 'C'], (3,), {})
+    assert excinfo.value.code == 3
+    assert sorted(seen) == ['A', 'B', 'C']
+    out = capsys.readouterr().out
+    assert '[C] Error: sin conexión' in out
+    assert '1/3 dispositivos OK' in out
+
+
+def test_run_fleet_all_ok(capsys):
+    tool.run_fleet(lambda: None, ['A', 'B'], (), {})
+    assert '2/2 dispositivos OK' in capsys.readouterr().out
+
+
+def test_fleet_command_one_device_fails(fake_adb):
+    result = CliRunner().invoke(tool.cli, ['--serial', 'FAKE0001', '--serial', 'NOPE', 'info'])
+    assert result.exit_code == 1
+    assert '[FAKE0001] ro.serialno: FAKE0001' in result.output
+    assert re.search(r'^NOPE +FALLO', result.output, re.M)
+    assert '1/2 dispositivos OK' in result.output
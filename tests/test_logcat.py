@@ -0,0 +1,77 @@
+import io
+import random
+import re
+import struct
+
+import tool
+
+
+def test_parse_threadtime():
+    line = '03-14 15:09:26.535  1234  5678 W ActivityManager: Slow operation: took 20ms'
+    assert tool.parse_threadtime(line) == ('03-14 15:09:26.535', 1234, 5678, 'W', 'ActivityManager',
+                                           'Slow operation: took 20ms')
+    assert tool.parse_threadtime('--------- beginning of main') is None
+
+
+def _capture(path, n=5000):
+    rng = random.Random(7)
+    tags, lines = ['A', 'Bb', 'chatty', 'Tag With Spaces'], []
+    for i in range(n):
+        sec = i // 10
+        ts = f'01-02 03:{sec // 60 % 60:02d}:{sec % 60:02d}.{i % 1000:03d}'
+        prio, tag = rng.choice('VDIWEF'), rng.choice(tags)
+        lines.append(f'{ts} {rng.choice([1, 20, 300]):5d} {i:5d} {prio} {tag}: mensaje {i} ñ')
+        if i % 997 == 0:
+            lines.append('--------- beginning of crash')
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return lines
+
+
+def _naive(lines, tags=(), pids=(), priority='V', since=None, until=None, pattern=None):
+    out = []
+    for line in lines:
+        entry = tool.parse_threadtime(line)
+        if entry is None:
+            continue
+        ts, pid, _, prio, tag, _ = entry
+        t = tool._log_time_ms(ts, 2024, {})
+        if (tags and tag not in tags) or (pids and pid not in pids) or \
+                tool.LOG_PRIORITIES.index(prio) < tool.LOG_PRIORITIES.index(priority) or \
+                (since is not None and t < since) or (until is not None and t > until) or \
+                (pattern and not re.search(pattern, line)):
+            continue
+        out.append(line)
+    return out
+
+
+def test_log_index_query_matches_scan(tmp_path):
+    capture = tmp_path / 'cap.txt'
+    lines = _capture(capture)
+    meta = tool.build_log_index(capture, tmp_path / 'idx', 2024)
+    assert meta['count'] == 5000
+    since, until = tool.parse_log_time('01-02 03:02:00', 2024), tool.parse_log_time('01-02 03:05:30.500', 2024)
+    queries = [{}, {'tags': ['chatty']}, {'tags': ['Tag With Spaces', 'A'], 'pids': [20]},
+               {'pids': [300], 'priority': 'W'}, {'since': since, 'until': until},
+               {'tags': ['Bb'], 'since': since}, {'pattern': r'mensaje 4\d\d ', 'priority': 'E'},
+               {'tags': ['nope']}]
+    index = tool.LogIndex(tmp_path / 'idx')
+    try:
+        for query in queries:
+            assert list(index.query(**query)) == _naive(lines, **query), query
+    finally:
+        index.close()
+
+
+def _binary_entry(lid, payload, pid=10, tid=11, sec=1700000000, nsec=5000000):
+    # logger_entry v4: len, hdr_size, pid, tid, sec, nsec, lid, uid
+    return struct.pack('<HHiIIIII', len(payload), 28, pid, tid, sec, nsec, lid, 1000) + payload
+
+
+def test_iter_logcat_binary_log_ids():
+    stream = io.BytesIO(_binary_entry(7, b'\x06kernel\0oops\nline 2\0') +
+                        _binary_entry(5, b'\x01\x02\x03\x04') +
+                        _binary_entry(0, b'\x04Main\0hola\0'))
+    items = [item for _, item in tool.iter_logcat_binary(stream)]
+    assert [item[3:] for item in items] == [('E', 'kernel', 'oops'), ('E', 'kernel', 'line 2'),
+                                            ('I', 'log5', '<4 bytes binarios>'), ('I', 'Main', 'hola')]
+    assert items[0][1:3] == (10, 11)
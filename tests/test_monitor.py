@@ -0,0 +1,51 @@
+import tool
+
+SAMPLE = """S 100.50 300.00
+C cpu  100 0 100 700 100 0 0 0 0 0
+M MemTotal: 4096000
+M MemAvailable: 1024000
+T 45000
+T 38500
+T -1
+B capacity 80
+B temp 315
+B current_now -250000
+B voltage_now 3900000
+E
+"""
+
+
+def _feed(parser, text):
+    rows = [parser.feed(line) for line in text.splitlines()]
+    assert rows[:-1] == [None] * (len(rows) - 1)
+    return rows[-1]
+
+
+def test_monitor_parser_rows():
+    parser = tool.MonitorParser()
+    first = _feed(parser, SAMPLE)
+    assert set(first) == set(tool.MONITOR_COLUMNS)
+    assert first['uptime_s'] == 100.5
+    assert first['cpu_pct'] is None  # sin muestra anterior
+    assert first['mem_used_mb'] == 3000.0 and first['mem_avail_mb'] == 1000.0
+    assert first['temp_max_c'] == 45.0
+    assert first['battery_pct'] == 80 and first['battery_temp_c'] == 31.5
+    assert first['battery_ma'] == -250.0 and first['battery_mv'] == 3900.0
+    second = _feed(parser, SAMPLE.replace('cpu  100 0 100 700 100', 'cpu  250 0 150 850 100'))
+    assert second['cpu_pct'] == 57.1  # 200 ocupados de 350 jiffies
+
+
+def test_monitor_parser_missing_sources():
+    parser = tool.MonitorParser()
+    row = _feed(parser, 'S 1.0 2.0\nT 42\nE\n')
+    assert row['temp_max_c'] == 42.0  # zonas que ya informan en ºC
+    assert row['mem_used_mb'] is None and row['battery_pct'] is None
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert tool.percentile(values, 50) == 50
+    assert tool.percentile(values, 95) == 95
+    assert tool.percentile(values, 100) == 100
+    assert tool.percentile([7], 99) == 7
+    assert tool.percentile([], 50) is None
@@ -0,0 +1,82 @@
+import threading
+
+from click.testing import CliRunner
+
+import tool
+
+
+def test_parse_getprop():
+    text = '[ro.product.model]: [Redmi A2 Lite]\r\n[ro.build.version.sdk]: [31]\n[multi]: [a\nb]\n'
+    props = tool.parse_getprop(text)
+    assert props['ro.product.model'] == 'Redmi A2 Lite'
+    assert props['ro.build.version.sdk'] == '31'
+    assert props['multi'] == 'a\nb'
+
+
+class FakeDevice:
+    """Sustituye a `tool.run`: cuenta los `getprop` y cambia de build con cada reinicio."""
+
+    def __init__(self):
+        self.getprops = 0
+        self.build = 1
+
+    def __call__(self, cmd, capture=False, **kwargs):
+        if cmd[-1] == 'getprop':
+            self.getprops += 1
+            return f'[ro.build.id]: [B{self.build}]\n'
+        if 'reboot' in cmd:
+            self.build += 1
+        return '' if capture else None
+
+
+def _setup(monkeypatch, ttl=30):
+    device = FakeDevice()
+    monkeypatch.setattr(tool, 'run', device)
+    monkeypatch.setattr(tool, 'PROPS_TTL', ttl)
+    monkeypatch.setattr(tool, '_props_cache', {})
+    return device
+
+
+def test_props_cached_until_ttl(monkeypatch):
+    device = _setup(monkeypatch)
+    assert tool.device_props()['ro.build.id'] == 'B1'
+    tool.device_props()
+    assert device.getprops == 1
+    tool.device_props(refresh=True)
+    assert device.getprops == 2
+    monkeypatch.setattr(tool, 'PROPS_TTL', 0)
+    tool.device_props()
+    assert device.getprops == 3
+
+
+def test_props_cached_per_serial(monkeypatch):
+    device = _setup(monkeypatch)
+    tool.device_props('A')
+    tool.device_props('B')
+    tool.device_props('A')
+    assert device.getprops == 2
+
+
+def test_reboot_command_invalidates_props(monkeypatch):
+    _setup(monkeypatch)
+    monkeypatch.setattr(tool, 'adb_ok', lambda: True)
+    tool.device_props()
+    result = CliRunner().invoke(tool.cli, ['--transport', 'subprocess', 'reboot', 'device'])
+    assert result.exit_code == 0, result.output
+    assert tool.device_props()['ro.build.id'] == 'B2'
+
+
+def test_reboot_and_wait_invalidates_props(monkeypatch, fake_tracker):
+    device = _setup(monkeypatch)
+    fake_tracker._update('fastboot', {})
+    fake_tracker._update('adb', {'S1': 'device'})
+
+    def issue():
+        tool.run(['adb', 'reboot'])
+        fake_tracker._update('adb', {})
+        threading.Timer(0.1, fake_tracker._update, ('adb', {'S1': 'device'})).start()
+
+    tool.device_props()
+    tool.reboot_and_wait(issue, 'device', timeout=5)
+    assert tool.device_props()['ro.build.id'] == 'B2'
+    assert device.getprops == 2
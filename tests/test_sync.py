@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from click.testing import CliRunner
+
+import tool
+
+
+def test_plan_sync_by_size_and_mtime(tmp_path):
+    source = {'same': (1, 10), 'newer': (1, 11), 'bigger': (2, 10), 'new': (3, 10)}
+    target = {'same': (1, 10), 'newer': (1, 10), 'bigger': (1, 10), 'extra': (5, 5)}
+    copy, same, extraneous = tool.plan_sync(source, target, tmp_path, '/sdcard/x')
+    assert copy == ['bigger', 'new', 'newer']
+    assert same == ['same']
+    assert extraneous == ['extra']
+
+
+def test_plan_sync_checksum(tmp_path, monkeypatch):
+    for name in ('a', 'b'):
+        (tmp_path / name).write_bytes(name.encode())
+    remote = {'a': tool.sha256_file(tmp_path / 'a'), 'b': '0' * 64}
+    monkeypatch.setattr(tool, 'remote_sha256', lambda root, rels: {rel: remote[rel] for rel in rels})
+    monkeypatch.setattr(tool, 'CACHE_DIR', tmp_path / 'cache')
+    source = {'a': (1, 1), 'b': (1, 1), 'c': (1, 1)}
+    target = {'a': (1, 99), 'b': (1, 1), 'c': (2, 1)}
+    copy, same, _ = tool.plan_sync(source, target, tmp_path, '/sdcard/x', checksum=True)
+    assert copy == ['b', 'c'] and same == ['a']
+    assert not (tmp_path / 'cache').exists()
+
+
+def _sync(*args):
+    result = CliRunner().invoke(tool.cli, ['sync', *map(str, args)])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+@pytest.fixture
+def tree(tmp_path):
+    local = tmp_path / 'local'
+    (local / 'sub').mkdir(parents=True)
+    (local / 'a.txt').write_text('a')
+    (local / 'sub' / 'b.txt').write_text('bb')
+    return local
+
+
+def test_sync_push_only_changes_and_delete(fake_adb, tree):
+    assert '2 a copiar, 0 sin cambios' in _sync('push', tree, '/sdcard/dst')
+    device = fake_adb.root / 'dst'
+    assert (device / 'sub' / 'b.txt').read_text() == 'bb'
+    assert '0 a copiar, 2 sin cambios' in _sync('push', tree, '/sdcard/dst')
+    (tree / 'a.txt').write_text('aaa')
+    (tree / 'sub' / 'b.txt').unlink()
+    out = _sync('push', tree, '/sdcard/dst')
+    assert '1 a copiar, 0 sin cambios, 1 sobrantes' in out
+    assert (device / 'sub' / 'b.txt').exists()
+    assert '0 a copiar, 1 sin cambios, 1 a borrar' in _sync('push', tree, '/sdcard/dst', '--delete')
+    assert (device / 'a.txt').read_text() == 'aaa'
+    assert not (device / 'sub' / 'b.txt').exists()
+
+
+def test_sync_pull_delete(fake_adb, tree, tmp_path):
+    device = fake_adb.root / 'src'
+    (device / 'd').mkdir(parents=True)
+    (device / 'd' / 'x').write_text('x')
+    (device / 'y').write_text('y')
+    out_dir = tmp_path / 'out'
+    assert '2 a copiar' in _sync('pull', '/sdcard/src', out_dir)
+    assert (out_dir / 'd' / 'x').read_text() == 'x'
+    (device / 'd' / 'x').unlink()
+    _sync('pull', '/sdcard/src', out_dir, '--dry-run', '--delete')
+    assert (out_dir / 'd' / 'x').exists()
+    _sync('pull', '/sdcard/src', out_dir, '--delete')
+    assert not (out_dir / 'd').exists()
+    assert (out_dir / 'y').read_text() == 'y'
+    assert os.listdir(out_dir) == ['y']
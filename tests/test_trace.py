@@ -0,0 +1,56 @@
+import contextvars
+import json
+
+import pytest
+from click.testing import CliRunner
+
+import tool
+
+FIELDS = {'kind', 'op', 'name', 'serial', 'start', 'end', 'duration', 'bytes', 'mb_s', 'result'}
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_trace_records_backup(fake_adb, tmp_path):
+    (fake_adb.root / 'a.bin').write_bytes(b'x' * 100000)
+    trace = tmp_path / 'trace.jsonl'
+    result = CliRunner().invoke(tool.cli, ['--trace', str(trace), '--serial', 'FAKE0001',
+                                           'backup', str(tmp_path / 'bk'), '--exclude', 'none'])
+    assert result.exit_code == 0, result.output
+    assert 'Resumen de operaciones:' in result.output
+    records = _read(trace)
+    assert all(set(r) == FIELDS for r in records)
+    assert all(r['serial'] == 'FAKE0001' and r['result'] == 'ok' for r in records)
+    assert all(r['end'] >= r['start'] and r['duration'] >= 0 for r in records)
+    pull = [r for r in records if (r['kind'], r['op']) == ('transfer', 'sync pull')]
+    assert [(r['name'], r['bytes']) for r in pull] == [('/sdcard/a.bin', 100000)]
+    assert pull[0]['mb_s'] is None or pull[0]['mb_s'] > 0
+    assert any(r['kind'] == 'cmd' and r['op'] == 'adb shell' for r in records)
+
+
+def _traced(tracer, func):
+    ctx = contextvars.copy_context()
+    ctx.run(tool._tracer_var.set, tracer)
+    return ctx.run(func)
+
+
+def test_trace_op_results(tmp_path):
+    tracer = tool.Tracer(tmp_path / 'trace.jsonl')
+
+    def ops():
+        with tool.trace_op('transfer', 'sync push', 'ok.bin') as info:
+            info['bytes'] = 10
+        with pytest.raises(RuntimeError), tool.trace_op('cmd', 'fastboot flash', 'boot'):
+            raise RuntimeError('boom')
+        with pytest.raises(SystemExit), tool.trace_op('cmd', 'adb shell', 'false'):
+            raise SystemExit(3)
+
+    _traced(tracer, ops)
+    tracer.close()
+    records = _read(tmp_path / 'trace.jsonl')
+    assert [(r['op'], r['bytes'], r['result']) for r in records] == [
+        ('sync push', 10, 'ok'), ('fastboot flash', 0, 'RuntimeError: boom'), ('adb shell', 0, 'exit 3')]
+    assert tracer.stats[('cmd', 'fastboot flash')]['failed'] == 1
+
@@ -0,0 +1,81 @@
+import pytest
+
+import tool
+
+
+def test_host_services(client):
+    assert client.version() == 0x29
+    assert client.devices() == [('FAKE0001', 'device')]
+
+
+def test_shell_and_exec(client, fake_adb):
+    (fake_adb.root / 'hola.txt').write_text('hola\n')
+    assert tool.parse_getprop(client.shell('getprop').decode())['ro.serialno'] == 'FAKE0001'
+    assert client.shell('cat /sdcard/hola.txt') == b'hola\n'
+    with client.exec_out('cat /sdcard/hola.txt', 'FAKE0001') as sock:
+        assert tool.AdbClient._recv_all(sock) == b'hola\n'
+
+
+def test_transport_unknown_serial(client):
+    with pytest.raises(tool.AdbError, match='not found'):
+        client.shell('true', 'NOPE')
+
+
+def test_sync_round_trip(client, fake_adb, tmp_path):
+    data = bytes(range(256)) * 1000  # varios paquetes DATA de 64 KB
+    local = tmp_path / 'in.bin'
+    local.write_bytes(data)
+    assert client.push_file(str(local), '/sdcard/sub/out.bin') == len(data)
+    assert (fake_adb.root / 'sub' / 'out.bin').read_bytes() == data
+    mode, size, _ = client.stat('/sdcard/sub/out.bin')
+    assert mode and size == len(data)
+    assert client.stat('/sdcard/nope')[0] == 0
+    back = tmp_path / 'back.bin'
+    assert client.pull_file('/sdcard/sub/out.bin', str(back)) == len(data)
+    assert back.read_bytes() == data
+
+
+def test_sync_sessions_are_pooled(client, fake_adb):
+    (fake_adb.root / 'f').write_bytes(b'x')
+    for _ in range(3):
+        client.stat('/sdcard/f')
+    assert len(client._pools['']) == 1
+
+
+def test_sync_recovers_after_connections_drop(client, fake_adb, tmp_path):
+    (fake_adb.root / 'f').write_bytes(b'abc')
+    client.pull_file('/sdcard/f', str(tmp_path / 'a'))
+    fake_adb.drop_connections()
+    assert client.pull_file('/sdcard/f', str(tmp_path / 'b')) == 3
+    assert client.stat('/sdcard/f')[1] == 3
+
+
+def test_sync_fail_is_not_retried(client, tmp_path):
+    with pytest.raises(tool.AdbError) as excinfo:
+        client.pull_file('/sdcard/nope', str(tmp_path / 'x'))
+    assert not isinstance(excinfo.value, tool.AdbConnectionError)
+    assert not (tmp_path / 'x.part').exists()
+
+
+def test_pull_interrupted_removes_partial_file(client, fake_adb, tmp_path, monkeypatch):
+    (fake_adb.root / 'big').write_bytes(bytes(300000))
+    recv_exact = client._recv_exact
+    calls = {'n': 0}
+
+    def cut(sock, n):
+        calls['n'] += 1
+        if calls['n'] == 4:  # tras el primer paquete DATA
+            raise tool.AdbError('conexión cortada')
+        return recv_exact(sock, n)
+
+    monkeypatch.setattr(client, '_recv_exact', cut)
+    with pytest.raises(tool.AdbError):
+        client.pull_file('/sdcard/big', str(tmp_path / 'big'))
+    assert not (tmp_path / 'big.part').exists() and not (tmp_path / 'big').exists()
+
+
+def test_reboot_drops_pooled_sessions(client, fake_adb):
+    (fake_adb.root / 'f').write_bytes(b'x')
+    client.stat('/sdcard/f')
+    client.reboot()
+    assert not client._pools.get('')
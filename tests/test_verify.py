@@ -0,0 +1,95 @@
+import hashlib
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+import tool
+
+
+@pytest.fixture
+def fastboot_calls(tmp_path, monkeypatch):
+    """Registra los comandos fastboot en vez de ejecutarlos; caché de hashes en tmp_path."""
+    calls = []
+    monkeypatch.setattr(tool, 'which_ok', lambda name: True)
+    monkeypatch.setattr(tool, 'exec_cmd', lambda cmd, **kwargs: calls.append(cmd))
+    monkeypatch.setattr(tool, 'HASH_CACHE', tool.HashCache(tmp_path / 'cache' / 'hashes.json'))
+    return calls
+
+
+def _package(tmp_path, boot_sha=None, boot_size=None):
+    (tmp_path / 'boot.img').write_bytes(b'boot' * 1000)
+    (tmp_path / 'dtbo.img').write_bytes(b'dtbo' * 10)
+    boot = {'partition': 'boot', 'image': str(tmp_path / 'boot.img'),
+            'sha256': boot_sha or hashlib.sha256(b'boot' * 1000).hexdigest()}
+    if boot_size is not None:
+        boot['size'] = boot_size
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({'actions': [
+        {'partition': 'dtbo', 'image': str(tmp_path / 'dtbo.img')}, boot]}))
+    return manifest
+
+
+def _flash_package(manifest):
+    return CliRunner().invoke(tool.cli, ['flash-package', str(manifest), '--confirm'])
+
+
+def test_verified_package_is_flashed(tmp_path, fastboot_calls):
+    result = _flash_package(_package(tmp_path, boot_size=4000))
+    assert result.exit_code == 0, result.output
+    assert [cmd[-2] for cmd in fastboot_calls] == ['dtbo', 'boot']
+
+
+@pytest.mark.parametrize('bad', [{'boot_sha': '0' * 64}, {'boot_size': 4001}])
+def test_mismatch_aborts_before_fastboot(tmp_path, fastboot_calls, bad):
+    result = _flash_package(_package(tmp_path, **bad))
+    assert result.exit_code == 1
+    assert 'no se flasheará nada' in result.output
+    assert fastboot_calls == []
+
+
+def test_flash_expected_sha256_mismatch(tmp_path, fastboot_calls):
+    (tmp_path / 'boot.img').write_bytes(b'x')
+    result = CliRunner().invoke(tool.cli, ['flash', 'boot', str(tmp_path / 'boot.img'), '--use-fastboot',
+                                           '--confirm', '--sha256', '0' * 64])
+    assert result.exit_code == 1, result.output
+    assert fastboot_calls == []
+
+
+def test_hash_cache_reuses_digest(tmp_path):
+    image = tmp_path / 'a.img'
+    image.write_bytes(b'a')
+    cache = tool.HashCache(tmp_path / 'hashes.json')
+    assert cache.sha256(image) == hashlib.sha256(b'a').hexdigest()
+    cache.save()
+    assert tool.HashCache(tmp_path / 'hashes.json').cached(str(image.resolve()),
+                                                          _stamp(image), pytest.fail) == hashlib.sha256(b'a').hexdigest()
+
+
+def _stamp(path):
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+_OTHER_PROCESS = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import tool
+cache = tool.HashCache(sys.argv[2])
+for i in range(int(sys.argv[3]), int(sys.argv[3]) + 50):
+    cache.cached(f'k{i}', (i,), lambda: f'h{i}')
+    cache.save()
+"""
+
+
+def test_hash_cache_save_merges_between_processes(tmp_path):
+    path = tmp_path / 'hashes.json'
+    procs = [subprocess.Popen([sys.executable, '-c', _OTHER_PROCESS, str(Path(tool.__file__).parent),
+                               str(path), str(start)]) for start in (0, 50, 100)]
+    assert [p.wait(60) for p in procs] == [0, 0, 0]
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    assert entries == {f'k{i}': [i, f'h{i}'] for i in range(150)}
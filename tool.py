@@ -3,290 +3,3590 @@
 CLI de utilidad para Redmi A2 Lite (ADB / Fastboot helpers)
 Uso: instalar `platform-tools` y habilitar Depuración USB en el teléfono.
 """
+import array
+import calendar
+import contextvars
+import csv
+import datetime
+import functools
+import hashlib
+import mmap
 import os
 import shutil
+import socket
+import struct
 import subprocess
 import sys
+import tarfile
 import json
+import queue
 import re
+import select
+import shlex
+import threading
 import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import closing, contextmanager, nullcontext
 from pathlib import Path
 import tempfile
 import time
 
 import click
 
+try:
+    import zstandard
+except ImportError:  # opcional: sólo para `backup --codec zstd`
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: bloqueos de archivo con msvcrt
+    fcntl = None
+    import msvcrt
+
 # Helpers
 
-def which_ok(cmd):
-    return shutil.which(cmd) is not None
+# Dispositivo sobre el que trabaja el contexto actual (cada worker del modo
+# flota tiene su propio contexto) y prefijo que se antepone a su salida.
+_serial_var = contextvars.ContextVar('serial', default=None)
+_echo_prefix = contextvars.ContextVar('echo_prefix', default=None)
+_prompt_lock = threading.Lock()
+# Opciones de flota de la invocación actual (por contexto: trabajos simultáneos
+# de la GUI o pasos de un batch no se pisan entre sí).
+_fleet_var = contextvars.ContextVar('fleet', default={'serials': (), 'all_devices': False, 'jobs': 8})
+# Trabajo en curso cuando el comando se ejecuta dentro del proceso (GUI, batch).
+_job_var = contextvars.ContextVar('job', default=None)
+# Evento que `run_fleet` activa con Ctrl+C para que sus workers paren en el
+# siguiente punto de cancelación.
+_fleet_stop = contextvars.ContextVar('fleet_stop', default=None)
+
+
+_found_tools = set()
+
+
+def which_ok(cmd):
+    # Sólo se recuerdan los encontrados: en `batch`/`session` y en la GUI no se
+    # recorre PATH en cada paso, pero una herramienta instalada con el proceso
+    # abierto se detecta en el siguiente intento.
+    if cmd in _found_tools:
+        return True
+    if shutil.which(cmd) is None:
+        return False
+    _found_tools.add(cmd)
+    return True
+
+
+def confirm_prompt(text):
+    """`click.confirm` para operaciones peligrosas.
+
+    Dentro de un trabajo (GUI, `batch`, `session`) no hay terminal a la que
+    preguntar: se responde que no y se pide repetir el comando con `--confirm`.
+    """
+    if _job_var.get() is not None:
+        echo(f'{text} [y/N]: no se puede preguntar aquí; usa --confirm.')
+        return False
+    return click.confirm(text, default=False)
+
+
+def echo(message=''):
+    """`click.echo` que antepone `[serial]` a cada línea en modo multi-dispositivo.
+
+    Dentro de un `Job` la salida va al trabajo en lugar de a stdout.
+    """
+    prefix = _echo_prefix.get()
+    if prefix:
+        message = '\n'.join(f'[{prefix}] {line}' for line in str(message).splitlines() or [''])
+    job = _job_var.get()
+    if job is not None:
+        job.write(f'{message}\n')
+        return
+    click.echo(message)
+
+
+class JobCancelled(Exception):
+    """El trabajo en curso fue cancelado."""
+
+
+def check_cancelled():
+    """Lanza `JobCancelled` si el trabajo actual se canceló (punto de cancelación cooperativo)."""
+    job = _job_var.get()
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled()
+    stop = _fleet_stop.get()
+    if stop is not None and stop.is_set():
+        raise JobCancelled()
+
+
+def report_progress(done, total):
+    """Informa del progreso al trabajo actual (si lo hay) y atiende la cancelación."""
+    job = _job_var.get()
+    if job is not None:
+        job.set_progress(done, total)
+    check_cancelled()
+
+
+def current_serial():
+    return _serial_var.get()
+
+
+def fleet_active():
+    """True dentro de un worker del modo flota (varios dispositivos a la vez)."""
+    return _echo_prefix.get() is not None
+
+
+def adb_cmd(*args):
+    """Construye `adb [-s SERIAL] args...` para el dispositivo actual."""
+    serial = current_serial()
+    return ['adb', '-s', serial, *args] if serial else ['adb', *args]
+
+
+def fastboot_cmd(*args):
+    """Construye `fastboot [-s SERIAL] args...` para el dispositivo actual."""
+    serial = current_serial()
+    return ['fastboot', '-s', serial, *args] if serial else ['fastboot', *args]
+
+
+# Transporte nativo: protocolo host del servidor adb (localhost:5037)
+
+ADB_SERVER_HOST = os.environ.get('ANDROID_ADB_SERVER_ADDRESS', '127.0.0.1')
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', '5037'))
+SYNC_DATA_MAX = 64 * 1024
+
+# 'auto' usa el servidor adb si responde y cae a subprocess si no;
+# 'native' lo exige; 'subprocess' lanza siempre el ejecutable `adb`.
+TRANSPORT = {'mode': os.environ.get('REDMI_ADB_TRANSPORT', 'auto')}
+
+
+class AdbError(Exception):
+    """Error devuelto por el servidor adb (FAIL) o conexión interrumpida."""
+
+
+class AdbConnectionError(AdbError):
+    """El servidor adb cerró la conexión (p.ej. el dispositivo se reinició)."""
+
+
+class AdbClient:
+    """Cliente mínimo del protocolo host del servidor adb.
+
+    Habla directamente con el servidor que arranca `adb start-server`, sin
+    lanzar un proceso `adb` por llamada. Las sesiones `sync:` admiten varias
+    peticiones por socket, así que se guardan en un pool pequeño por
+    dispositivo; `shell:`, `exec:` y `reboot:` consumen el socket y abren una
+    conexión local nueva (sin fork/exec ni handshake USB adicional).
+    """
+
+    def __init__(self, host=None, port=None, timeout=10.0, pool_size=4):
+        self.host = host or ADB_SERVER_HOST
+        self.port = port or ADB_SERVER_PORT
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    # -- framing --------------------------------------------------------
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _send(sock, payload):
+        data = payload.encode('utf-8')
+        sock.sendall(b'%04x' % len(data) + data)
+
+    @staticmethod
+    def _recv_exact(sock, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if not chunk:
+                raise AdbConnectionError('conexión cerrada por el servidor adb')
+            buf += chunk
+        return bytes(buf)
+
+    @staticmethod
+    def _recv_all(sock):
+        parts = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(parts)
+            parts.append(chunk)
+
+    def _read_string(self, sock):
+        n = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, n).decode('utf-8', errors='ignore')
+
+    def _status(self, sock):
+        st = self._recv_exact(sock, 4)
+        if st == b'OKAY':
+            return
+        if st == b'FAIL':
+            raise AdbError(self._read_string(sock))
+        raise AdbError(f'respuesta inesperada del servidor adb: {st!r}')
+
+    # -- servicios host ---------------------------------------------------
+
+    def host_query(self, service):
+        """Ejecuta un servicio `host:*` que responde con una cadena (p.ej. `host:version`)."""
+        with closing(self._connect()) as sock:
+            self._send(sock, service)
+            self._status(sock)
+            return self._read_string(sock)
+
+    def version(self):
+        return int(self.host_query('host:version'), 16)
+
+    @staticmethod
+    def _parse_devices(text):
+        out = []
+        for line in text.splitlines():
+            parts = line.split('\t')
+            if len(parts) == 2:
+                out.append((parts[0], parts[1]))
+        return out
+
+    def devices(self):
+        """Devuelve [(serial, estado), ...] desde `host:devices`."""
+        return self._parse_devices(self.host_query('host:devices'))
+
+    def track_devices(self, stop):
+        """Itera [(serial, estado), ...] cada vez que cambia la lista (`host:track-devices`).
+
+        El servidor envía la lista completa al suscribirse y después en cada
+        cambio; no hay sondeo. Termina cuando se activa el `threading.Event` `stop`.
+        """
+        with closing(self._connect()) as sock:
+            self._send(sock, 'host:track-devices')
+            self._status(sock)
+            while not stop.is_set():
+                if select.select([sock], [], [], 0.5)[0]:
+                    yield self._parse_devices(self._read_string(sock))
+
+    def open_service(self, service, serial=None):
+        """Abre `service` en el dispositivo y devuelve el socket ya conectado."""
+        sock = self._connect()
+        try:
+            self._send(sock, f'host:transport:{serial}' if serial else 'host:transport-any')
+            self._status(sock)
+            self._send(sock, service)
+            self._status(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def shell(self, command, serial=None):
+        """Ejecuta `command` con el servicio `shell:` y devuelve la salida (bytes)."""
+        with closing(self.open_service('shell:' + command, serial)) as sock:
+            sock.settimeout(None)
+            return self._recv_all(sock)
+
+    def exec_out(self, command, serial=None):
+        """Abre `exec:` (salida binaria sin pty) y devuelve el socket para leerlo en streaming."""
+        sock = self.open_service('exec:' + command, serial)
+        sock.settimeout(None)
+        return sock
+
+    def reboot(self, target='', serial=None):
+        self.drop_sessions(serial)
+        with closing(self.open_service('reboot:' + target, serial)) as sock:
+            try:
+                self._recv_all(sock)
+            except OSError:
+                # El dispositivo corta la conexión al reiniciar: no es un error.
+                pass
+
+    # -- sync: (pool de sesiones reutilizables) -------------------------
+
+    def _borrow(self, serial):
+        """Saca una sesión `sync:` viva del pool. Devuelve (socket, venía_del_pool)."""
+        while True:
+            with self._lock:
+                pool = self._pools.setdefault(serial or '', [])
+                sock = pool.pop() if pool else None
+            if sock is None:
+                return self.open_service('sync:', serial), False
+            # Una sesión ociosa no tiene nada que leer: si está legible, el
+            # servidor la cerró (reinicio del dispositivo o del servidor adb).
+            try:
+                stale = bool(select.select([sock], [], [], 0)[0])
+            except (OSError, ValueError):
+                stale = True
+            if not stale:
+                return sock, True
+            sock.close()
+
+    def _release(self, serial, sock):
+        with self._lock:
+            pool = self._pools.setdefault(serial or '', [])
+            if len(pool) < self.pool_size:
+                pool.append(sock)
+                return
+        sock.close()
+
+    def _sync_call(self, serial, func):
+        """Ejecuta `func(sock)` sobre una sesión `sync:` del pool del dispositivo.
+
+        Si una sesión reutilizada resulta estar muerta se repite una vez con
+        una conexión nueva; los FAIL del dispositivo no se reintentan.
+        """
+        while True:
+            sock, pooled = self._borrow(serial)
+            try:
+                result = func(sock)
+            except (OSError, AdbConnectionError):
+                sock.close()
+                if pooled:
+                    continue
+                raise
+            except BaseException:
+                sock.close()
+                raise
+            self._release(serial, sock)
+            return result
+
+    def drop_sessions(self, serial=None):
+        """Cierra las sesiones `sync:` guardadas del dispositivo (p.ej. antes de reiniciarlo)."""
+        with self._lock:
+            pool = self._pools.pop(serial or '', [])
+        for sock in pool:
+            sock.close()
+
+    @staticmethod
+    def _sync_request(sock, cmd, path):
+        data = path.encode('utf-8')
+        sock.sendall(cmd + struct.pack('<I', len(data)) + data)
+
+    def _sync_fail(self, sock, length):
+        raise AdbError(self._recv_exact(sock, length).decode('utf-8', errors='ignore'))
+
+    def stat(self, path, serial=None):
+        """Devuelve (mode, size, mtime) de `path`; mode == 0 si no existe."""
+        def request(sock):
+            self._sync_request(sock, b'STAT', path)
+            hdr = self._recv_exact(sock, 16)
+            if hdr[:4] != b'STAT':
+                raise AdbError(f'respuesta sync inesperada: {hdr[:4]!r}')
+            return struct.unpack('<III', hdr[4:])
+        return self._sync_call(serial, request)
+
+    def pull_file(self, remote, local, serial=None):
+        """Descarga un archivo vía `sync:` RECV. Devuelve los bytes transferidos."""
+        with trace_op('transfer', 'sync pull', remote) as op:
+            op['bytes'] = self._pull_file(remote, local, serial)
+            return op['bytes']
+
+    def _pull_file(self, remote, local, serial):
+        tmp = f'{local}.part'
+
+        def request(sock):
+            total = 0
+            with open(tmp, 'wb') as f:
+                self._sync_request(sock, b'RECV', remote)
+                while True:
+                    hdr = self._recv_exact(sock, 8)
+                    ident, length = hdr[:4], struct.unpack('<I', hdr[4:])[0]
+                    if ident == b'DATA':
+                        f.write(self._recv_exact(sock, length))
+                        total += length
+                    elif ident == b'DONE':
+                        return total
+                    elif ident == b'FAIL':
+                        self._sync_fail(sock, length)
+                    else:
+                        raise AdbError(f'respuesta sync inesperada: {ident!r}')
+
+        try:
+            total = self._sync_call(serial, request)
+            os.replace(tmp, local)
+        except BaseException:
+            # Sin `.part` a medias en el destino si la transferencia falla o se cancela.
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return total
+
+    def push_file(self, local, remote, serial=None, mode=0o644):
+        """Sube un archivo vía `sync:` SEND. Devuelve los bytes transferidos."""
+        with trace_op('transfer', 'sync push', remote) as op:
+            op['bytes'] = self._push_file(local, remote, serial, mode)
+            return op['bytes']
+
+    def _push_file(self, local, remote, serial, mode):
+        st = os.stat(local)
+
+        def request(sock):
+            total = 0
+            with open(local, 'rb') as f:
+                self._sync_request(sock, b'SEND', f'{remote},{mode}')
+                while True:
+                    chunk = f.read(SYNC_DATA_MAX)
+                    if not chunk:
+                        break
+                    sock.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                    total += len(chunk)
+            sock.sendall(b'DONE' + struct.pack('<I', int(st.st_mtime)))
+            hdr = self._recv_exact(sock, 8)
+            length = struct.unpack('<I', hdr[4:])[0]
+            if hdr[:4] == b'FAIL':
+                self._sync_fail(sock, length)
+            if hdr[:4] != b'OKAY':
+                raise AdbError(f'respuesta sync inesperada: {hdr[:4]!r}')
+            return total
+
+        return self._sync_call(serial, request)
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for sock in pool:
+                try:
+                    sock.sendall(b'QUIT' + struct.pack('<I', 0))
+                except OSError:
+                    pass
+                sock.close()
+
+
+_native = {'client': None, 'probed': False}
+_native_lock = threading.Lock()
+
+
+def probe_native():
+    """Comprueba (una sola vez por proceso) si el servidor adb responde."""
+    with _native_lock:
+        if not _native['probed']:
+            _native['probed'] = True
+            client = AdbClient()
+            try:
+                client.version()
+                _native['client'] = client
+            except (OSError, AdbError, ValueError):
+                _native['client'] = None
+        return _native['client']
+
+
+def native_client():
+    """Devuelve el `AdbClient` compartido si el transporte nativo está disponible, o None."""
+    mode = TRANSPORT['mode']
+    if mode == 'subprocess':
+        return None
+    client = probe_native()
+    if client is None and mode == 'native':
+        echo(f'Servidor adb no disponible en {ADB_SERVER_HOST}:{ADB_SERVER_PORT} (usa `adb start-server`).')
+        sys.exit(1)
+    return client
+
+
+def adb_ok():
+    """True si hay forma de hablar con adb: ejecutable en PATH o servidor nativo."""
+    return which_ok('adb') or native_client() is not None
+
+
+def _split_adb_cmd(cmd):
+    """Separa ['adb', '-s', SERIAL, sub, ...] en (serial, sub, args)."""
+    args = [str(c) for c in cmd[1:]]
+    serial = None
+    if len(args) >= 2 and args[0] == '-s':
+        serial, args = args[1], args[2:]
+    if not args:
+        return serial, None, []
+    return serial, args[0], args[1:]
+
+
+_NOT_HANDLED = object()
+
+
+def _run_native(cmd, capture):
+    """Intenta resolver `cmd` por el transporte nativo; `_NOT_HANDLED` si no aplica."""
+    if not cmd or Path(str(cmd[0])).stem != 'adb':
+        return _NOT_HANDLED
+    serial, sub, args = _split_adb_cmd(cmd)
+    supported = (sub in ('shell', 'exec-out') and capture and args) or sub == 'reboot'
+    if not supported:
+        return _NOT_HANDLED
+    client = native_client()
+    if client is None:
+        return _NOT_HANDLED
+    try:
+        if sub == 'reboot':
+            client.reboot(args[0] if args else '', serial)
+            return '' if capture else None
+        if sub == 'shell':
+            out = client.shell(' '.join(args), serial)
+        else:
+            with closing(client.exec_out(' '.join(args), serial)) as sock:
+                out = client._recv_all(sock)
+        return out.decode(errors='ignore')
+    except (OSError, AdbError) as e:
+        if TRANSPORT['mode'] == 'native':
+            echo(f'Error ejecutando (nativo): {cmd} -> {e}')
+            sys.exit(1)
+        return _NOT_HANDLED
+
+
+def _run_in_job(job, cmd, capture, stream):
+    """Como `run`, pero la salida del hijo va al trabajo y el proceso se puede cancelar."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=False)
+    job.attach(proc)
+    try:
+        if capture:
+            out = proc.communicate()[0]
+        else:
+            for raw in proc.stdout:
+                echo(raw.decode(errors='replace').rstrip('\r\n'))
+        code = proc.wait()
+    finally:
+        job.detach(proc)
+    check_cancelled()
+    if stream:
+        return code
+    if code != 0:
+        raise subprocess.CalledProcessError(code, cmd, output=out if capture else None)
+    return out.decode(errors='ignore') if capture else None
+
+
+# Trazas (`--trace` / `--stats`): duración, bytes y resultado de cada operación externa
+
+class Tracer:
+    """Registra comandos externos y transferencias como líneas JSON y acumula un resumen."""
+
+    def __init__(self, path=None):
+        self._file = open(path, 'a', encoding='utf-8', buffering=1) if path else None
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def add(self, kind, op, name, start, end, nbytes, result):
+        duration = end - start
+        record = {
+            'kind': kind, 'op': op, 'name': name, 'serial': current_serial(),
+            'start': round(start, 6), 'end': round(end, 6), 'duration': round(duration, 6),
+            'bytes': nbytes, 'mb_s': round(nbytes / duration / 1e6, 3) if nbytes and duration > 0 else None,
+            'result': result,
+        }
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            st = self.stats.setdefault((kind, op), {'n': 0, 'time': 0.0, 'max': 0.0, 'bytes': 0, 'failed': 0})
+            st['n'] += 1
+            st['time'] += duration
+            st['max'] = max(st['max'], duration)
+            st['bytes'] += nbytes
+            st['failed'] += result != 'ok'
+
+    def summary(self):
+        """Tabla por operación: veces, tiempo total/medio/máximo, MB, MB/s y fallos."""
+        lines = [f'{"operación":<24} {"n":>5} {"total s":>9} {"media s":>8} {"máx s":>8} {"MB":>9} {"MB/s":>7} {"fallos":>6}']
+        for (kind, op), st in sorted(self.stats.items(), key=lambda kv: -kv[1]['time']):
+            mb = st['bytes'] / 1e6
+            rate = f'{mb / st["time"]:.1f}' if st['bytes'] and st['time'] > 0 else '-'
+            lines.append(f'{op:<24} {st["n"]:>5} {st["time"]:>9.2f} {st["time"] / st["n"]:>8.3f} '
+                         f'{st["max"]:>8.3f} {mb:>9.1f} {rate:>7} {st["failed"]:>6}')
+        return lines
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        # A stderr: en `batch`/`session` stdout es JSON.
+        click.echo('\n'.join(['', 'Resumen de operaciones:'] + self.summary()), err=True)
+
+
+_tracer_var = contextvars.ContextVar('tracer', default=None)
+
+
+def _trace_result(exc):
+    if isinstance(exc, SystemExit):
+        return f'exit {_exit_code(exc)}'
+    if isinstance(exc, subprocess.CalledProcessError):
+        return f'exit {exc.returncode}'
+    if isinstance(exc, JobCancelled):
+        return 'cancelado'
+    return f'{type(exc).__name__}: {exc}'
+
+
+@contextmanager
+def trace_op(kind, op, name, nbytes=0):
+    """Mide la operación del bloque si hay trazas activas.
+
+    Entrega un dict en el que el bloque puede ajustar `bytes` y `result`
+    (por defecto `'ok'`, o el error si el bloque lanza una excepción).
+    """
+    info = {'bytes': nbytes, 'result': 'ok'}
+    tracer = _tracer_var.get()
+    if tracer is None:
+        yield info
+        return
+    start = time.time()
+    try:
+        yield info
+    except BaseException as e:
+        if info['result'] == 'ok':
+            info['result'] = _trace_result(e)
+        raise
+    finally:
+        tracer.add(kind, op, name, start, time.time(), info['bytes'], info['result'])
+
+
+def _cmd_label(cmd):
+    """`adb -s X shell getprop` -> `adb shell` (agrupación del resumen)."""
+    words = [Path(str(cmd[0])).stem] if cmd else []
+    rest = iter(cmd[1:])
+    for arg in rest:
+        if arg == '-s':
+            next(rest, None)
+        elif not str(arg).startswith('-'):
+            words.append(str(arg))
+            break
+    return ' '.join(words)
+
+
+class _CountingStream:
+    """Envuelve un stream de lectura contando los bytes leídos (para `--trace`)."""
+
+    def __init__(self, raw, info):
+        self.raw = raw
+        self.info = info
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.info['bytes'] += len(data or b'')
+        return data
+
+    def readline(self, size=-1):
+        data = self.raw.readline(size)
+        self.info['bytes'] += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def run(cmd, capture=False, stream=False, nbytes=0):
+    """Ejecuta `cmd`; `nbytes` indica los bytes que mueve (p.ej. la imagen de un flash) para `--trace`."""
+    check_cancelled()
+    with trace_op('cmd', _cmd_label(cmd), ' '.join(map(str, cmd)), nbytes) as op:
+        if not stream:
+            result = _run_native(cmd, capture)
+            if result is not _NOT_HANDLED:
+                op['bytes'] = op['bytes'] or len(result or '')
+                return result
+        try:
+            job = _job_var.get()
+            if job is not None:
+                result = _run_in_job(job, cmd, capture, stream)
+            elif stream:
+                p = subprocess.Popen(cmd, shell=False)
+                p.wait()
+                result = p.returncode
+            elif capture:
+                out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=False)
+                result = out.decode(errors="ignore")
+            else:
+                subprocess.check_call(cmd, shell=False)
+                result = None
+            if stream and result:
+                op['result'] = f'exit {result}'
+            elif capture:
+                op['bytes'] = op['bytes'] or len(result)
+            return result
+        except subprocess.CalledProcessError as e:
+            op['result'] = f'exit {e.returncode}'
+            if capture and hasattr(e, 'output'):
+                return (e.output or b'').decode(errors='ignore')
+            echo(f"Error ejecutando: {cmd} -> {e}")
+            sys.exit(1)
+
+
+def exec_cmd(cmd, dry_run=False, capture=False, stream=False, nbytes=0):
+    """Ejecuta o simula la ejecución de `cmd`.
+    - Si `dry_run` es True, sólo muestra la acción y no ejecuta.
+    - `cmd` debe ser lista de argumentos (no shell string).
+    """
+    if dry_run:
+        echo(f"DRY-RUN: {' '.join(map(str, cmd))}")
+        return "" if capture else 0
+    return run(cmd, capture=capture, stream=stream, nbytes=nbytes)
+
+
+@contextmanager
+def adb_exec_out(command):
+    """Ejecuta `adb exec-out command` y entrega su salida binaria como stream legible.
+
+    Usa el servicio `exec:` del transporte nativo si está disponible; si no,
+    un único proceso `adb exec-out`. Nunca se acumula la salida completa.
+    """
+    with trace_op('transfer', 'exec-out', command) as op, _adb_exec_out(command) as stream:
+        yield stream if _tracer_var.get() is None else _CountingStream(stream, op)
+
+
+@contextmanager
+def _adb_exec_out(command):
+    client = native_client()
+    sock = None
+    if client is not None:
+        try:
+            sock = client.exec_out(command, current_serial())
+        except (OSError, AdbError) as e:
+            if TRANSPORT['mode'] == 'native':
+                raise click.ClickException(f'exec-out falló (nativo): {e}')
+    job = _job_var.get()
+    if sock is not None:
+        if job is not None:
+            job.attach(sock)
+        try:
+            with closing(sock), sock.makefile('rb') as stream:
+                yield stream
+        finally:
+            if job is not None:
+                job.detach(sock)
+        return
+    proc = subprocess.Popen(adb_cmd('exec-out', command), stdout=subprocess.PIPE)
+    if job is not None:
+        job.attach(proc)
+    ok = False
+    try:
+        yield proc.stdout
+        ok = True
+    finally:
+        proc.stdout.close()
+        if not ok and proc.poll() is None:
+            proc.kill()
+        code = proc.wait()
+        if job is not None:
+            job.detach(proc)
+    check_cancelled()
+    if code != 0:
+        raise click.ClickException(f'adb exec-out terminó con código {code}')
+
+
+class ThroughputReader:
+    """Envuelve un stream binario contando bytes e informando MB/s cada `interval` s."""
+
+    def __init__(self, raw, label='recibidos', interval=2.0):
+        self.raw = raw
+        self.label = label
+        self.interval = interval
+        self.bytes = 0
+        self.start = self._last = time.monotonic()
+
+    def read(self, size=-1):
+        check_cancelled()
+        data = self.raw.read(size)
+        self.bytes += len(data)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            echo(f'  {self.bytes / 1048576:.1f} MB {self.label} ({self.rate():.1f} MB/s)')
+        return data
+
+    def rate(self):
+        return self.bytes / 1048576 / max(time.monotonic() - self.start, 1e-6)
+
+
+# Propiedades del dispositivo: un solo `getprop` por dispositivo, cacheado con TTL
+
+PROPS_TTL = float(os.environ.get('REDMI_PROPS_TTL', '30'))
+_PROP_RE = re.compile(r'^\[([^\]]*)\]: \[(.*?)\]$', re.M | re.S)
+_props_cache = {}
+_props_lock = threading.Lock()
+
+
+def parse_getprop(text):
+    """Convierte la salida `[clave]: [valor]` de `getprop` en un dict."""
+    return {m.group(1): m.group(2) for m in _PROP_RE.finditer(text.replace('\r\n', '\n'))}
+
+
+def device_props(serial=None, refresh=False):
+    """Devuelve un snapshot de todas las propiedades del dispositivo.
+
+    Se obtiene con una única llamada `getprop` y se reutiliza durante
+    `PROPS_TTL` segundos (variable `REDMI_PROPS_TTL`) para ese serial.
+    """
+    serial = serial or current_serial()
+    key = serial or ''
+    now = time.monotonic()
+    with _props_lock:
+        entry = _props_cache.get(key)
+    if entry and not refresh and now - entry[0] < PROPS_TTL:
+        return entry[1]
+    cmd = ['adb', '-s', serial, 'shell', 'getprop'] if serial else ['adb', 'shell', 'getprop']
+    props = parse_getprop(run(cmd, capture=True) or '')
+    if props:
+        with _props_lock:
+            _props_cache[key] = (now, props)
+    return props
+
+
+def invalidate_props(serial=None):
+    """Descarta el snapshot de propiedades (p.ej. tras un reinicio)."""
+    serial = serial or current_serial()
+    with _props_lock:
+        _props_cache.pop(serial or '', None)
+
+
+def validate_redmi_a2_lite():
+    """Valida que el dispositivo sea un Redmi A2 Lite."""
+    if not adb_ok():
+        echo('adb no encontrado')
+        return False
+    try:
+        model = device_props().get('ro.product.model', '').strip().upper()
+        if 'A2 LITE' not in model and 'A2LITE' not in model:
+            echo(f'Advertencia: el dispositivo parece ser {model}, no un Redmi A2 Lite.')
+            with _prompt_lock:
+                if not confirm_prompt('¿Deseas continuar de todas formas?'):
+                    return False
+        else:
+            echo(f'Dispositivo detectado: {model}')
+        return True
+    except Exception as e:
+        echo(f'Error validando dispositivo: {e}')
+        return False
+
+
+# Modo flota: mismo comando en varios dispositivos a la vez
+
+def adb_device_states():
+    """{serial: estado} de todos los dispositivos que ve adb (incluidos offline/unauthorized)."""
+    client = native_client()
+    if client is not None:
+        try:
+            return dict(client.devices())
+        except (OSError, AdbError):
+            pass
+    if not which_ok('adb'):
+        return {}
+    out = run(['adb', 'devices'], capture=True) or ''
+    found = {}
+    for line in out.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2:
+            found[parts[0]] = parts[1]
+    return found
+
+
+def list_adb_devices(states=('device', 'recovery', 'sideload')):
+    """Seriales conectados por adb en alguno de `states`."""
+    return [serial for serial, state in adb_device_states().items() if state in states]
+
+
+def list_fastboot_devices():
+    """Seriales en modo fastboot/bootloader."""
+    if not which_ok('fastboot'):
+        return []
+    out = run(['fastboot', 'devices'], capture=True) or ''
+    return [line.split()[0] for line in out.splitlines() if line.strip() and 'fastboot' in line]
+
+
+def resolve_serials(kind='adb'):
+    """Seriales seleccionados con `--serial`/`--all-devices` para un comando `adb`, `fastboot` o `any` (ambos)."""
+    fleet = _fleet_var.get()
+    if fleet['all_devices']:
+        if kind == 'any':
+            serials = list(dict.fromkeys(list_adb_devices() + list_fastboot_devices()))
+        elif kind == 'fastboot':
+            serials = list_fastboot_devices()
+        else:
+            serials = list_adb_devices()
+        if not serials:
+            echo(f'No se encontraron dispositivos ({kind}).')
+            sys.exit(1)
+        return serials
+    return list(fleet['serials'])
+
+
+def _exit_code(exc):
+    if exc.code is None:
+        return 0
+    return exc.code if isinstance(exc.code, int) else 1
+
+
+def _fleet_worker(func, serial, args, kwargs):
+    _serial_var.set(serial)
+    _echo_prefix.set(serial)
+    start = time.monotonic()
+    try:
+        func(*args, **kwargs)
+        code = 0
+    except SystemExit as e:
+        code = _exit_code(e)
+    except JobCancelled:
+        echo('Cancelado.')
+        code = 130
+    except Exception as e:
+        echo(f'Error: {e}')
+        code = 1
+    return code, time.monotonic() - start
+
+
+def run_fleet(func, serials, args, kwargs):
+    """Ejecuta `func` una vez por serial con un pool acotado y resume el resultado."""
+    name = func.__name__.replace('_', '-')
+    if 'confirm' in kwargs and not kwargs['confirm']:
+        if not confirm_prompt(f'Se ejecutará `{name}` en {len(serials)} dispositivos ({", ".join(serials)}). ¿Deseas continuar?'):
+            echo('Operación cancelada por usuario.')
+            sys.exit(2)
+        kwargs = dict(kwargs, confirm=True)
+    jobs = _fleet_var.get()['jobs']
+    echo(f'Ejecutando `{name}` en {len(serials)} dispositivos (máx. {jobs} en paralelo)')
+    results = {}
+    stop = threading.Event()
+    token = _fleet_stop.set(stop)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(serials)))) as pool:
+            futures = {
+                pool.submit(contextvars.copy_context().run, _fleet_worker, func, serial, args, kwargs): serial
+                for serial in serials
+            }
+            remaining = set(futures)
+            while remaining:
+                try:
+                    finished, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+                except KeyboardInterrupt:
+                    # Un segundo Ctrl+C ya no se captura y aborta sin esperar.
+                    if stop.is_set():
+                        raise
+                    echo('Interrumpido: deteniendo los dispositivos...')
+                    stop.set()
+                    continue
+                for fut in finished:
+                    serial = futures[fut]
+                    code, elapsed = fut.result()
+                    results[serial] = (code, elapsed)
+                    status = 'OK' if code == 0 else f'FALLO (código {code})'
+                    echo(f'[{len(results)}/{len(serials)}] {serial}: {status} en {elapsed:.1f}s')
+                    job = _job_var.get()
+                    if job is not None:
+                        job.set_progress(len(results), len(serials))
+    finally:
+        _fleet_stop.reset(token)
+    echo('--- Resumen ---')
+    for serial in serials:
+        code, elapsed = results[serial]
+        echo(f"{serial:<24} {'OK' if code == 0 else 'FALLO':<6} {elapsed:7.1f}s")
+    failed = [s for s in serials if results[s][0] != 0]
+    echo(f'{len(serials) - len(failed)}/{len(serials)} dispositivos OK')
+    if failed:
+        sys.exit(max(results[s][0] for s in failed))
+
+
+def fleet_command(kind='adb', any_with=None):
+    """Permite ejecutar el comando sobre los dispositivos de `--serial`/`--all-devices`.
+
+    Con uno (o ninguno) se ejecuta tal cual sobre ese serial; con varios se
+    reparte entre un pool de workers, uno por dispositivo. Si la opción
+    `any_with` está activada (p.ej. `reboot_bootloader`, que lleva el teléfono
+    de adb a fastboot), `--all-devices` busca en adb y fastboot.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            serials = resolve_serials('any' if any_with and kwargs.get(any_with) else kind)
+            if len(serials) <= 1:
+                token = _serial_var.set(serials[0] if serials else current_serial())
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _serial_var.reset(token)
+            return run_fleet(func, serials, args, kwargs)
+        wrapper.fleet_kind = kind
+        return wrapper
+    return decorate
+
+
+# Estado de los dispositivos: eventos de adb (`host:track-devices`) y sondeo de fastboot
+
+WAIT_STATES = ('device', 'recovery', 'sideload', 'fastboot', 'bootloader', 'offline', 'unauthorized', 'disconnected')
+FASTBOOT_POLL_MIN = 0.1
+FASTBOOT_POLL_MAX = 2.0
+FASTBOOT_HOT_WINDOW = 60.0
+
+
+class DeviceTracker:
+    """Sigue el estado de los dispositivos mientras está abierto (`with DeviceTracker() as t`).
+
+    adb: suscripción a `host:track-devices` del servidor (sin sondeo); si no hay
+    transporte nativo, `adb devices` con backoff. fastboot no tiene eventos, así
+    que se sondea `fastboot devices` con backoff exponencial; cuando cambia algo
+    en adb (p.ej. el dispositivo desaparece al reiniciar hacia el bootloader) se
+    vuelve a sondear rápido durante `FASTBOOT_HOT_WINDOW` segundos.
+    """
+
+    def __init__(self):
+        self._states = {'adb': {}, 'fastboot': {}}
+        self._ready = {'adb': False, 'fastboot': False}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._kick = threading.Event()
+        self._hot_until = 0.0
+
+    def __enter__(self):
+        sources = (('adb', self._track_adb if adb_ok() else None),
+                   ('fastboot', self._poll_fastboot if which_ok('fastboot') else None))
+        for source, target in sources:
+            if target is None:
+                self._ready[source] = True
+                continue
+            # Contexto vacío: el tracker puede ser compartido (`device_tracker`), así que
+            # no hereda el trabajo, la cancelación ni el serial de quien lo arrancó.
+            threading.Thread(target=contextvars.Context().run, args=(self._guard, source, target),
+                             daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        # Sin join: los hilos (daemon) ven `_stop` y terminan solos en menos de 0,5 s;
+        # esperarlos sólo retrasaría el siguiente paso del flujo.
+        self._stop.set()
+        self._kick.set()
+
+    def _update(self, source, states):
+        with self._cond:
+            changed = self._states[source] != states
+            self._states[source] = states
+            self._ready[source] = True
+            self._cond.notify_all()
+        if changed and source == 'adb':
+            self._kick.set()
+
+    def _guard(self, source, target):
+        try:
+            target()
+        except (Exception, SystemExit):
+            # Sin esa fuente no se puede seguir esperando algo que dependa de ella.
+            with self._cond:
+                self._ready[source] = True
+                self._cond.notify_all()
+
+    def _poll(self, source, list_states, wake=None):
+        interval = FASTBOOT_POLL_MIN
+        while not self._stop.is_set():
+            before = self._states[source]
+            self._update(source, list_states())
+            if self._states[source] != before or time.monotonic() < self._hot_until:
+                interval = FASTBOOT_POLL_MIN
+            else:
+                interval = min(interval * 1.5, FASTBOOT_POLL_MAX)
+            if (wake or self._stop).wait(interval) and wake is not None:
+                wake.clear()
+                # Algo cambió en adb (p.ej. reinicio al bootloader): sondear rápido un rato.
+                self._hot_until = time.monotonic() + FASTBOOT_HOT_WINDOW
+
+    def _track_adb(self):
+        client = native_client()
+        if client is not None:
+            try:
+                for devices in client.track_devices(self._stop):
+                    self._update('adb', dict(devices))
+                return
+            except (OSError, AdbError):
+                pass
+        self._poll('adb', adb_device_states)
+
+    def _poll_fastboot(self):
+        self._poll('fastboot', lambda: {serial: 'fastboot' for serial in list_fastboot_devices()}, wake=self._kick)
+
+    def state(self, serial):
+        """Estado actual de `serial`: el de adb, `fastboot` o `disconnected`."""
+        if serial in self._states['fastboot']:
+            return 'fastboot'
+        return self._states['adb'].get(serial, 'disconnected')
+
+    def serials(self):
+        return set(self._states['adb']) | set(self._states['fastboot'])
+
+    def _match(self, serial, states):
+        if not all(self._ready.values()):
+            return None
+        if serial is not None:
+            state = self.state(serial)
+            return (serial, state) if state in states else None
+        if 'disconnected' in states and not self.serials():
+            return (None, 'disconnected')
+        for candidate in sorted(self.serials()):
+            if self.state(candidate) in states:
+                return candidate, self.state(candidate)
+        return None
+
+    def wait_for(self, serial, states, timeout=None):
+        """Espera a que `serial` (o cualquier dispositivo si es None) esté en uno de `states`.
+
+        Devuelve `(serial, estado)`, o None si vence `timeout` (segundos; None = sin límite).
+        """
+        states = {'fastboot' if st == 'bootloader' else st for st in states}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                found = self._match(serial, states)
+                if found is not None:
+                    return found
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(0.5 if remaining is None else min(remaining, 0.5))
+                check_cancelled()
+
+    def only_device(self):
+        """El único dispositivo conectado (adb o fastboot); sale con error si hay ninguno o varios."""
+        self.wait_for(None, set(WAIT_STATES), timeout=None)
+        serials = self.serials()
+        if len(serials) != 1:
+            echo('No hay ningún dispositivo conectado.' if not serials else
+                 f'Hay varios dispositivos ({", ".join(sorted(serials))}); elige uno con --serial.')
+            sys.exit(1)
+        return serials.pop()
+
+
+_shared_tracker = {'tracker': None, 'users': 0}
+_shared_tracker_lock = threading.Lock()
+
+
+@contextmanager
+def device_tracker():
+    """`DeviceTracker` compartido por el proceso mientras alguien lo use.
+
+    Los workers de flota que esperan a la vez usan el mismo, así que hay una
+    sola suscripción a adb y un solo sondeo de `fastboot devices`.
+    """
+    with _shared_tracker_lock:
+        if _shared_tracker['users'] == 0:
+            _shared_tracker['tracker'] = DeviceTracker().__enter__()
+        _shared_tracker['users'] += 1
+        tracker = _shared_tracker['tracker']
+    try:
+        yield tracker
+    finally:
+        with _shared_tracker_lock:
+            _shared_tracker['users'] -= 1
+            if _shared_tracker['users'] == 0:
+                _shared_tracker['tracker'] = None
+                tracker.__exit__(None, None, None)
+
+
+def _wait_timeout(timeout):
+    return None if not timeout else timeout
+
+
+def reboot_and_wait(issue, target, timeout=None):
+    """Ejecuta `issue()` (el comando de reinicio) y espera a que el dispositivo llegue a `target`.
+
+    Si ya estaba en ese estado, primero espera a que lo abandone para no dar por
+    bueno el estado anterior al reinicio. Sale con error si vence `timeout`.
+    Tras `issue()` se descarta el snapshot de `device_props` (el build puede
+    haber cambiado con el flasheo).
+    """
+    start = time.monotonic()
+    with device_tracker() as tracker:
+        serial = current_serial() or tracker.only_device()
+        tracker.wait_for(serial, set(WAIT_STATES))
+        before = tracker.state(serial)
+        issue()
+        invalidate_props()
+        found = True
+        if before == target:
+            found = tracker.wait_for(serial, set(WAIT_STATES) - {target}, timeout)
+        if found is not None:
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+            found = tracker.wait_for(serial, {target}, remaining)
+    if found is None:
+        echo(f'Tiempo agotado esperando a que {serial} pase a `{target}` ({timeout:.0f}s).')
+        sys.exit(1)
+    echo(f'{serial}: {target} en {time.monotonic() - start:.1f}s')
+    return serial
+
+
+def enter_bootloader(timeout=None):
+    """Reinicia el dispositivo actual al bootloader (si no está ya) y espera a verlo en fastboot."""
+    with device_tracker() as tracker:
+        serial = current_serial() or tracker.only_device()
+        tracker.wait_for(serial, set(WAIT_STATES))
+        if tracker.state(serial) == 'fastboot':
+            return serial
+    echo('Reiniciando al bootloader...')
+    return reboot_and_wait(lambda: run(adb_cmd('reboot', 'bootloader')), 'fastboot', timeout)
+
+
+@click.group()
+@click.option('--transport', type=click.Choice(['auto', 'native', 'subprocess']), default=TRANSPORT['mode'], show_default=True,
+              help='Cómo hablar con adb: servidor adb directo (native), ejecutable `adb` (subprocess) o auto')
+@click.option('--serial', '-s', 'serials', multiple=True, help='Serial del dispositivo (repetible para varios)')
+@click.option('--all-devices', is_flag=True, help='Ejecutar en todos los dispositivos conectados')
+@click.option('--jobs', '-j', type=click.IntRange(min=1), default=8, show_default=True, help='Dispositivos en paralelo en modo flota')
+@click.option('--trace', 'trace_path', type=click.Path(dir_okay=False), help='Registra cada comando y transferencia (JSON por línea) en este archivo')
+@click.option('--stats', is_flag=True, help='Muestra al final un resumen de tiempos y throughput por operación')
+@click.pass_context
+def cli(ctx, transport, serials, all_devices, jobs, trace_path, stats):
+    """Herramienta multi-uso para Redmi A2 Lite (Windows / Linux / macOS)."""
+    TRANSPORT['mode'] = transport
+    if trace_path or stats:
+        tracer = Tracer(trace_path)
+        _tracer_var.set(tracer)
+        ctx.call_on_close(tracer.close)
+    serials = tuple(dict.fromkeys(serials))
+    _fleet_var.set({'serials': serials, 'all_devices': all_devices, 'jobs': jobs})
+    sub = cli.commands.get(ctx.invoked_subcommand) if ctx.invoked_subcommand else None
+    fleet_capable = sub is not None and hasattr(sub.callback, 'fleet_kind')
+    if (all_devices or len(serials) > 1) and sub is not None and not fleet_capable:
+        raise click.UsageError(f'`{ctx.invoked_subcommand}` no admite varios dispositivos; usa un solo --serial.')
+    if len(serials) == 1 and not all_devices:
+        _serial_var.set(serials[0])
+
+
+@cli.command()
+def check_tools():
+    """Verifica que `adb` y `fastboot` estén en PATH."""
+    adb = which_ok('adb')
+    fb = which_ok('fastboot')
+    echo(f"adb: {'OK' if adb else 'NO ENCONTRADO'}")
+    echo(f"fastboot: {'OK' if fb else 'NO ENCONTRADO'}")
+    client = probe_native() if TRANSPORT['mode'] != 'subprocess' else None
+    if client is not None:
+        echo(f'servidor adb (nativo): OK en {client.host}:{client.port}')
+    elif TRANSPORT['mode'] != 'subprocess':
+        echo('servidor adb (nativo): no disponible, se usará el ejecutable adb')
+    if not adb or not fb:
+        echo("Instala Android platform-tools y asegúrate que estén en PATH.")
+
+
+@cli.command()
+def devices():
+    """Lista dispositivos conectados (modo ADB y Fastboot)."""
+    if which_ok('adb'):
+        out = run(['adb', 'devices'], capture=True)
+        echo('--- adb devices ---')
+        echo(out)
+    else:
+        echo('adb no encontrado')
+    if which_ok('fastboot'):
+        out = run(['fastboot', 'devices'], capture=True)
+        echo('--- fastboot devices ---')
+        echo(out)
+    else:
+        echo('fastboot no encontrado')
+
+
+@cli.command()
+@fleet_command()
+def info():
+    """Muestra información básica del dispositivo vía ADB."""
+    if not adb_ok():
+        echo('adb no encontrado')
+        sys.exit(1)
+    props = device_props()
+    for p in ['ro.product.model', 'ro.build.version.release', 'ro.build.version.sdk', 'ro.serialno']:
+        echo(f"{p}: {props.get(p, '').strip()}")
+
+
+@cli.command()
+@click.argument('target', type=click.Choice(['device','bootloader','recovery']))
+@click.option('--wait', is_flag=True, help='Esperar a que el dispositivo llegue al modo pedido')
+@click.option('--timeout', type=float, default=0, help='Con --wait: segundos máximos de espera (0 = sin límite)')
+@fleet_command()
+def reboot(target, wait, timeout):
+    """Reinicia: `device`, `bootloader`, `recovery`."""
+    if not adb_ok():
+        echo('adb no encontrado')
+        sys.exit(1)
+    if target == 'device':
+        cmd = adb_cmd('reboot')
+    elif target == 'bootloader':
+        cmd = adb_cmd('reboot', 'bootloader')
+    elif target == 'recovery':
+        cmd = adb_cmd('reboot', 'recovery')
+    if wait:
+        reboot_and_wait(lambda: run(cmd), 'fastboot' if target == 'bootloader' else target, _wait_timeout(timeout))
+    else:
+        run(cmd)
+        invalidate_props()
+
+
+@cli.command()
+@click.argument('state', type=click.Choice(WAIT_STATES))
+@click.option('--timeout', type=float, default=0, help='Segundos máximos de espera (0 = sin límite)')
+@fleet_command()
+def wait_for(state, timeout):
+    """Espera a que el dispositivo esté en STATE (`fastboot`/`bootloader`, `device`, `recovery`, `disconnected`...).
+
+    Sin --serial espera a cualquier dispositivo. Vuelve en cuanto el estado
+    cambia (eventos de adb; fastboot se sondea con backoff), sin `sleep` fijos.
+    """
+    start = time.monotonic()
+    with device_tracker() as tracker:
+        found = tracker.wait_for(current_serial(), {state}, _wait_timeout(timeout))
+    if found is None:
+        echo(f'Tiempo agotado esperando el estado `{state}` ({timeout:.0f}s).')
+        sys.exit(1)
+    echo(f'{found[0] or "dispositivos"}: {found[1]} en {time.monotonic() - start:.1f}s')
+
+
+# Verificación de imágenes: sha256 en paralelo con caché persistente
+
+CACHE_DIR = Path(os.environ.get('REDMI_TOOL_CACHE') or Path.home() / '.cache' / 'redmi-a2-lite-tool')
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def sha256_file(path):
+    """sha256 de un archivo recorriéndolo por mmap en bloques (hashlib libera el GIL)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for off in range(0, size, HASH_CHUNK):
+                    h.update(view[off:off + HASH_CHUNK])
+            finally:
+                view.release()
+    return h.hexdigest()
+
+
+class HashCache:
+    """Caché persistente de sha256 indexada por (ruta, tamaño, mtime).
+
+    Re-flashear el mismo paquete en el siguiente dispositivo de la línea no
+    vuelve a leer las imágenes. Dos hilos que piden la misma clave esperan
+    al primer cálculo en vez de repetirlo. Varios procesos (uno por
+    dispositivo, trabajos de la GUI) comparten el archivo: `save` relee y
+    fusiona bajo `hashes.lock` en vez de pisar lo que guardaron los demás.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or CACHE_DIR / 'hashes.json')
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = None
+        self._changed = set()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def cached(self, key, stamp, compute):
+        """Devuelve el hash guardado para `key` si `stamp` coincide; si no, `compute()`."""
+        stamp = list(stamp)
+        with self._lock:
+            entries = self._load()
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                hit = entries.get(key)
+            if hit and hit[:-1] == stamp:
+                return hit[-1]
+            digest = compute()
+            with self._lock:
+                entries[key] = stamp + [digest]
+                self._changed.add(key)
+        return digest
+
+    def sha256(self, path):
+        real = str(Path(path).resolve())
+        st = os.stat(real)
+        return self.cached(real, (st.st_size, st.st_mtime_ns), lambda: sha256_file(real))
+
+    def save(self):
+        """Fusiona las entradas calculadas aquí con las del disco y lo reescribe."""
+        with self._lock:
+            if not self._changed:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            lock = open(self.path.with_name(self.path.stem + '.lock'), 'a+b')
+            try:
+                _lock_fh(lock)
+                entries = self._read()
+                entries.update((key, self._entries[key]) for key in self._changed)
+                tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self.path)
+            finally:
+                _unlock_fh(lock)
+            self._entries.update(entries)
+            self._changed.clear()
+
+
+HASH_CACHE = HashCache()
+
+
+# Imágenes dentro de ZIPs de firmware (`rom.zip!images/boot.img`) sin extracción completa
+
+ZIP_MEMBER_RE = re.compile(r'^(.*?\.zip)!(.+)$', re.I)
+ZIP_MANIFEST_NAMES = ('flash-manifest.json', 'manifest.json')
+SCRATCH_MAX_BYTES = int(float(os.environ.get('REDMI_SCRATCH_MAX_GB', '8')) * 1024 ** 3)
+COPY_CHUNK = 4 * 1024 * 1024
+
+
+def _zip_member_offset(f, info):
+    """Offset de los datos de un miembro (tras su cabecera local) dentro del ZIP."""
+    f.seek(info.header_offset)
+    header = f.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise click.ClickException(f'Cabecera ZIP inválida para {info.filename}')
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    return info.header_offset + 30 + name_len + extra_len
+
+
+def _lock_fh(fh, blocking=True):
+    """Bloqueo exclusivo entre procesos sobre el archivo abierto `fh` (flock / msvcrt)."""
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    else:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_fh(fh):
+    if fcntl is None:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+    fh.close()
+
+
+class ScratchCache:
+    """Carpeta acotada (LRU) para los miembros de ZIP que fastboot necesita como archivo.
+
+    fastboot sólo acepta rutas, así que cada miembro se materializa justo antes
+    de flashearlo; las entradas menos usadas se eliminan al superar `max_bytes`
+    y las que están en uso nunca se eliminan.
+
+    La carpeta se comparte entre procesos (uno por dispositivo de la línea):
+    el índice se relee y se guarda bajo `index.lock` en cada cambio, y cada
+    proceso marca las entradas que usa con un `NOMBRE.PID.pin` bloqueado, que
+    los demás respetan al desalojar.
+    """
+
+    def __init__(self, root=None, max_bytes=SCRATCH_MAX_BYTES):
+        self.root = Path(root or CACHE_DIR / 'scratch')
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._pinned = {}
+        self._pin_files = {}
+
+    @contextmanager
+    def _index(self):
+        """Índice actual del disco, bajo el bloqueo entre procesos; se guarda al salir."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        lock = open(self.root / 'index.lock', 'a+b')
+        try:
+            _lock_fh(lock)
+            try:
+                with open(self.root / 'index.json', 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            yield index
+            tmp = self.root / f'index.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp, self.root / 'index.json')
+        finally:
+            _unlock_fh(lock)
+
+    def _pin(self, name):
+        with self._lock:
+            self._pinned[name] = self._pinned.get(name, 0) + 1
+            if self._pinned[name] > 1:
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            fh = open(self.root / f'{name}.{os.getpid()}.pin', 'a+b')
+            _lock_fh(fh)
+            self._pin_files[name] = fh
+
+    def _unpin(self, name):
+        with self._lock:
+            self._pinned[name] -= 1
+            if self._pinned[name]:
+                return
+            del self._pinned[name]
+            fh = self._pin_files.pop(name)
+        _unlock_fh(fh)
+        Path(fh.name).unlink(missing_ok=True)
+
+    def _in_use(self, name):
+        """True si este u otro proceso tiene `name` en uso (pin bloqueado)."""
+        if self._pinned.get(name):
+            return True
+        for pin in self.root.glob(f'{name}.*.pin'):
+            try:
+                fh = open(pin, 'a+b')
+            except OSError:
+                return True
+            try:
+                _lock_fh(fh, blocking=False)
+            except OSError:
+                fh.close()
+                return True
+            # Pin de un proceso que ya terminó: se limpia.
+            _unlock_fh(fh)
+            pin.unlink(missing_ok=True)
+        return False
+
+    def _evict(self, index, needed):
+        used = sum(e['size'] for e in index.values())
+        for name in sorted(index, key=lambda n: index[n]['used']):
+            if used + needed <= self.max_bytes:
+                break
+            if self._in_use(name):
+                continue
+            try:
+                (self.root / name).unlink(missing_ok=True)
+            except OSError:
+                continue  # Windows: otro proceso lo tiene abierto
+            used -= index.pop(name)['size']
+
+    @contextmanager
+    def materialize(self, key, size, writer):
+        """Entrega una ruta con el contenido de `key`, escribiéndolo con `writer(ruta)` si falta."""
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.img'
+        path = self.root / name
+        with self._lock:
+            key_lock = self._key_locks.setdefault(name, threading.Lock())
+        self._pin(name)
+        try:
+            with key_lock:
+                with self._index() as index:
+                    entry = index.get(name)
+                    fresh = entry is not None and entry['key'] == key and path.exists() and path.stat().st_size == size
+                    if not fresh:
+                        self._evict(index, size)
+                if not fresh:
+                    tmp = path.with_name(f'{name}.{os.getpid()}.part')
+                    writer(tmp)
+                    os.replace(tmp, path)
+                with self._index() as index:
+                    index[name] = {'key': key, 'size': size, 'used': time.time()}
+            yield str(path)
+        finally:
+            self._unpin(name)
+            with self._index() as index:
+                self._evict(index, 0)
+
+
+SCRATCH = ScratchCache()
+
+
+class ImageSource:
+    """Imagen a flashear: archivo suelto o miembro `archivo.zip!ruta/imagen.img`.
+
+    Los miembros almacenados sin comprimir (ZIP_STORED) se hashean directamente
+    sobre el mmap del ZIP, sin copia; sólo se materializan en `SCRATCH` cuando
+    fastboot necesita la ruta.
+    """
+
+    def __init__(self, ref):
+        self.ref = ref
+        m = ZIP_MEMBER_RE.match(ref) if not Path(ref).exists() else None
+        self.archive, self.member = (m.group(1), m.group(2)) if m else (None, None)
+        self._zinfo = None
+
+    def _info(self):
+        # Se lee el directorio central una sola vez por imagen.
+        if self._zinfo is None:
+            with zipfile.ZipFile(self.archive) as zf:
+                self._zinfo = zf.getinfo(self.member)
+        return self._zinfo
+
+    def exists(self):
+        if self.archive is None:
+            return Path(self.ref).is_file()
+        try:
+            self._info()
+            return True
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return False
+
+    @property
+    def size(self):
+        return self._info().file_size if self.archive else Path(self.ref).stat().st_size
+
+    @property
+    def stored(self):
+        return self.archive is not None and self._info().compress_type == zipfile.ZIP_STORED
+
+    def _key(self):
+        real = str(Path(self.archive).resolve())
+        st = os.stat(real)
+        return f'{real}!{self.member}', (st.st_size, st.st_mtime_ns)
+
+    def sha256(self):
+        if self.archive is None:
+            return HASH_CACHE.sha256(self.ref)
+        key, stamp = self._key()
+        return HASH_CACHE.cached(key, stamp, self._hash_member)
+
+    def _hash_member(self):
+        h = hashlib.sha256()
+        info = self._info()
+        if info.compress_type == zipfile.ZIP_STORED and info.file_size:
+            with open(self.archive, 'rb') as f:
+                start = _zip_member_offset(f, info)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        for off in range(start, start + info.file_size, HASH_CHUNK):
+                            h.update(view[off:min(off + HASH_CHUNK, start + info.file_size)])
+                    finally:
+                        view.release()
+            return h.hexdigest()
+        with zipfile.ZipFile(self.archive) as zf, zf.open(info) as src:
+            for chunk in iter(lambda: src.read(HASH_CHUNK), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _extract_to(self, dest):
+        info = self._info()
+        with open(dest, 'wb') as out:
+            if info.compress_type == zipfile.ZIP_STORED:
+                with open(self.archive, 'rb') as f:
+                    f.seek(_zip_member_offset(f, info))
+                    remaining = info.file_size
+                    while remaining:
+                        chunk = f.read(min(COPY_CHUNK, remaining))
+                        if not chunk:
+                            raise click.ClickException(f'{self.ref}: ZIP truncado')
+                        out.write(chunk)
+                        remaining -= len(chunk)
+            else:
+                with zipfile.ZipFile(self.archive) as zf, zf.open(info) as src:
+                    shutil.copyfileobj(src, out, COPY_CHUNK)
+
+    @contextmanager
+    def local_path(self):
+        """Ruta que se puede pasar a fastboot (materializada en scratch si es un miembro)."""
+        if self.archive is None:
+            yield self.ref
+            return
+        key, stamp = self._key()
+        with SCRATCH.materialize(f'{key}@{stamp[0]}:{stamp[1]}', self.size, self._extract_to) as path:
+            yield path
+
+
+def actions_from_zip(archive):
+    """Acciones de un ZIP de firmware: su manifiesto interno o, si no hay, un `*.img` por partición."""
+    with zipfile.ZipFile(archive) as zf:
+        names = zf.namelist()
+        for candidate in ZIP_MANIFEST_NAMES:
+            if candidate in names:
+                data = json.loads(zf.read(candidate).decode('utf-8'))
+                actions = data.get('actions', [])
+                for a in actions:
+                    if a.get('image') and not ZIP_MEMBER_RE.match(a['image']):
+                        a['image'] = f"{archive}!{a['image']}"
+                return actions
+    return [{'partition': Path(name).stem, 'image': f'{archive}!{name}'}
+            for name in names if name.lower().endswith('.img')]
+
+
+def hash_images(refs, workers=None):
+    """sha256 de varias imágenes (rutas o `zip!miembro`) en paralelo, con caché. Devuelve {ref: sha256}."""
+    unique = list(dict.fromkeys(refs))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=workers or min(4, len(unique))) as pool:
+        digests = dict(zip(unique, pool.map(lambda ref: ImageSource(ref).sha256(), unique)))
+    HASH_CACHE.save()
+    return digests
+
+
+def verify_images(actions):
+    """Comprueba los `size`/`sha256` opcionales de cada acción. Devuelve la lista de errores."""
+    errors = []
+    for a in actions:
+        size = a.get('size')
+        actual = ImageSource(a['image']).size if size is not None else None
+        if size is not None and actual != int(size):
+            errors.append(f"{a['image']}: tamaño {actual} != {size} esperado")
+    to_hash = [a['image'] for a in actions if a.get('sha256')]
+    if to_hash:
+        echo(f'Verificando sha256 de {len(set(to_hash))} imágenes...')
+        digests = hash_images(to_hash)
+        for a in actions:
+            expected = (a.get('sha256') or '').lower()
+            if expected and digests[a['image']] != expected:
+                errors.append(f"{a['image']}: sha256 {digests[a['image']]} != {expected} esperado")
+    return errors
+
+
+def abort_on_bad_images(actions):
+    errors = verify_images(actions)
+    if errors:
+        echo('Verificación de imágenes fallida, no se flasheará nada:')
+        for err in errors:
+            echo(f' - {err}')
+        sys.exit(1)
+
+
+# Imágenes sparse de Android: los bloques vacíos o repetidos no viajan por USB
+
+SPARSE_MAGIC = 0xED26FF3A
+SPARSE_BLOCK = 4096
+SPARSE_SCAN = 8 * 1024 * 1024
+SPARSE_DEFAULT_LIMIT = 256 * 1024 * 1024
+CHUNK_RAW, CHUNK_FILL, CHUNK_DONT_CARE = 0xCAC1, 0xCAC2, 0xCAC3
+SPARSE_HEADER = struct.Struct('<IHHHHIIII')
+CHUNK_HEADER = struct.Struct('<HHII')
+
+
+def is_sparse_image(path):
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    return len(head) == 4 and struct.unpack('<I', head)[0] == SPARSE_MAGIC
+
+
+def max_download_size():
+    """`max-download-size` del dispositivo en fastboot (o un valor prudente si no lo informa)."""
+    out = run(fastboot_cmd('getvar', 'max-download-size'), capture=True) or ''
+    m = re.search(r'max-download-size:\s*(0x[0-9a-fA-F]+|\d+)', out)
+    return int(m.group(1), 0) if m and int(m.group(1), 0) > 0 else SPARSE_DEFAULT_LIMIT
+
+
+def scan_blocks(path):
+    """Recorre la imagen por mmap y la resume en tramos `[tipo, bloque, nº bloques, relleno]`.
+
+    Un bloque cuyo contenido es un mismo valor de 32 bits repetido (ceros
+    incluidos) es FILL; el resto, RAW. Las ventanas enteras de ceros se
+    detectan sin mirar bloque a bloque.
+    """
+    runs = []
+
+    def add(kind, start, count, fill=0):
+        last = runs[-1] if runs else None
+        if last and last[0] == kind and last[3] == fill and last[1] + last[2] == start:
+            last[2] += count
+        else:
+            runs.append([kind, start, count, fill])
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for off in range(0, size, SPARSE_SCAN):
+            check_cancelled()
+            window = mm[off:off + SPARSE_SCAN]
+            first = off // SPARSE_BLOCK
+            if window.count(0) == len(window):
+                add(CHUNK_FILL, first, -(-len(window) // SPARSE_BLOCK))
+                continue
+            for i in range(0, len(window), SPARSE_BLOCK):
+                blk = window[i:i + SPARSE_BLOCK]
+                if len(blk) < SPARSE_BLOCK:
+                    blk += bytes(SPARSE_BLOCK - len(blk))
+                if blk[4:] == blk[:-4]:
+                    add(CHUNK_FILL, first + i // SPARSE_BLOCK, 1, struct.unpack_from('<I', blk)[0])
+                else:
+                    add(CHUNK_RAW, first + i // SPARSE_BLOCK, 1)
+    return runs
+
+
+def _chunk_bytes(kind, count):
+    if kind == CHUNK_RAW:
+        return CHUNK_HEADER.size + count * SPARSE_BLOCK
+    return CHUNK_HEADER.size + (4 if kind == CHUNK_FILL else 0)
+
+
+def plan_sparse(runs, total_blocks, limit, zeros='fill'):
+    """Reparte los tramos en imágenes sparse de como mucho `limit` bytes.
+
+    Cada pieza describe la partición entera: lo que va en otras piezas se
+    marca DONT_CARE, así que flashearlas una tras otra deja la imagen completa.
+    Con `zeros='dont-care'` los bloques de ceros tampoco se escriben.
+    """
+    overhead = SPARSE_HEADER.size + 2 * CHUNK_HEADER.size
+    if limit < overhead + _chunk_bytes(CHUNK_RAW, 1):
+        raise click.ClickException(f'max-download-size demasiado pequeño: {limit}')
+    pieces, chunks, size, cursor = [], [], overhead, 0
+
+    def close(end):
+        nonlocal chunks, size, cursor
+        body = ([[CHUNK_DONT_CARE, 0, cursor, 0]] if cursor else []) + chunks
+        if end < total_blocks:
+            body.append([CHUNK_DONT_CARE, end, total_blocks - end, 0])
+        pieces.append({'size': SPARSE_HEADER.size + sum(_chunk_bytes(c[0], c[2]) for c in body), 'chunks': body})
+        chunks, size, cursor = [], overhead, end
+
+    for kind, start, count, fill in runs:
+        if kind == CHUNK_FILL and fill == 0 and zeros == 'dont-care':
+            kind = CHUNK_DONT_CARE
+        while count:
+            room = limit - size
+            if kind == CHUNK_RAW:
+                take = min(count, (room - CHUNK_HEADER.size) // SPARSE_BLOCK)
+            else:
+                take = count if room >= _chunk_bytes(kind, count) else 0
+            if take <= 0:
+                close(start)
+                continue
+            chunks.append([kind, start, take, fill])
+            size += _chunk_bytes(kind, take)
+            start += take
+            count -= take
+    if chunks or not pieces:
+        close(total_blocks)
+    return pieces
+
+
+def write_sparse_piece(path, piece, total_blocks, dest):
+    """Escribe una pieza de `plan_sparse` copiando los bloques RAW desde el mmap de `path`."""
+    chunks = piece['chunks']
+    with open(path, 'rb') as src, open(dest, 'wb') as out, \
+            mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        out.write(SPARSE_HEADER.pack(SPARSE_MAGIC, 1, 0, SPARSE_HEADER.size, CHUNK_HEADER.size,
+                                     SPARSE_BLOCK, total_blocks, len(chunks), 0))
+        for kind, start, count, fill in chunks:
+            check_cancelled()
+            out.write(CHUNK_HEADER.pack(kind, 0, count, _chunk_bytes(kind, count)))
+            if kind == CHUNK_FILL:
+                out.write(struct.pack('<I', fill))
+            elif kind == CHUNK_RAW:
+                end = (start + count) * SPARSE_BLOCK
+                for off in range(start * SPARSE_BLOCK, end, COPY_CHUNK):
+                    want = min(COPY_CHUNK, end - off)
+                    data = mm[off:off + want]
+                    out.write(data)
+                    if len(data) < want:  # último bloque incompleto: se rellena con ceros
+                        out.write(bytes(want - len(data)))
+
+
+def sparse_plan(source, path, zeros, limit):
+    """Plan sparse de `source` (cacheado por sha256 de la imagen), o None si no compensa.
+
+    No compensa si la imagen ya es sparse (fastboot la reparte él mismo), está
+    vacía o no tiene ningún bloque que se pueda omitir.
+    """
+    if os.path.getsize(path) == 0 or is_sparse_image(path):
+        return None
+    digest = source.sha256()
+    HASH_CACHE.save()
+    cache = CACHE_DIR / 'sparse' / f'{digest}-{zeros}-{limit}.json'
+    try:
+        with open(cache, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    runs = scan_blocks(path)
+    total_blocks = -(-os.path.getsize(path) // SPARSE_BLOCK)
+    plan = None
+    if any(kind != CHUNK_RAW for kind, *_ in runs):
+        plan = {'sha256': digest, 'total_blocks': total_blocks,
+                'pieces': plan_sparse(runs, total_blocks, limit, zeros)}
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_name(f'{cache.name}.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(plan, f)
+    os.replace(tmp, cache)
+    return plan
+
+
+def flash_image(partition, ref, zeros=None, limit=None):
+    """Flashea `ref` (ruta o `zip!miembro`).
+
+    Con `zeros` ('fill' o 'dont-care') la imagen se convierte a formato sparse
+    partido según `limit` (max-download-size) y cada pieza se flashea por
+    separado. Las piezas se guardan en `SCRATCH`, así que repetir el flasheo
+    de la misma imagen no vuelve a convertirla.
+    """
+    source = ImageSource(ref)
+    if zeros and not limit:
+        limit = max_download_size()
+    with source.local_path() as path:
+        plan = sparse_plan(source, path, zeros, limit) if zeros else None
+        if plan is None:
+            exec_cmd(fastboot_cmd('flash', partition, path), nbytes=os.path.getsize(path))
+            return
+        pieces = plan['pieces']
+        sent = sum(p['size'] for p in pieces)
+        echo(f'{ref}: {os.path.getsize(path) / 1e6:.1f} MB -> {sent / 1e6:.1f} MB en '
+             f'{len(pieces)} pieza(s) sparse')
+        for i, piece in enumerate(pieces):
+            key = f"sparse:{plan['sha256']}:{zeros}:{limit}:{i}"
+            writer = functools.partial(write_sparse_piece, path, piece, plan['total_blocks'])
+            with SCRATCH.materialize(key, piece['size'], writer) as piece_path:
+                exec_cmd(fastboot_cmd('flash', partition, piece_path), nbytes=piece['size'])
+
+
+@cli.command()
+@click.argument('partition')
+@click.argument('image', type=click.Path(exists=True))
+@click.option('--use-fastboot', is_flag=True, help='Usar fastboot directamente (requiere estar en modo bootloader)')
+@click.option('--confirm', is_flag=True, help='Confirma que entiendes los riesgos del flasheo')
+@click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
+@click.option('--validate-device', is_flag=True, help='Validar que sea un Redmi A2 Lite antes de flashear')
+@click.option('--sha256', 'expected_sha256', help='sha256 esperado de la imagen; aborta si no coincide')
+@click.option('--reboot-bootloader', is_flag=True, help='Reiniciar al bootloader, esperar, flashear y reiniciar al sistema')
+@click.option('--wait-timeout', type=float, default=0, help='Con --reboot-bootloader: segundos máximos por transición (0 = sin límite)')
+@click.option('--sparse', is_flag=True, help='Convertir a imagen sparse (sin enviar bloques vacíos) partida según max-download-size')
+@click.option('--sparse-zeros', type=click.Choice(['fill', 'dont-care']), default='fill', show_default=True,
+              help='Con --sparse: los bloques de ceros se escriben (fill) o se dejan como están (dont-care)')
+def flash(partition, image, use_fastboot, confirm, dry_run, validate_device, expected_sha256, reboot_bootloader, wait_timeout,
+          sparse, sparse_zeros):
+    """Flashea una imagen en partición vía fastboot. Ej: `recovery twrp.img`"""
+    if not which_ok('fastboot'):
+        echo('fastboot no encontrado')
+        sys.exit(1)
+    if expected_sha256:
+        abort_on_bad_images([{'partition': partition, 'image': image, 'sha256': expected_sha256}])
+    if validate_device and not validate_redmi_a2_lite():
+        sys.exit(1)
+    if not confirm:
+        if not confirm_prompt('Comando peligroso: flashear puede borrar datos o dañar el dispositivo. ¿Deseas continuar?'):
+            echo('Operación cancelada por usuario.')
+            sys.exit(2)
+    if reboot_bootloader and not dry_run:
+        enter_bootloader(_wait_timeout(wait_timeout))
+    elif not use_fastboot:
+        echo('Asegúrate que el dispositivo esté en bootloader/fastboot mode.')
+    if dry_run:
+        exec_cmd(fastboot_cmd('flash', partition, image), dry_run=True)
+    else:
+        flash_image(partition, image, sparse_zeros if sparse else None)
+    echo('Flash completado (revisa la salida anterior para errores).')
+    if reboot_bootloader and not dry_run:
+        reboot_and_wait(lambda: run(fastboot_cmd('reboot')), 'device', _wait_timeout(wait_timeout))
+
+
+@cli.command()
+@click.argument('file', type=click.Path(exists=True))
+@click.option('--confirm', is_flag=True, help='Confirma que entiendes el uso de sideload')
+@click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
+@fleet_command()
+def sideload(file, confirm, dry_run):
+    """Instala un paquete via `adb sideload` (modo recovery)."""
+    if not which_ok('adb'):
+        echo('adb no encontrado')
+        sys.exit(1)
+    if not confirm:
+        if not confirm_prompt('Sideload puede modificar el sistema. ¿Deseas continuar?'):
+            echo('Operación cancelada por usuario.')
+            sys.exit(2)
+    echo('Este comando requiere que el dispositivo esté en modo recovery en "Apply update from ADB"')
+    exec_cmd(adb_cmd('sideload', file), dry_run=dry_run, nbytes=os.path.getsize(file))
+
+
+@cli.command()
+@click.argument('src', type=click.Path())
+@click.argument('dst', type=click.Path())
+def pull(src, dst):
+    """Descarga un archivo o carpeta del dispositivo: `pull /sdcard/DCIM ./backup`"""
+    if not which_ok('adb'):
+        echo('adb no encontrado')
+        sys.exit(1)
+    run(adb_cmd('pull', src, dst))
+    echo('Pull completado.')
+
+
+@cli.command()
+@click.argument('src', type=click.Path())
+@click.argument('dst', type=click.Path())
+@fleet_command()
+def push(src, dst):
+    """Sube un archivo al dispositivo: `push update.zip /sdcard/`"""
+    if not which_ok('adb'):
+        echo('adb no encontrado')
+        sys.exit(1)
+    run(adb_cmd('push', src, dst), nbytes=os.path.getsize(src) if os.path.isfile(src) else 0)
+    echo('Push completado.')
+
+
+# Backup incremental: manifiesto local + listado remoto en una sola llamada
+
+BACKUP_MANIFEST = '.backup-manifest.json'
+PULL_BATCH_CHARS = 8000
+_LISTING_END = '__REDMI_LISTING_OK__'
+
+
+def is_excluded(rel, exclude):
+    """Aplica las exclusiones al estilo rsync sobre una ruta relativa (`a/b/c`).
+
+    Un patrón sin `/` excluye cualquier componente con ese nombre (p.ej.
+    `.thumbnails`); con `/` excluye esa ruta relativa y todo lo que cuelga de ella.
+    """
+    parts = rel.split('/')
+    for pattern in exclude:
+        pattern = pattern.strip('/')
+        if not pattern:
+            continue
+        if '/' in pattern:
+            if rel == pattern or rel.startswith(pattern + '/'):
+                return True
+        elif pattern in parts[:-1] or pattern == parts[-1]:
+            return True
+    return False
+
+
+def list_remote_tree(root, exclude=()):
+    """Lista los archivos bajo `root` con una sola llamada `find`/`stat` en el dispositivo.
+
+    Devuelve {ruta_relativa: (size, mtime)}. Las exclusiones se podan en el
+    propio `find` para no recorrer (ni hacer stat de) carpetas excluidas.
+    """
+    prunes = []
+    for pattern in exclude:
+        pattern = pattern.strip('/')
+        if pattern:
+            test = '-path' if '/' in pattern else '-name'
+            prunes.append(f"{test} {shlex.quote('./' + pattern if '/' in pattern else pattern)}")
+    prune = f"\\( {' -o '.join(prunes)} \\) -prune -o " if prunes else ''
+    script = (f"cd {shlex.quote(root)} && {{ find . {prune}-type f -exec stat -c '%s %Y %n' {{}} + 2>/dev/null; "
+              f"echo {_LISTING_END}; }}")
+    out = run(adb_cmd('shell', script), capture=True) or ''
+    if _LISTING_END not in out:
+        raise click.ClickException(f'No se pudo listar {root} en el dispositivo: {out.strip()[:200]}')
+    tree = {}
+    for line in out.splitlines():
+        parts = line.rstrip('\r').split(' ', 2)
+        if len(parts) != 3 or not parts[2].startswith('./'):
+            continue
+        try:
+            size, mtime = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        rel = parts[2][2:]
+        if not is_excluded(rel, exclude):
+            tree[rel] = (size, mtime)
+    return tree
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {rel: tuple(v) for rel, v in data.get('files', {}).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, root, files):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'root': root, 'files': {rel: list(v) for rel, v in sorted(files.items())}}, f)
+    os.replace(tmp, path)
+
+
+def plan_backup(remote, manifest, local_root, exclude=(), full=False):
+    """Compara el listado remoto con el manifiesto. Devuelve (a_descargar, borrados)."""
+    changed = [rel for rel, meta in remote.items()
+               if full or manifest.get(rel) != meta or not (local_root / rel).exists()]
+    deleted = [rel for rel in manifest if rel not in remote and not is_excluded(rel, exclude)]
+    return sorted(changed), sorted(deleted)
+
+
+def _pull_batches(root, rels):
+    """Agrupa archivos por carpeta en llamadas `adb pull a b c DIR` acotadas en longitud."""
+    by_dir = {}
+    for rel in rels:
+        by_dir.setdefault(rel.rpartition('/')[0], []).append(rel)
+    for parent, items in by_dir.items():
+        batch, size = [], 0
+        for rel in items:
+            batch.append(rel)
+            size += len(root) + len(rel) + 3
+            if size >= PULL_BATCH_CHARS:
+                yield parent, batch
+                batch, size = [], 0
+        if batch:
+            yield parent, batch
+
+
+def _in_pool(func, items, workers):
+    """Aplica `func` a `items` en un pool (cada tarea con el contexto del llamador); entrega los resultados según terminan."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for fut in as_completed([pool.submit(contextvars.copy_context().run, func, item) for item in items]):
+            yield fut.result()
+
+
+def pull_files(root, rels, local_root, remote, on_done, workers=4):
+    """Descarga `rels` (relativos a `root`) a `local_root` y llama `on_done(rel)` por cada uno.
+
+    Con transporte nativo cada worker reutiliza una sesión `sync:` del pool;
+    si no, se agrupan en llamadas `adb pull` por carpeta, `workers` a la vez.
+    """
+    client = native_client()
+    if client is not None:
+        serial = current_serial()
+
+        def fetch(rel):
+            dest = local_root / rel
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            client.pull_file(f'{root}/{rel}', str(dest), serial)
+            mtime = remote[rel][1]
+            os.utime(dest, (mtime, mtime))
+            return rel
+
+        for rel in _in_pool(fetch, rels, workers):
+            on_done(rel)
+        return
+
+    def fetch_batch(item):
+        parent, batch = item
+        dest_dir = local_root / parent
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        run(adb_cmd('pull', '-a', *[f'{root}/{rel}' for rel in batch], str(dest_dir)),
+            nbytes=sum(remote[rel][0] for rel in batch))
+        return batch
+
+    for batch in _in_pool(fetch_batch, list(_pull_batches(root, rels)), workers):
+        for rel in batch:
+            on_done(rel)
+
+
+def tar_exclude_args(exclude):
+    """Traduce las exclusiones de `backup` a opciones `--exclude` de tar."""
+    args = []
+    for pattern in exclude:
+        pattern = pattern.strip('/')
+        if pattern:
+            args.append(shlex.quote(f'--exclude=./{pattern}' if '/' in pattern else f'--exclude={pattern}'))
+    return args
+
+
+def _safe_member(member):
+    """Ruta relativa segura de un miembro tar (sin `./`, absolutas ni `..`), o None."""
+    name = member.name[2:] if member.name.startswith('./') else member.name
+    if not name or name == '.' or Path(name).is_absolute() or '..' in Path(name).parts:
+        return None
+    return name
+
+
+ARCHIVE_CHUNK = 1024 * 1024
+
+
+class ArchiveWriter:
+    """Comprime en un hilo propio lo que recibe por una cola acotada.
+
+    `zip` (deflate) recibe archivo a archivo (`begin_file`/`write`/`end_file`);
+    `zstd` recibe el stream tar crudo (`write`) y usa `threads` hilos de zstd.
+    La cola limita la memoria y deja que USB y compresión avancen a la vez.
+    """
+
+    EXTENSIONS = {'zip': '.zip', 'zstd': '.tar.zst'}
+
+    def __init__(self, base, codec='zip', level=None, threads=0, queue_size=32):
+        if codec == 'zstd' and zstandard is None:
+            raise click.ClickException('El códec zstd requiere el paquete `zstandard` (pip install zstandard).')
+        self.codec = codec
+        self.path = f'{base}{self.EXTENSIONS[codec]}'
+        self.level = level
+        self.threads = threads or -1
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def begin_file(self, name, mtime, mode=0o644):
+        self._put(('begin', name, mtime, mode))
+
+    def write(self, data):
+        if data:
+            self._put(('data', data))
+
+    def end_file(self):
+        self._put(('end',))
+
+    def close(self, abort=False):
+        """Termina el archivo y espera al hilo.
+
+        Con `abort` (el productor falló a medias) no se relanza el error del
+        hilo, para no tapar el original.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None and not abort:
+            raise self._error
+
+    def _items(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._finished = True
+                return
+            yield item
+
+    def _run(self):
+        try:
+            with open(self.path, 'wb') as f:
+                if self.codec == 'zip':
+                    self._run_zip(f)
+                else:
+                    self._run_zstd(f)
+        except Exception as e:
+            self._error = e
+            # Vaciar la cola hasta el `None` de close() para no bloquear al productor
+            # (si ya llegó, no habrá otro).
+            while not self._finished and self._queue.get() is not None:
+                pass
+
+    def _run_zip(self, f):
+        level = 6 if self.level is None else self.level
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+            entry = None
+            try:
+                for item in self._items():
+                    if item[0] == 'begin':
+                        _, name, mtime, mode = item
+                        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                        setattr(zinfo, 'compress_level' if hasattr(zinfo, 'compress_level') else '_compresslevel', level)
+                        zinfo.external_attr = (mode & 0xFFFF) << 16
+                        entry = zf.open(zinfo, 'w', force_zip64=True)
+                    elif item[0] == 'data':
+                        entry.write(item[1])
+                    else:
+                        entry.close()
+                        entry = None
+            finally:
+                # close() a mitad de un archivo (corte USB, Ctrl+C, cancelación): se
+                # cierra la entrada tal cual para que el ZIP pueda cerrarse.
+                if entry is not None:
+                    entry.close()
+
+    def _run_zstd(self, f):
+        cctx = zstandard.ZstdCompressor(level=3 if self.level is None else self.level, threads=self.threads)
+        with cctx.stream_writer(f, closefd=False) as out:
+            for item in self._items():
+                out.write(item[1])
+
+
+class _TeeReader:
+    """Reenvía a `sink.write` todo lo que se lee de `raw` (stream tar crudo -> zstd)."""
+
+    def __init__(self, raw, sink):
+        self.raw = raw
+        self.sink = sink
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.sink.write(data)
+        return data
+
+
+def _copy_member(src, dest, archive):
+    with open(dest, 'wb') if dest is not None else nullcontext() as out:
+        while True:
+            chunk = src.read(ARCHIVE_CHUNK)
+            if not chunk:
+                break
+            if out is not None:
+                out.write(chunk)
+            if archive is not None:
+                archive.write(chunk)
+
+
+def stream_backup(root, local_root, exclude=(), archive=None, extract=True):
+    """Consume el `tar -c` del dispositivo mientras llega por exec-out.
+
+    Un único `tar` en el teléfono sustituye a miles de peticiones `sync:` por
+    archivo. Cada miembro se extrae a `local_root` (si `extract`) y/o se pasa
+    a `archive` en bloques de 1 MB: nunca se guarda el stream completo.
+    Devuelve ({ruta_relativa: (size, mtime)}, ThroughputReader).
+    """
+    command = ' '.join(['tar', '-cf', '-', '-C', shlex.quote(root), *tar_exclude_args(exclude), '.', '2>/dev/null'])
+    prefix = Path(root).name
+    per_file = archive is not None and archive.codec == 'zip'
+    files = {}
+    with adb_exec_out(command) as raw:
+        reader = ThroughputReader(raw)
+        source = _TeeReader(reader, archive) if archive is not None and not per_file else reader
+        with tarfile.open(fileobj=source, mode='r|') as tar:
+            for member in tar:
+                rel = _safe_member(member)
+                if rel is None or is_excluded(rel, exclude):
+                    continue
+                dest = local_root / rel if extract else None
+                if member.isdir():
+                    if dest is not None:
+                        dest.mkdir(parents=True, exist_ok=True)
+                    continue
+                if not member.isfile():
+                    continue
+                if dest is not None:
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                if per_file:
+                    archive.begin_file(f'{prefix}/{rel}', int(member.mtime), member.mode)
+                _copy_member(tar.extractfile(member), dest, archive if per_file else None)
+                if per_file:
+                    archive.end_file()
+                if dest is not None:
+                    os.utime(dest, (member.mtime, member.mtime))
+                files[rel] = (member.size, int(member.mtime))
+    return files, reader
+
+
+def archive_tree(dst, local_root, archive):
+    """Comprime el backup ya descargado (segunda pasada del modo pull).
+
+    Mismos nombres que el modo --stream: `sdcard/...` en zip y `./...`
+    (relativo a /sdcard, como el `tar` del dispositivo) en tar.zst.
+    """
+    base = Path(dst)
+    if archive.codec == 'zip':
+        for path in sorted(local_root.rglob('*')):
+            if not path.is_file():
+                continue
+            st = path.stat()
+            archive.begin_file(path.relative_to(base).as_posix(), int(st.st_mtime), st.st_mode)
+            with open(path, 'rb') as src:
+                _copy_member(src, None, archive)
+            archive.end_file()
+        return
+    with tarfile.open(fileobj=archive, mode='w|') as tar:
+        tar.add(local_root, arcname='.')
+
+
+def _incremental_backup(root, local_root, manifest_path, exclude, full, dry_run):
+    """Backup por diferencias contra el manifiesto de la ejecución anterior."""
+    echo(f'Listando {root} en el dispositivo...')
+    remote = list_remote_tree(root, exclude)
+    # También con --full: el manifiesto anterior dice qué se borró en el dispositivo.
+    manifest = load_manifest(manifest_path)
+    changed, deleted = plan_backup(remote, manifest, local_root, exclude, full)
+    total_bytes = sum(remote[rel][0] for rel in changed)
+    echo(f'{len(remote)} archivos en el dispositivo: {len(changed)} nuevos/modificados '
+         f'({total_bytes / 1048576:.1f} MB), {len(deleted)} eliminados, '
+         f'{len(remote) - len(changed)} sin cambios')
+    if dry_run:
+        for rel in changed:
+            echo(f'DRY-RUN: pull {root}/{rel}')
+        for rel in deleted:
+            echo(f'DRY-RUN: borrar {local_root / rel}')
+        return
+    files = {rel: meta for rel, meta in manifest.items() if rel in remote}
+    for rel in deleted:
+        (local_root / rel).unlink(missing_ok=True)
+    progress = {'n': 0}
+
+    def done(rel):
+        files[rel] = remote[rel]
+        progress['n'] += 1
+        if progress['n'] % 100 == 0 or progress['n'] == len(changed):
+            echo(f'  {progress["n"]}/{len(changed)} archivos descargados')
+        report_progress(progress['n'], len(changed))
+
+    try:
+        if changed:
+            echo(f'Descargando cambios de {root} ... (esto puede tardar)')
+            pull_files(root, changed, local_root, remote, done)
+    finally:
+        save_manifest(manifest_path, root, files)
+
+
+def _stream_backup(root, local_root, manifest_path, exclude, archive, extract):
+    """Copia completa con un único stream tar; actualiza el manifiesto y los borrados."""
+    echo(f'Recibiendo {root} como stream tar ... (esto puede tardar)')
+    manifest = load_manifest(manifest_path)
+    try:
+        files, reader = stream_backup(root, local_root, exclude, archive, extract)
+    except BaseException:
+        if archive is not None:
+            archive.close(abort=True)
+        raise
+    if archive is not None:
+        archive.close()
+    if extract:
+        for rel in manifest:
+            if rel not in files and not is_excluded(rel, exclude):
+                (local_root / rel).unlink(missing_ok=True)
+        save_manifest(manifest_path, root, files)
+    echo(f'{len(files)} archivos, {reader.bytes / 1048576:.1f} MB a {reader.rate():.1f} MB/s')
+    if archive is not None:
+        echo(f'Backup comprimido en {archive.path}')
+
+
+@cli.command()
+@click.argument('dst', type=click.Path(), default='backup')
+@click.option('--compress', is_flag=True, help='Comprimir el backup (con --stream, al vuelo mientras llegan los datos)')
+@click.option('--codec', type=click.Choice(['zip', 'zstd']), default='zip', show_default=True, help='Formato de compresión (zstd requiere el paquete zstandard)')
+@click.option('--level', type=int, default=None, help='Nivel de compresión (zip 0-9, por defecto 6; zstd 1-22, por defecto 3)')
+@click.option('--compress-threads', type=click.IntRange(min=0), default=0, help='Hilos de compresión zstd (0 = todos los núcleos)')
+@click.option('--no-extract', is_flag=True, help='Con --stream --compress: escribir sólo el archivo comprimido, sin copia descomprimida')
+@click.option('--exclude', multiple=True, default=['DCIM', 'Pictures', 'Videos', '.thumbnails'], help='Carpetas a excluir (ej: --exclude DCIM --exclude WhatsApp/Media)')
+@click.option('--full', is_flag=True, help='Ignorar el manifiesto anterior y descargar todo de nuevo')
+@click.option('--stream', is_flag=True, help='Copiar todo con un único `tar` vía exec-out, extrayendo al vuelo')
+@click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
+@fleet_command()
+def backup(dst, compress, codec, level, compress_threads, no_extract, exclude, full, stream, dry_run):
+    """Realiza un backup incremental del almacenamiento interno `/sdcard` a la carpeta local `dst`.
+
+    Sólo descarga archivos nuevos o modificados (tamaño/fecha) respecto al
+    manifiesto de la ejecución anterior y borra la copia local de los que ya
+    no existen en el dispositivo. Usa --full para descargar todo, o --stream
+    para copiar el árbol con un solo `tar` (mucho más rápido con archivos pequeños).
+
+    Exclusiones por defecto: DCIM, Pictures, Videos, .thumbnails
+    Puedes añadir más con --exclude <carpeta>
+    """
+    if no_extract and not (stream and compress):
+        raise click.UsageError('--no-extract sólo tiene sentido con --stream --compress.')
+    if compress and codec == 'zstd' and zstandard is None:
+        raise click.ClickException('El códec zstd requiere el paquete `zstandard` (pip install zstandard).')
+    if not adb_ok():
+        echo('adb no encontrado')
+        sys.exit(1)
+    if fleet_active():
+        dst = str(Path(dst) / current_serial())
+    root = '/sdcard'
+    local_root = Path(dst) / Path(root).name
+    manifest_path = Path(dst) / BACKUP_MANIFEST
+    archive_base = str(Path(dst))
+    if not no_extract:
+        echo(f'Creando carpeta local de backup: {dst}')
+        if not dry_run:
+            local_root.mkdir(parents=True, exist_ok=True)
+    if exclude:
+        echo(f'Exclusiones: {", ".join(exclude)}')
+    if dry_run:
+        if stream:
+            echo(f"DRY-RUN: adb exec-out tar -cf - -C {root} {' '.join(tar_exclude_args(exclude))} . -> {local_root}")
+        else:
+            _incremental_backup(root, local_root, manifest_path, exclude, full, dry_run)
+        if compress:
+            echo(f'DRY-RUN: comprimir {dst} en {archive_base}{ArchiveWriter.EXTENSIONS[codec]}')
+    elif stream:
+        archive = ArchiveWriter(archive_base, codec, level, compress_threads) if compress else None
+        _stream_backup(root, local_root, manifest_path, exclude, archive, not no_extract)
+    else:
+        _incremental_backup(root, local_root, manifest_path, exclude, full, dry_run)
+        if compress:
+            archive = ArchiveWriter(archive_base, codec, level, compress_threads)
+            try:
+                archive_tree(dst, local_root, archive)
+            except BaseException:
+                archive.close(abort=True)
+                raise
+            archive.close()
+            echo(f'Backup comprimido en {archive.path}')
+    echo(f'Backup de {root} en {dst} completado.')
+
+
+# Sincronización de carpetas: sólo las diferencias, en paralelo
+
+def list_local_tree(root, exclude=()):
+    """Como `list_remote_tree` pero para una carpeta local: {ruta_relativa: (size, mtime)}."""
+    tree = {}
+    root = Path(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = Path(dirpath).relative_to(root).as_posix()
+        prefix = '' if rel_dir == '.' else rel_dir + '/'
+        dirnames[:] = [d for d in dirnames if not is_excluded(prefix + d, exclude)]
+        for name in filenames:
+            rel = prefix + name
+            if is_excluded(rel, exclude):
+                continue
+            st = os.stat(os.path.join(dirpath, name))
+            tree[rel] = (st.st_size, int(st.st_mtime))
+    return tree
+
+
+def _shell_batches(root, command, rels):
+    """Trocea `cd root && command rel1 rel2 ...` en llamadas de shell acotadas en longitud."""
+    batch, size = [], 0
+    for rel in rels:
+        batch.append(shlex.quote(rel))
+        size += len(batch[-1]) + 1
+        if size >= PULL_BATCH_CHARS:
+            yield f'cd {shlex.quote(root)} && {command} {" ".join(batch)}'
+            batch, size = [], 0
+    if batch:
+        yield f'cd {shlex.quote(root)} && {command} {" ".join(batch)}'
+
+
+def remote_sha256(root, rels):
+    """sha256 de archivos del dispositivo calculados allí con `sha256sum`. Devuelve {rel: sha256}."""
+    digests = {}
+    for script in _shell_batches(root, 'sha256sum --', rels):
+        out = run(adb_cmd('shell', script), capture=True) or ''
+        for line in out.splitlines():
+            digest, _, rel = line.rstrip('\r').partition('  ')
+            if len(digest) == 64 and rel:
+                digests[rel] = digest.lower()
+    return digests
+
+
+def plan_sync(source, target, local_root, root, checksum=False):
+    """Compara los árboles origen y destino. Devuelve (a_copiar, sin_cambios, sobrantes).
+
+    Un archivo se copia si falta en el destino o difiere en tamaño. Con el mismo
+    tamaño, decide la fecha de modificación o, con `checksum`, el sha256 (local
+    en paralelo, sin pasar por la caché persistente de imágenes; remoto con
+    `sha256sum` en el dispositivo).
+    """
+    copy, same, doubtful = [], [], []
+    for rel, (size, mtime) in source.items():
+        other = target.get(rel)
+        if other is None or other[0] != size:
+            copy.append(rel)
+        elif checksum:
+            doubtful.append(rel)
+        elif other[1] != mtime:
+            copy.append(rel)
+        else:
+            same.append(rel)
+    if doubtful:
+        echo(f'Comparando {len(doubtful)} archivos por sha256...')
+        local = dict(_in_pool(lambda rel: (rel, sha256_file(local_root / rel)), doubtful, min(4, len(doubtful))))
+        remote = remote_sha256(root, doubtful)
+        for rel in doubtful:
+            (same if remote.get(rel) == local[rel] else copy).append(rel)
+    extraneous = [rel for rel in target if rel not in source]
+    return sorted(copy), sorted(same), sorted(extraneous)
+
+
+def push_files(local_root, rels, root, on_done, workers=4):
+    """Sube `rels` (relativos a `local_root`) bajo `root` y llama `on_done(rel)` por cada uno.
+
+    Con transporte nativo cada worker reutiliza una sesión `sync:` del pool;
+    si no, se agrupan en llamadas `adb push` por carpeta, `workers` a la vez.
+    """
+    client = native_client()
+    if client is not None:
+        serial = current_serial()
 
+        def send(rel):
+            client.push_file(str(local_root / rel), f'{root}/{rel}', serial)
+            return rel
 
-def run(cmd, capture=False, stream=False):
-    try:
-        if stream:
-            p = subprocess.Popen(cmd, shell=False)
-            p.wait()
-            return p.returncode
-        if capture:
-            out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=False)
-            return out.decode(errors="ignore")
-        else:
-            subprocess.check_call(cmd, shell=False)
-            return None
-    except subprocess.CalledProcessError as e:
-        if capture and hasattr(e, 'output'):
-            return e.output.decode(errors='ignore')
-        click.echo(f"Error ejecutando: {cmd} -> {e}")
-        sys.exit(1)
+        for rel in _in_pool(send, rels, workers):
+            on_done(rel)
+        return
+    parents = sorted({rel.rpartition('/')[0] for rel in rels} - {''})
+    for script in _shell_batches(root, 'mkdir -p --', parents):
+        run(adb_cmd('shell', script), capture=True)
 
+    def send_batch(item):
+        parent, batch = item
+        run(adb_cmd('push', *[str(local_root / rel) for rel in batch], f'{root}/{parent}'.rstrip('/') + '/'),
+            nbytes=sum((local_root / rel).stat().st_size for rel in batch))
+        return batch
 
-def exec_cmd(cmd, dry_run=False, capture=False, stream=False):
-    """Ejecuta o simula la ejecución de `cmd`.
-    - Si `dry_run` es True, sólo muestra la acción y no ejecuta.
-    - `cmd` debe ser lista de argumentos (no shell string).
-    """
-    if dry_run:
-        click.echo(f"DRY-RUN: {' '.join(map(str, cmd))}")
-        return "" if capture else 0
-    return run(cmd, capture=capture, stream=stream)
+    for batch in _in_pool(send_batch, list(_pull_batches(root, rels)), workers):
+        for rel in batch:
+            on_done(rel)
 
 
-def validate_redmi_a2_lite():
-    """Valida que el dispositivo sea un Redmi A2 Lite."""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
-        return False
+def _remote_tree_or_empty(root, exclude):
     try:
-        model = run(['adb', 'shell', 'getprop', 'ro.product.model'], capture=True).strip().upper()
-        if 'A2 LITE' not in model and 'A2LITE' not in model:
-            click.echo(f'Advertencia: el dispositivo parece ser {model}, no un Redmi A2 Lite.')
-            if not click.confirm('¿Deseas continuar de todas formas?', default=False):
-                return False
-        else:
-            click.echo(f'Dispositivo detectado: {model}')
-        return True
-    except Exception as e:
-        click.echo(f'Error validando dispositivo: {e}')
-        return False
+        return list_remote_tree(root, exclude)
+    except click.ClickException:
+        return {}
 
 
-@click.group()
-def cli():
-    """Herramienta multi-uso para Redmi A2 Lite (Windows / Linux / macOS)."""
-    pass
+def _delete_local(local_root, rels):
+    for rel in rels:
+        path = local_root / rel
+        path.unlink(missing_ok=True)
+        for parent in path.parents:
+            if parent == local_root:
+                break
+            try:
+                parent.rmdir()
+            except OSError:
+                break
 
 
 @cli.command()
-def check_tools():
-    """Verifica que `adb` y `fastboot` estén en PATH."""
-    adb = which_ok('adb')
-    fb = which_ok('fastboot')
-    click.echo(f"adb: {'OK' if adb else 'NO ENCONTRADO'}")
-    click.echo(f"fastboot: {'OK' if fb else 'NO ENCONTRADO'}")
-    if not adb or not fb:
-        click.echo("Instala Android platform-tools y asegúrate que estén en PATH.")
+@click.argument('direction', type=click.Choice(['push', 'pull']))
+@click.argument('src')
+@click.argument('dst')
+@click.option('--checksum', is_flag=True, help='Con el mismo tamaño, comparar por sha256 (en el dispositivo con sha256sum) en vez de por fecha')
+@click.option('--delete', is_flag=True, help='Borrar en el destino los archivos que ya no existen en el origen')
+@click.option('--exclude', multiple=True, help='Carpetas o rutas a ignorar (mismas reglas que en backup)')
+@click.option('--streams', type=click.IntRange(min=1), default=4, show_default=True, help='Transferencias simultáneas')
+@click.option('--dry-run', is_flag=True, help='Muestra el plan sin copiar ni borrar nada')
+@fleet_command()
+def sync(direction, src, dst, checksum, delete, exclude, streams, dry_run):
+    """Sincroniza una carpeta copiando sólo lo que cambió.
 
-
-@cli.command()
-def devices():
-    """Lista dispositivos conectados (modo ADB y Fastboot)."""
-    if which_ok('adb'):
-        out = run(['adb', 'devices'], capture=True)
-        click.echo('--- adb devices ---')
-        click.echo(out)
+    `sync push ./assets /sdcard/assets` sube al dispositivo;
+    `sync pull /sdcard/DCIM ./dcim` descarga. Compara tamaño y fecha de
+    modificación (o sha256 con --checksum) y transfiere en paralelo.
+    """
+    if not adb_ok():
+        echo('adb no encontrado')
+        sys.exit(1)
+    if direction == 'push':
+        local_root, root = Path(src), dst.rstrip('/') or '/'
+        if not local_root.is_dir():
+            raise click.BadParameter(f'{src} no es una carpeta local', param_hint='SRC')
+        if not dry_run:
+            run(adb_cmd('shell', f'mkdir -p {shlex.quote(root)}'), capture=True)
+        source = list_local_tree(local_root, exclude)
+        target = list_remote_tree(root, exclude) if not dry_run else _remote_tree_or_empty(root, exclude)
     else:
-        click.echo('adb no encontrado')
-    if which_ok('fastboot'):
-        out = run(['fastboot', 'devices'], capture=True)
-        click.echo('--- fastboot devices ---')
-        click.echo(out)
+        root = src.rstrip('/') or '/'
+        local_root = Path(dst) / current_serial() if fleet_active() else Path(dst)
+        source = list_remote_tree(root, exclude)
+        target = list_local_tree(local_root, exclude) if local_root.is_dir() else {}
+    copy, same, extraneous = plan_sync(source, target, local_root, root, checksum)
+    echo(f'{len(copy)} a copiar, {len(same)} sin cambios'
+         + (f', {len(extraneous)} a borrar' if delete else f', {len(extraneous)} sobrantes (usa --delete para borrarlos)'))
+    if dry_run:
+        for rel in copy:
+            echo(f'DRY-RUN: {direction} {rel}')
+        for rel in extraneous if delete else ():
+            echo(f'DRY-RUN: borrar {rel}')
+        return
+    progress = {'n': 0}
+
+    def done(rel):
+        progress['n'] += 1
+        if progress['n'] % 100 == 0 or progress['n'] == len(copy):
+            echo(f'  {progress["n"]}/{len(copy)} archivos copiados')
+        report_progress(progress['n'], len(copy))
+
+    if direction == 'push':
+        push_files(local_root, copy, root, done, workers=streams)
+        if delete:
+            for script in _shell_batches(root, 'rm -f --', extraneous):
+                run(adb_cmd('shell', script), capture=True)
     else:
-        click.echo('fastboot no encontrado')
+        pull_files(root, copy, local_root, source, done, workers=streams)
+        if delete:
+            _delete_local(local_root, extraneous)
+    echo(f'Sincronización completada: {len(copy)} copiados'
+         + (f', {len(extraneous)} borrados.' if delete else '.'))
 
 
-@cli.command()
-def info():
-    """Muestra información básica del dispositivo vía ADB."""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
-        sys.exit(1)
-    props = ['ro.product.model', 'ro.build.version.release', 'ro.build.version.sdk', 'ro.serialno']
-    for p in props:
-        out = run(['adb', 'shell', 'getprop', p], capture=True)
-        click.echo(f"{p}: {out.strip()}")
+# Volcado de particiones: por bloques, con hash y compresión al vuelo, reanudable
 
+DUMP_CHUNK_MB = 16
+DUMP_INFLIGHT = 4
 
-@cli.command()
-@click.argument('target', type=click.Choice(['device','bootloader','recovery']))
-def reboot(target):
-    """Reinicia: `device`, `bootloader`, `recovery`."""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
-        sys.exit(1)
-    if target == 'device':
-        run(['adb', 'reboot'])
-    elif target == 'bootloader':
-        run(['adb', 'reboot', 'bootloader'])
-    elif target == 'recovery':
-        run(['adb', 'reboot', 'recovery'])
+
+def partition_device(partition):
+    return partition if partition.startswith('/') else f'/dev/block/by-name/{partition}'
+
+
+def _device_command(command, su):
+    return f'su -c {shlex.quote(command)}' if su else command
+
+
+def partition_size(device, su=False):
+    out = (run(adb_cmd('shell', _device_command(f'blockdev --getsize64 {shlex.quote(device)}', su)), capture=True) or '').strip()
+    if not out.isdigit():
+        raise click.ClickException(f'No se pudo leer el tamaño de {device}: {out[:200] or "sin salida"} '
+                                   '(¿hace falta root? prueba con --su)')
+    return int(out)
+
+
+class DumpJournal:
+    """Diario de un volcado (`SALIDA.journal`, una línea JSON por bloque ya escrito).
+
+    La primera línea describe el volcado; cada bloque anota su sha256 y dónde
+    quedó en el archivo de salida. Sólo se añaden líneas, así que un corte deja
+    como mucho una línea incompleta, que se descarta al reanudar.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.header = None
+        self.chunks = []
+        self.digest = None
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if self.header is None:
+                        self.header = entry
+                    elif 'sha256_total' in entry:
+                        self.digest = entry['sha256_total']
+                    else:
+                        self.chunks.append(entry)
+        except OSError:
+            pass
+        return self
+
+    def rewrite(self, header, chunks):
+        """Reescribe el diario con `header` y los bloques ya verificados."""
+        self.header, self.chunks, self.digest = header, list(chunks), None
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in [header] + self.chunks:
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp, self.path)
+
+    def append(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if 'sha256_total' in entry:
+            self.digest = entry['sha256_total']
+        else:
+            self.chunks.append(entry)
+
+
+def _verify_dump_prefix(out, journal, compress, total_hash):
+    """Comprueba los bloques del diario contra el archivo de salida.
+
+    Devuelve los bloques válidos (hasta el primero que falte o no coincida) y
+    alimenta `total_hash` con su contenido.
+    """
+    verified = []
+    with open(out, 'rb') as f:
+        for entry in journal.chunks:
+            f.seek(entry['offset'])
+            data = f.read(entry['length'])
+            if len(data) != entry['length']:
+                break
+            if compress:
+                try:
+                    data = zlib.decompress(data, 31)
+                except zlib.error:
+                    break
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                break
+            total_hash.update(data)
+            verified.append(entry)
+    return verified
+
+
+def _process_chunk(data, compress, level, zero):
+    """sha256, bloque de ceros y (opcional) miembro gzip de un bloque. Corre en el pool (hashlib y zlib liberan el GIL)."""
+    digest = hashlib.sha256(data).hexdigest()
+    is_zero = data == zero[:len(data)]
+    payload = None
+    if compress:
+        comp = zlib.compressobj(level, zlib.DEFLATED, 31)
+        payload = comp.compress(data) + comp.flush()
+    return digest, is_zero, payload
 
 
 @cli.command()
 @click.argument('partition')
-@click.argument('image', type=click.Path(exists=True))
-@click.option('--use-fastboot', is_flag=True, help='Usar fastboot directamente (requiere estar en modo bootloader)')
-@click.option('--confirm', is_flag=True, help='Confirma que entiendes los riesgos del flasheo')
-@click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
-@click.option('--validate-device', is_flag=True, help='Validar que sea un Redmi A2 Lite antes de flashear')
-def flash(partition, image, use_fastboot, confirm, dry_run, validate_device):
-    """Flashea una imagen en partición vía fastboot. Ej: `recovery twrp.img`"""
-    if not which_ok('fastboot'):
-        click.echo('fastboot no encontrado')
-        sys.exit(1)
-    if validate_device and not validate_redmi_a2_lite():
+@click.argument('out', type=click.Path(dir_okay=False), required=False)
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DUMP_CHUNK_MB, show_default=True, help='Tamaño de bloque en MB')
+@click.option('--compress', is_flag=True, help='Comprimir a .img.gz (un miembro gzip por bloque, legible con gunzip)')
+@click.option('--level', type=click.IntRange(0, 9), default=6, show_default=True, help='Nivel de compresión gzip')
+@click.option('--su', is_flag=True, help='Leer la partición con `su -c` (requiere root en el dispositivo)')
+@click.option('--restart', is_flag=True, help='Ignorar un volcado anterior y empezar de cero')
+@fleet_command()
+def dump_partition(partition, out, chunk_size, compress, level, su, restart):
+    """Vuelca una partición (`boot`, `recovery`... o una ruta /dev/block) a un archivo local.
+
+    Lee con `dd` vía exec-out en bloques de --chunk-size MB; cada bloque se
+    hashea (y se comprime con --compress) al vuelo y se anota en
+    `SALIDA.journal`. Si el volcado se corta, al repetir el comando se
+    comprueban los bloques ya escritos y se continúa desde el último válido.
+    Sin compresión, los bloques a cero no se escriben (archivo disperso).
+    """
+    if not adb_ok():
+        echo('adb no encontrado')
         sys.exit(1)
-    if not confirm:
-        if not click.confirm('Comando peligroso: flashear puede borrar datos o dañar el dispositivo. ¿Deseas continuar?', default=False):
-            click.echo('Operación cancelada por usuario.')
-            sys.exit(2)
-    if not use_fastboot:
-        click.echo('Asegúrate que el dispositivo esté en bootloader/fastboot mode.')
-    exec_cmd(['fastboot', 'flash', partition, image], dry_run=dry_run)
-    click.echo('Flash completado (revisa la salida anterior para errores).')
+    device = partition_device(partition)
+    out = Path(out or f'{Path(device).name}.img' + ('.gz' if compress else ''))
+    if fleet_active():
+        out = out.parent / current_serial() / out.name
+    out.parent.mkdir(parents=True, exist_ok=True)
+    chunk = chunk_size * 1024 * 1024
+    size = partition_size(device, su)
+    header = {'partition': device, 'size': size, 'chunk_size': chunk, 'compress': compress}
+    journal = DumpJournal(out.with_name(out.name + '.journal'))
+    if not restart:
+        journal.load()
+    total_hash = hashlib.sha256()
+    verified = []
+    if journal.header is not None and out.exists():
+        if journal.header != header:
+            raise click.ClickException(f'{out} es de otro volcado ({journal.header}); usa --restart o otro archivo.')
+        if journal.digest:
+            echo(f'{out} ya está completo (sha256 {journal.digest}).')
+            return
+        verified = _verify_dump_prefix(out, journal, compress, total_hash)
+        echo(f'Reanudando: {len(verified)}/{len(journal.chunks)} bloques del volcado anterior verificados.')
+    journal.rewrite(header, verified)
+    first = len(verified)
+    end_offset = verified[-1]['offset'] + verified[-1]['length'] if verified else 0
+    chunks_total = (size + chunk - 1) // chunk
+    echo(f'Volcando {device} ({size / 1048576:.1f} MB, {chunks_total} bloques) en {out}')
+    zero = bytes(chunk)
+    mode = 'r+b' if out.exists() and verified else 'wb'
+    with open(out, mode) as f, ThreadPoolExecutor(max_workers=DUMP_INFLIGHT) as pool:
+        f.truncate(end_offset)
+        f.seek(end_offset)
+        pending = []
 
+        def flush_one():
+            nonlocal end_offset
+            index, data, fut = pending.pop(0)
+            digest, is_zero, payload = fut.result()
+            entry = {'i': index, 'sha256': digest, 'offset': end_offset}
+            if compress:
+                f.write(payload)
+                entry['length'] = len(payload)
+            elif is_zero:
+                f.seek(len(data), os.SEEK_CUR)
+                entry.update(length=len(data), zero=True)
+            else:
+                f.write(data)
+                entry['length'] = len(data)
+            total_hash.update(data)
+            f.flush()
+            journal.append(entry)
+            end_offset += entry['length']
+            report_progress(index + 1, chunks_total)
 
-@cli.command()
-@click.argument('file', type=click.Path(exists=True))
-@click.option('--confirm', is_flag=True, help='Confirma que entiendes el uso de sideload')
-@click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
-def sideload(file, confirm, dry_run):
-    """Instala un paquete via `adb sideload` (modo recovery)."""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
-        sys.exit(1)
-    if not confirm:
-        if not click.confirm('Sideload puede modificar el sistema. ¿Deseas continuar?', default=False):
-            click.echo('Operación cancelada por usuario.')
-            sys.exit(2)
-    click.echo('Este comando requiere que el dispositivo esté en modo recovery en "Apply update from ADB"')
-    exec_cmd(['adb', 'sideload', file], dry_run=dry_run)
+        dd = _device_command(f'dd if={shlex.quote(device)} bs={chunk} skip={first} 2>/dev/null', su)
+        try:
+            with adb_exec_out(dd) as raw:
+                stream = ThroughputReader(raw, 'leídos')
+                for index in range(first, chunks_total):
+                    want = min(chunk, size - index * chunk)
+                    data = _read_exact(stream, want)
+                    if len(data) != want:
+                        while pending:
+                            flush_one()
+                        raise click.ClickException(
+                            f'El volcado se cortó en el bloque {index + 1}/{chunks_total}; '
+                            'repite el comando para continuar desde ahí.')
+                    pending.append((index, data, pool.submit(_process_chunk, data, compress, level, zero)))
+                    if len(pending) >= DUMP_INFLIGHT:
+                        flush_one()
+                while pending:
+                    flush_one()
+        finally:
+            # El archivo acaba justo donde acaba el diario (también si hubo un corte
+            # o el último bloque escrito era un hueco de ceros).
+            f.truncate(end_offset)
+    digest = total_hash.hexdigest()
+    journal.append({'sha256_total': digest})
+    echo(f'Volcado completado: {out} (sha256 {digest})')
 
 
-@cli.command()
-@click.argument('src', type=click.Path())
-@click.argument('dst', type=click.Path())
-def pull(src, dst):
-    """Descarga un archivo o carpeta del dispositivo: `pull /sdcard/DCIM ./backup`"""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
-        sys.exit(1)
-    run(['adb', 'pull', src, dst])
-    click.echo('Pull completado.')
+# Monitor de rendimiento: un único shell en el dispositivo y series temporales en CSV
+
+MONITOR_COLUMNS = ('time', 'uptime_s', 'cpu_pct', 'mem_used_mb', 'mem_avail_mb', 'temp_max_c',
+                   'battery_pct', 'battery_temp_c', 'battery_ma', 'battery_mv')
+MONITOR_SUMMARY = ('cpu_pct', 'mem_used_mb', 'temp_max_c', 'battery_temp_c', 'battery_ma')
+# Sólo builtins del shell (read, echo, case) salvo `sleep`: muestrear no lanza
+# procesos nuevos en el dispositivo. Una muestra por bloque S..E.
+_MONITOR_SCRIPT = r"""i=0
+while [ {count} -eq 0 ] || [ $i -lt {count} ]; do
+ read -r up idle < /proc/uptime; echo "S $up"
+ read -r c < /proc/stat; echo "C $c"
+ while read -r k v u; do case $k in MemTotal:|MemAvailable:) echo "M $k $v";; esac; done < /proc/meminfo
+ for z in /sys/class/thermal/thermal_zone*/temp; do read -r t < $z && echo "T $t"; done 2>/dev/null
+ for f in capacity temp current_now voltage_now; do read -r v < /sys/class/power_supply/battery/$f && echo "B $f $v"; done 2>/dev/null
+ echo E
+ i=$((i+1)); [ {count} -ne 0 ] && [ $i -ge {count} ] || sleep {interval}
+done"""
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class MonitorParser:
+    """Convierte la salida del bucle de muestreo en filas de `MONITOR_COLUMNS`.
+
+    Se alimenta línea a línea según llegan; `feed` devuelve la fila al cerrar
+    cada muestra. El % de CPU sale de la diferencia de jiffies con la muestra
+    anterior, así que la primera fila no lo tiene.
+    """
+
+    def __init__(self):
+        self._prev_cpu = None
+        self._sample = {}
+
+    def feed(self, line):
+        tag, _, rest = line.strip().partition(' ')
+        fields = rest.split()
+        sample = self._sample
+        if tag == 'S' and fields:
+            sample['uptime_s'] = _number(fields[0])
+        elif tag == 'C' and len(fields) > 4 and fields[0] == 'cpu':
+            sample['cpu'] = [int(x) for x in fields[1:9] if x.isdigit()]
+        elif tag == 'M' and len(fields) == 2:
+            sample[fields[0].rstrip(':')] = _number(fields[1])
+        elif tag == 'T' and fields:
+            temp = _number(fields[0])
+            if temp is not None and temp > 0:
+                sample.setdefault('temps', []).append(temp / 1000 if temp > 1000 else temp)
+        elif tag == 'B' and len(fields) == 2:
+            sample[fields[0]] = _number(fields[1])
+        elif tag == 'E':
+            self._sample = {}
+            return self._row(sample)
+        return None
+
+    def _row(self, sample):
+        row = dict.fromkeys(MONITOR_COLUMNS)
+        row['time'] = datetime.datetime.now().isoformat(timespec='milliseconds')
+        row['uptime_s'] = sample.get('uptime_s')
+        cpu = sample.get('cpu')
+        if cpu and self._prev_cpu and len(cpu) == len(self._prev_cpu):
+            total = sum(cpu) - sum(self._prev_cpu)
+            idle = sum(cpu[3:5]) - sum(self._prev_cpu[3:5])
+            if total > 0:
+                row['cpu_pct'] = round(100.0 * (total - idle) / total, 1)
+        self._prev_cpu = cpu or self._prev_cpu
+        mem_total, mem_avail = sample.get('MemTotal'), sample.get('MemAvailable')
+        if mem_total is not None and mem_avail is not None:
+            row['mem_used_mb'] = round((mem_total - mem_avail) / 1024, 1)
+            row['mem_avail_mb'] = round(mem_avail / 1024, 1)
+        if sample.get('temps'):
+            row['temp_max_c'] = round(max(sample['temps']), 1)
+        if sample.get('capacity') is not None:
+            row['battery_pct'] = sample['capacity']
+        if sample.get('temp') is not None:
+            row['battery_temp_c'] = sample['temp'] / 10
+        if sample.get('current_now') is not None:
+            row['battery_ma'] = round(sample['current_now'] / 1000, 1)
+        if sample.get('voltage_now') is not None:
+            row['battery_mv'] = round(sample['voltage_now'] / 1000, 1)
+        return row
+
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
 
 
 @cli.command()
-@click.argument('src', type=click.Path())
-@click.argument('dst', type=click.Path())
-def push(src, dst):
-    """Sube un archivo al dispositivo: `push update.zip /sdcard/`"""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
+@click.option('--out', type=click.Path(dir_okay=False), default='monitor.csv', show_default=True,
+              help='CSV donde guardar la serie temporal (en modo flota, uno por dispositivo en OUT_DIR/SERIAL/)')
+@click.option('--interval', type=click.FloatRange(min=0.1), default=1.0, show_default=True, help='Segundos entre muestras')
+@click.option('--duration', type=click.FloatRange(min=0), default=0, help='Segundos de muestreo (0 = hasta Ctrl+C)')
+@fleet_command('adb')
+def monitor(out, interval, duration):
+    """Muestrea CPU, memoria, temperatura y batería a intervalos y lo guarda en CSV.
+
+    Usa un único shell persistente en el dispositivo que lee `/proc/stat`,
+    `/proc/meminfo`, las zonas térmicas y `power_supply/battery` con builtins,
+    sin lanzar un `dumpsys` por muestra. Al terminar muestra percentiles.
+    """
+    if not adb_ok():
+        echo('adb no encontrado')
         sys.exit(1)
-    run(['adb', 'push', src, dst])
-    click.echo('Push completado.')
+    out = Path(out)
+    if fleet_active():
+        out = out.parent / current_serial() / out.name
+    out.parent.mkdir(parents=True, exist_ok=True)
+    count = max(1, round(duration / interval)) if duration else 0
+    script = _MONITOR_SCRIPT.format(count=count, interval=f'{interval:g}')
+    parser = MonitorParser()
+    values = {name: array.array('d') for name in MONITOR_SUMMARY}
+    samples = 0
+    started = time.monotonic()
+    echo(f'Monitorizando en {out} cada {interval:g}s' + (f' durante {duration:g}s' if duration else ' (Ctrl+C para terminar)'))
+    with open(out, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MONITOR_COLUMNS)
+        writer.writeheader()
+        try:
+            with adb_exec_out(script) as stream:
+                for raw in stream:
+                    check_cancelled()
+                    row = parser.feed(raw.decode('utf-8', errors='replace'))
+                    if row is None:
+                        continue
+                    writer.writerow(row)
+                    f.flush()
+                    samples += 1
+                    for name, column in values.items():
+                        if row[name] is not None:
+                            column.append(row[name])
+        except (KeyboardInterrupt, JobCancelled):
+            echo('Monitor detenido.')
+    echo(f'{samples} muestras en {time.monotonic() - started:.0f}s guardadas en {out}')
+    if not samples:
+        return
+    echo(f"{'métrica':<16}{'mín':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'máx':>9}")
+    for name, column in values.items():
+        if not column:
+            continue
+        ordered = sorted(column)
+        stats = [ordered[0], percentile(ordered, 50), percentile(ordered, 95), percentile(ordered, 99), ordered[-1]]
+        echo(f'{name:<16}' + ''.join(f'{v:>9.1f}' for v in stats))
+
+
+# Logcat en streaming: filtros al vuelo, rotación y memoria constante
+
+LOG_PRIORITIES = 'VDIWEF'
+_BINARY_PRIORITIES = {2: 'V', 3: 'D', 4: 'I', 5: 'W', 6: 'E', 7: 'F'}
+_TEXT_LOG_IDS = {0, 1, 3, 4, 7}  # main, radio, system, crash, kernel: payload prio+tag+msg (2 events, 5 stats, 6 security: binarios)
+_THREADTIME_RE = re.compile(r'^(\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\s+(\d+)\s+(\d+)\s+([VDIWEFS])\s+(.*?)\s*: ?(.*)$')
+
+
+def parse_threadtime(line):
+    """Parsea una línea `-v threadtime`: (time, pid, tid, prio, tag, msg) o None."""
+    m = _THREADTIME_RE.match(line)
+    if not m:
+        return None
+    ts, pid, tid, prio, tag, msg = m.groups()
+    return ts, int(pid), int(tid), prio, tag, msg
+
+
+def format_threadtime(entry):
+    ts, pid, tid, prio, tag, msg = entry
+    return f'{ts} {pid:5d} {tid:5d} {prio} {tag}: {msg}'
+
+
+class LogFilter:
+    """Filtro de entradas de logcat por tag, prioridad mínima, PID y regex."""
+
+    def __init__(self, tags=(), priority='V', pids=(), pattern=None):
+        self.tags = set(tags)
+        self.min_level = LOG_PRIORITIES.index(priority)
+        self.pids = set(pids)
+        self.regex = re.compile(pattern) if pattern else None
+
+    @property
+    def active(self):
+        return bool(self.tags or self.min_level or self.pids or self.regex)
+
+    def device_specs(self):
+        """Filterspecs de `logcat` para descartar en el propio dispositivo lo que no interesa."""
+        prio = LOG_PRIORITIES[self.min_level]
+        if self.tags:
+            return [f'{tag}:{prio}' for tag in sorted(self.tags)] + ['*:S']
+        return [f'*:{prio}'] if self.min_level else []
+
+    def match(self, line, entry):
+        if entry is None:
+            return not self.active
+        _, pid, _, prio, tag, msg = entry
+        if self.tags and tag not in self.tags:
+            return False
+        if prio in LOG_PRIORITIES and LOG_PRIORITIES.index(prio) < self.min_level:
+            return False
+        if self.pids and pid not in self.pids:
+            return False
+        return self.regex is None or self.regex.search(line) is not None
+
+
+def iter_logcat_text(stream):
+    """Itera (línea, entrada) sobre la salida de texto de logcat, línea a línea."""
+    for raw in stream:
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        yield line, parse_threadtime(line)
+
+
+def _read_exact(stream, n):
+    data = stream.read(n)
+    while data is not None and 0 < len(data) < n:
+        more = stream.read(n - len(data))
+        if not more:
+            break
+        data += more
+    return data or b''
+
+
+def iter_logcat_binary(stream):
+    """Decodifica la salida de `logcat -B` (structs `logger_entry` v1-v4) en el host."""
+    while True:
+        head = _read_exact(stream, 4)
+        if len(head) < 4:
+            return
+        length, hdr_size = struct.unpack('<HH', head)
+        hdr_size = hdr_size or 20  # v1 no rellena hdr_size
+        rest = _read_exact(stream, hdr_size - 4)
+        payload = _read_exact(stream, length)
+        if len(rest) < hdr_size - 4 or len(payload) < length:
+            return
+        pid, tid, sec, nsec = struct.unpack('<iIII', rest[:16])
+        lid = struct.unpack('<I', rest[16:20])[0] if hdr_size >= 24 else 0
+        ts = time.strftime('%m-%d %H:%M:%S', time.localtime(sec)) + f'.{nsec // 1000000:03d}'
+        if lid in _TEXT_LOG_IDS and payload:
+            prio = _BINARY_PRIORITIES.get(payload[0], 'V')
+            tag, _, msg = payload[1:].partition(b'\0')
+            msg = msg.rstrip(b'\0')
+            entry = (ts, pid, tid, prio, tag.decode('utf-8', errors='replace'),
+                     msg.decode('utf-8', errors='replace'))
+        else:
+            entry = (ts, pid, tid, 'I', f'log{lid}', f'<{length} bytes binarios>')
+        for text in entry[5].split('\n') or ['']:
+            item = entry[:5] + (text,)
+            yield format_threadtime(item), item
+
+
+class RotatingWriter:
+    """Escribe líneas en `path` rotando por tamaño y/o tiempo (`path.1`, `path.2`, ...)."""
+
+    def __init__(self, path, max_bytes=None, max_seconds=None, max_files=5, flush_interval=1.0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.lines = 0
+        self._open()
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'w', encoding='utf-8', newline='\n')
+        self._size = 0
+        self._opened = self._flushed = time.monotonic()
+
+    def write_line(self, line):
+        now = time.monotonic()
+        if (self.max_bytes and self._size >= self.max_bytes) or \
+                (self.max_seconds and now - self._opened >= self.max_seconds):
+            self.rotate()
+        self._file.write(line + '\n')
+        self._size += len(line) + 1
+        self.lines += 1
+        if now - self._flushed >= self.flush_interval:
+            self._file.flush()
+            self._flushed = now
+
+    def rotate(self):
+        self._file.close()
+        for i in range(self.max_files - 1, 0, -1):
+            src = self.path.with_name(f'{self.path.name}.{i}')
+            if src.exists():
+                os.replace(src, self.path.with_name(f'{self.path.name}.{i + 1}'))
+        if self.max_files > 0:
+            os.replace(self.path, self.path.with_name(f'{self.path.name}.1'))
+        oldest = self.path.with_name(f'{self.path.name}.{self.max_files + 1}')
+        oldest.unlink(missing_ok=True)
+        self._open()
+
+    def close(self):
+        self._file.close()
 
 
 @cli.command()
-@click.argument('dst', type=click.Path(), default='backup')
-@click.option('--compress', is_flag=True, help='Comprimir el backup en un archivo zip al terminar')
-@click.option('--exclude', multiple=True, default=['DCIM', 'Pictures', 'Videos', '.thumbnails'], help='Carpetas a excluir (ej: --exclude DCIM --exclude WhatsApp/Media)')
-@click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
-def backup(dst, compress, exclude, dry_run):
-    """Realiza un backup del almacenamiento interno `/sdcard` a la carpeta local `dst`.
-    
-    Exclusiones por defecto: DCIM, Pictures, Videos, .thumbnails
-    Puedes añadir más con --exclude <carpeta>
+@click.option('--out', type=click.Path(), default='logcat.txt', help='Archivo donde guardar el logcat')
+@click.option('--follow', '-f', is_flag=True, help='Seguir el log en vivo hasta Ctrl+C (por defecto vuelca el buffer con -d)')
+@click.option('--tag', 'tags', multiple=True, help='Sólo estos tags (repetible)')
+@click.option('--priority', type=click.Choice(list(LOG_PRIORITIES)), default='V', show_default=True, help='Prioridad mínima')
+@click.option('--pid', 'pids', type=int, multiple=True, help='Sólo estos PID (repetible)')
+@click.option('--grep', 'pattern', help='Expresión regular que debe aparecer en la línea')
+@click.option('--rotate-size', type=float, help='Rotar el archivo al superar estos MB')
+@click.option('--rotate-time', type=float, help='Rotar el archivo cada estos segundos')
+@click.option('--max-files', type=click.IntRange(min=0), default=5, show_default=True, help='Archivos rotados a conservar')
+@click.option('--binary', is_flag=True, help='Leer `logcat -B` (binario) y decodificarlo en el host')
+def logcat(out, follow, tags, priority, pids, pattern, rotate_size, rotate_time, max_files, binary):
+    """Captura el logcat en streaming, línea a línea, y lo guarda en un archivo.
+
+    Los filtros se aplican al vuelo y la memoria usada es constante aunque
+    `--follow` se ejecute durante días.
     """
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
+    if not adb_ok():
+        echo('adb no encontrado')
         sys.exit(1)
-    click.echo(f'Creando carpeta local de backup: {dst}')
-    Path(dst).mkdir(parents=True, exist_ok=True)
-    if exclude:
-        click.echo(f'Exclusiones: {", ".join(exclude)}')
-    click.echo('Iniciando pull de /sdcard ... (esto puede tardar)')
-    exec_cmd(['adb', 'pull', '/sdcard', dst], dry_run=dry_run)
-    if compress:
-        if dry_run:
-            click.echo(f'DRY-RUN: comprimir {dst} en {dst}.zip')
+    log_filter = LogFilter(tags, priority, pids, pattern)
+    args = ['logcat', '-B' if binary else '-v threadtime']
+    if not follow:
+        args.append('-d')
+    args += log_filter.device_specs()
+    writer = RotatingWriter(out, int(rotate_size * 1048576) if rotate_size else None, rotate_time, max_files)
+    if follow:
+        echo(f'Siguiendo logcat en {out} (Ctrl+C para terminar)...')
+    try:
+        with adb_exec_out(' '.join(args)) as stream:
+            entries = iter_logcat_binary(stream) if binary else iter_logcat_text(stream)
+            for line, entry in entries:
+                check_cancelled()
+                if log_filter.match(line, entry):
+                    writer.write_line(line)
+    except KeyboardInterrupt:
+        echo('Interrumpido por el usuario.')
+    finally:
+        writer.close()
+    echo(f'Log guardado en {out} ({writer.lines} líneas)')
+
+
+# Índice de capturas de logcat: columnas + posting lists en disco, consultadas con mmap
+
+LOGINDEX_VERSION = 1
+LOGINDEX_BLOCK = 1024
+_LOG_LEVELS = LOG_PRIORITIES + 'S'
+# columna -> typecode de `array` (una entrada por línea indexada)
+LOGINDEX_COLUMNS = {'time': 'q', 'pid': 'i', 'tid': 'i', 'prio': 'B', 'tag': 'I',
+                    'offset': 'Q', 'length': 'I', 'msg': 'H'}
+_TS_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%m-%d %H:%M:%S.%f', '%m-%d %H:%M:%S')
+
+
+def _log_time_ms(ts, year, cache):
+    """`MM-DD HH:MM:SS.mmm` -> ms (epoch UTC ingenuo del año de la captura)."""
+    head, _, frac = ts.partition('.')
+    secs = cache.get(head)
+    if secs is None:
+        cache.clear()
+        month, day = int(head[0:2]), int(head[3:5])
+        secs = calendar.timegm((year, month, day, int(head[6:8]), int(head[9:11]), int(head[12:14]), 0, 0, 0))
+        cache[head] = secs
+    return secs * 1000 + int((frac + '000')[:3])
+
+
+def parse_log_time(text, year):
+    """Convierte `--since/--until` (con o sin año, con o sin ms) a ms comparables con el índice."""
+    for fmt in _TS_FORMATS:
+        try:
+            dt = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if '%Y' not in fmt:
+            dt = dt.replace(year=year)
+        return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+    raise click.BadParameter(f'fecha no reconocida: {text!r} (usa "MM-DD HH:MM:SS[.mmm]")')
+
+
+def _write_postings(index_dir, name, counts, keys):
+    """Escribe `NAME.post` (ids de línea agrupados por clave) a partir de `NAME.col` ya en disco.
+
+    Ordenación por conteo sobre mmap: en memoria sólo hay un contador por
+    clave, nunca las listas completas (4 bytes por línea indexada).
+    Devuelve el directorio `[[clave, inicio, n], ...]` en el orden de `keys`.
+    """
+    directory, starts, start = [], {}, 0
+    for key in keys:
+        directory.append([key, start, counts[key]])
+        starts[key] = start
+        start += counts[key]
+    path = index_dir / f'{name}.post'
+    with open(path, 'wb') as fh:
+        fh.truncate(start * 4)
+    if not start:
+        return directory
+    with open(path, 'r+b') as fh, mmap.mmap(fh.fileno(), 0) as out, \
+            open(index_dir / f'{name}.col', 'rb') as ch, mmap.mmap(ch.fileno(), 0, access=mmap.ACCESS_READ) as src:
+        post = memoryview(out).cast('I')
+        column = memoryview(src).cast(LOGINDEX_COLUMNS[name])
+        try:
+            for i, key in enumerate(column):
+                pos = starts[key]
+                post[pos] = i
+                starts[key] = pos + 1
+        finally:
+            post.release()
+            column.release()
+    return directory
+
+
+def build_log_index(capture, index_dir, year):
+    """Parsea una captura `-v threadtime` una sola vez y escribe el índice columnar.
+
+    Las columnas se vuelcan en bloques de `array` y las posting lists se
+    construyen después desde las columnas en disco, así que la memoria depende
+    del número de tags/PID distintos, no del tamaño del archivo.
+    """
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    cols = {name: array.array(code) for name, code in LOGINDEX_COLUMNS.items()}
+    files = {name: open(index_dir / f'{name}.col', 'wb') for name in LOGINDEX_COLUMNS}
+    tag_ids, tag_counts, pid_counts = {}, {}, {}
+    blocks = array.array('q')
+    cache = {}
+    count = 0
+    block_lo = block_hi = None
+
+    def flush():
+        for name, col in cols.items():
+            col.tofile(files[name])
+            del col[:]
+
+    try:
+        with open(capture, 'rb') as f:
+            offset = 0
+            for raw in f:
+                line_off, offset = offset, offset + len(raw)
+                line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                entry = parse_threadtime(line)
+                if entry is None:
+                    continue
+                ts, pid, tid, prio, tag, msg = entry
+                t = _log_time_ms(ts, year, cache)
+                tag_id = tag_ids.setdefault(tag, len(tag_ids))
+                msg_start = len(line.encode('utf-8', errors='replace')) - len(msg.encode('utf-8', errors='replace'))
+                for name, value in (('time', t), ('pid', pid), ('tid', tid), ('prio', _LOG_LEVELS.index(prio)),
+                                    ('tag', tag_id), ('offset', line_off),
+                                    ('length', len(raw.rstrip(b'\r\n'))), ('msg', min(msg_start, 0xFFFF))):
+                    cols[name].append(value)
+                tag_counts[tag_id] = tag_counts.get(tag_id, 0) + 1
+                pid_counts[pid] = pid_counts.get(pid, 0) + 1
+                block_lo = t if block_lo is None else min(block_lo, t)
+                block_hi = t if block_hi is None else max(block_hi, t)
+                count += 1
+                if count % LOGINDEX_BLOCK == 0:
+                    blocks.extend((block_lo, block_hi))
+                    block_lo = block_hi = None
+                    flush()
+            if block_lo is not None:
+                blocks.extend((block_lo, block_hi))
+            flush()
+    finally:
+        for fh in files.values():
+            fh.close()
+
+    tags_by_id = sorted(tag_ids, key=tag_ids.get)
+    tag_dir = _write_postings(index_dir, 'tag', tag_counts, range(len(tags_by_id)))
+    pid_dir = _write_postings(index_dir, 'pid', pid_counts, sorted(pid_counts))
+    with open(index_dir / 'time.blk', 'wb') as fh:
+        blocks.tofile(fh)
+    st = os.stat(capture)
+    meta = {
+        'version': LOGINDEX_VERSION, 'source': str(Path(capture).resolve()), 'size': st.st_size,
+        'mtime': st.st_mtime, 'year': year, 'count': count, 'block': LOGINDEX_BLOCK,
+        'byteorder': sys.byteorder, 'tags': [[tags_by_id[i], s, n] for i, s, n in tag_dir], 'pids': pid_dir,
+    }
+    with open(index_dir / 'meta.json', 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh)
+    return meta
+
+
+class LogIndex:
+    """Acceso de sólo lectura a un índice de logcat: columnas y posting lists vía mmap."""
+
+    def __init__(self, index_dir):
+        self.dir = Path(index_dir)
+        with open(self.dir / 'meta.json', 'r', encoding='utf-8') as fh:
+            self.meta = json.load(fh)
+        if self.meta.get('version') != LOGINDEX_VERSION or self.meta.get('byteorder') != sys.byteorder:
+            raise click.ClickException(f'Índice incompatible en {self.dir}; vuelve a ejecutar logcat-index.')
+        self.count = self.meta['count']
+        self._maps = []
+        self.cols = {name: self._map(f'{name}.col', code) for name, code in LOGINDEX_COLUMNS.items()}
+        self.tag_post = self._map('tag.post', 'I')
+        self.pid_post = self._map('pid.post', 'I')
+        self.blocks = self._map('time.blk', 'q')
+        self.tags = {name: (start, n) for name, start, n in self.meta['tags']}
+        self.tag_names = [name for name, _, _ in self.meta['tags']]
+        self.pids = {pid: (start, n) for pid, start, n in self.meta['pids']}
+        self.source = self._open_source()
+
+    def _map(self, name, code):
+        path = self.dir / name
+        if path.stat().st_size == 0:
+            return memoryview(array.array(code))
+        with open(path, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return memoryview(mm).cast(code)
+
+    def _open_source(self):
+        src = Path(self.meta['source'])
+        st = src.stat()
+        if st.st_size != self.meta['size'] or st.st_mtime != self.meta['mtime']:
+            raise click.ClickException(f'{src} cambió desde que se indexó; vuelve a ejecutar logcat-index.')
+        if st.st_size == 0:
+            return b''
+        with open(src, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return mm
+
+    def _postings(self, table, post, keys):
+        ids = set()
+        for key in keys:
+            start, n = table.get(key, (0, 0))
+            ids.update(post[start:start + n])
+        return ids
+
+    def _time_range(self, since, until):
+        block = self.meta['block']
+        times = self.cols['time']
+        for b in range(len(self.blocks) // 2):
+            lo, hi = self.blocks[2 * b], self.blocks[2 * b + 1]
+            if (since is not None and hi < since) or (until is not None and lo > until):
+                continue
+            for i in range(b * block, min((b + 1) * block, self.count)):
+                if (since is None or times[i] >= since) and (until is None or times[i] <= until):
+                    yield i
+
+    def line(self, i):
+        off = self.cols['offset'][i]
+        return bytes(self.source[off:off + self.cols['length'][i]]).decode('utf-8', errors='replace')
+
+    def query(self, tags=(), pids=(), priority='V', since=None, until=None, pattern=None):
+        """Itera las líneas que cumplen todos los filtros, en el orden del archivo original."""
+        candidates = None
+        if tags:
+            candidates = self._postings(self.tags, self.tag_post, tags)
+        if pids:
+            by_pid = self._postings(self.pids, self.pid_post, pids)
+            candidates = by_pid if candidates is None else candidates & by_pid
+        times = self.cols['time']
+        if candidates is None:
+            ids = self._time_range(since, until) if since is not None or until is not None else range(self.count)
         else:
-            archive_name = shutil.make_archive(dst, 'zip', root_dir=dst)
-            click.echo(f'Backup comprimido en {archive_name}')
-    click.echo(f'Backup de /sdcard en {dst} completado.')
+            ids = (i for i in sorted(candidates)
+                   if (since is None or times[i] >= since) and (until is None or times[i] <= until))
+        min_level = LOG_PRIORITIES.index(priority)
+        prios = self.cols['prio']
+        regex = re.compile(pattern) if pattern else None
+        for i in ids:
+            if prios[i] < min_level:
+                continue
+            text = self.line(i)
+            if regex is None or regex.search(text):
+                yield text
+
+    def close(self):
+        for col in list(self.cols.values()) + [self.tag_post, self.pid_post, self.blocks]:
+            col.release()
+        for mm in self._maps:
+            mm.close()
+
+
+def _default_index_dir(capture):
+    return f'{capture}.idx'
 
 
 @cli.command()
-@click.option('--out', type=click.Path(), default='logcat.txt', help='Archivo donde guardar logcat -d')
-def logcat(out):
-    """Captura el logcat y lo guarda en un archivo (`adb logcat -d`)."""
-    if not which_ok('adb'):
-        click.echo('adb no encontrado')
-        sys.exit(1)
-    data = run(['adb', 'logcat', '-d'], capture=True)
-    Path(out).write_text(data, encoding='utf-8')
-    click.echo(f'Log guardado en {out}')
-    
+@click.argument('capture', type=click.Path(exists=True, dir_okay=False))
+@click.option('--index', 'index_dir', type=click.Path(file_okay=False), help='Carpeta del índice (por defecto CAPTURE.idx)')
+@click.option('--year', type=int, help='Año de la captura (threadtime no lo incluye; por defecto el de la fecha del archivo)')
+def logcat_index(capture, index_dir, year):
+    """Indexa una captura de `logcat` (-v threadtime) para consultarla con `logcat-query`."""
+    index_dir = index_dir or _default_index_dir(capture)
+    year = year or time.localtime(os.stat(capture).st_mtime).tm_year
+    start = time.monotonic()
+    meta = build_log_index(capture, index_dir, year)
+    elapsed = time.monotonic() - start
+    echo(f"Indexadas {meta['count']} líneas ({len(meta['tags'])} tags, {len(meta['pids'])} PID) "
+         f"en {elapsed:.1f}s -> {index_dir}")
+
+
+@cli.command()
+@click.argument('capture', type=click.Path(exists=True, dir_okay=False))
+@click.option('--index', 'index_dir', type=click.Path(file_okay=False), help='Carpeta del índice (por defecto CAPTURE.idx)')
+@click.option('--tag', 'tags', multiple=True, help='Sólo estos tags (repetible)')
+@click.option('--pid', 'pids', type=int, multiple=True, help='Sólo estos PID (repetible)')
+@click.option('--priority', type=click.Choice(list(LOG_PRIORITIES)), default='V', show_default=True, help='Prioridad mínima')
+@click.option('--since', help='Desde "MM-DD HH:MM:SS[.mmm]"')
+@click.option('--until', help='Hasta "MM-DD HH:MM:SS[.mmm]"')
+@click.option('--grep', 'pattern', help='Expresión regular que debe aparecer en la línea')
+@click.option('--limit', type=click.IntRange(min=1), help='Máximo de líneas a mostrar')
+@click.option('--count', 'count_only', is_flag=True, help='Mostrar sólo el número de coincidencias')
+def logcat_query(capture, index_dir, tags, pids, priority, since, until, pattern, limit, count_only):
+    """Consulta una captura indexada con `logcat-index` sin volver a recorrer el archivo."""
+    index_dir = index_dir or _default_index_dir(capture)
+    if not (Path(index_dir) / 'meta.json').exists():
+        raise click.ClickException(f'No hay índice en {index_dir}; ejecuta primero `logcat-index {capture}`.')
+    index = LogIndex(index_dir)
+    try:
+        year = index.meta['year']
+        matches = index.query(tags, pids, priority,
+                              parse_log_time(since, year) if since else None,
+                              parse_log_time(until, year) if until else None, pattern)
+        n = 0
+        for text in matches:
+            n += 1
+            if not count_only:
+                echo(text)
+            if limit and n >= limit:
+                break
+        if count_only:
+            echo(str(n))
+    finally:
+        matches = None
+        index.close()
+
+
 @cli.command()
 @click.argument('manifest', type=click.Path(exists=True))
 @click.option('--confirm', is_flag=True, help='Confirma que entiendes los riesgos')
 @click.option('--dry-run', is_flag=True, help='Simula las acciones sin ejecutar comandos peligrosos')
 @click.option('--validate-device', is_flag=True, help='Validar que sea un Redmi A2 Lite antes de flashear')
-def flash_package(manifest, confirm, dry_run, validate_device):
-    """Flashea un paquete de imágenes descrito en un manifiesto JSON.
+@click.option('--scratch-max', type=float, help='GB máximos de la caché temporal para imágenes extraídas de ZIPs')
+@click.option('--reboot-bootloader', is_flag=True, help='Reiniciar al bootloader, esperar, flashear y reiniciar al sistema')
+@click.option('--wait-timeout', type=float, default=0, help='Con --reboot-bootloader: segundos máximos por transición (0 = sin límite)')
+@click.option('--sparse', is_flag=True, help='Convertir las imágenes a sparse (sin enviar bloques vacíos) partidas según max-download-size')
+@click.option('--sparse-zeros', type=click.Choice(['fill', 'dont-care']), default='fill', show_default=True,
+              help='Con --sparse: los bloques de ceros se escriben (fill) o se dejan como están (dont-care)')
+@fleet_command('fastboot', any_with='reboot_bootloader')
+def flash_package(manifest, confirm, dry_run, validate_device, scratch_max, reboot_bootloader, wait_timeout,
+                  sparse, sparse_zeros):
+    """Flashea un paquete de imágenes descrito en un manifiesto JSON o un ZIP de firmware.
 
     Formato esperado (ejemplo):
     {
       "actions": [
         {"partition": "recovery", "image": "twrp.img"},
-        {"partition": "boot", "image": "boot.img"}
+        {"partition": "boot", "image": "boot.img", "sha256": "…", "size": 67108864}
       ]
     }
+
+    `sha256` y `size` son opcionales; si están, todas las imágenes se verifican
+    (en paralelo, con caché) antes de flashear nada.
+
+    `image` puede apuntar dentro de un ZIP (`rom.zip!images/boot.img`). También
+    se puede pasar el ZIP directamente: se usa su `flash-manifest.json` o, si no
+    tiene, un `*.img` por partición. Cada imagen se extrae justo antes de
+    flashearla a una caché temporal acotada, nunca el ZIP completo.
+
+    Con `--sparse` cada imagen se envía en formato sparse: los bloques de
+    ceros o repetidos no pasan por USB.
     """
     if not which_ok('fastboot'):
-        click.echo('fastboot no encontrado')
+        echo('fastboot no encontrado')
         sys.exit(1)
     if validate_device and not validate_redmi_a2_lite():
         sys.exit(1)
+    if scratch_max is not None:
+        SCRATCH.max_bytes = int(scratch_max * 1024 ** 3)
     try:
-        with open(manifest, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if zipfile.is_zipfile(manifest):
+            actions = actions_from_zip(manifest)
+        else:
+            with open(manifest, 'r', encoding='utf-8') as f:
+                actions = json.load(f).get('actions', [])
     except Exception as e:
-        click.echo(f'Error leyendo manifiesto: {e}')
+        echo(f'Error leyendo manifiesto: {e}')
         sys.exit(1)
-    actions = data.get('actions', [])
     if not actions:
-        click.echo('No se encontraron acciones en el manifiesto.')
+        echo('No se encontraron acciones en el manifiesto.')
         sys.exit(1)
     # Validar que las imágenes existan
     for a in actions:
         img = a.get('image')
         part = a.get('partition')
-        if not img or not Path(img).exists():
-            click.echo(f'Imagen no encontrada: {img} (partition: {part})')
+        if not img or not ImageSource(img).exists():
+            echo(f'Imagen no encontrada: {img} (partition: {part})')
             sys.exit(1)
-    click.echo('Plan de flasheo:')
+    abort_on_bad_images(actions)
+    echo('Plan de flasheo:')
     for a in actions:
-        click.echo(f" - flash {a.get('partition')} <- {a.get('image')}")
+        echo(f" - flash {a.get('partition')} <- {a.get('image')}")
     if not confirm:
-        if not click.confirm('¿Deseas ejecutar el plan anterior?', default=False):
-            click.echo('Operación cancelada por usuario.')
+        if not confirm_prompt('¿Deseas ejecutar el plan anterior?'):
+            echo('Operación cancelada por usuario.')
             sys.exit(2)
-    for a in actions:
+    if reboot_bootloader and not dry_run:
+        enter_bootloader(_wait_timeout(wait_timeout))
+    limit = max_download_size() if sparse and not dry_run else None
+    for i, a in enumerate(actions):
+        report_progress(i, len(actions))
         part = a.get('partition')
         img = a.get('image')
-        exec_cmd(['fastboot', 'flash', part, img], dry_run=dry_run)
-    click.echo('Paquete flasheado (revisa la salida anterior para errores).')
+        if dry_run:
+            exec_cmd(fastboot_cmd('flash', part, img), dry_run=True)
+            continue
+        flash_image(part, img, sparse_zeros if sparse else None, limit)
+    echo('Paquete flasheado (revisa la salida anterior para errores).')
+    if reboot_bootloader and not dry_run:
+        reboot_and_wait(lambda: run(fastboot_cmd('reboot')), 'device', _wait_timeout(wait_timeout))
 
 
 @cli.command()
@@ -295,16 +3595,202 @@ def flash_package(manifest, confirm, dry_run, validate_device):
 def unlock_bootloader(confirm, dry_run):
     """Intenta desbloquear el bootloader vía fastboot. Requiere confirmación explícita."""
     if not which_ok('fastboot'):
-        click.echo('fastboot no encontrado')
+        echo('fastboot no encontrado')
         sys.exit(1)
     if not confirm:
-        if not click.confirm('Comando peligroso: perderás datos y se puede invalidar garantía. ¿Deseas continuar?', default=False):
-            click.echo('Operación cancelada por usuario.')
+        if not confirm_prompt('Comando peligroso: perderás datos y se puede invalidar garantía. ¿Deseas continuar?'):
+            echo('Operación cancelada por usuario.')
             sys.exit(2)
-    click.echo('Desbloqueando bootloader... (puede pedir confirmación en el teléfono)')
+    echo('Desbloqueando bootloader... (puede pedir confirmación en el teléfono)')
     # Existen variantes: 'fastboot flashing unlock' o 'fastboot oem unlock'
-    exec_cmd(['fastboot', 'flashing', 'unlock'], dry_run=dry_run)
-    click.echo('Operación enviada. Sigue las instrucciones en el dispositivo.')
+    exec_cmd(fastboot_cmd('flashing', 'unlock'), dry_run=dry_run)
+    echo('Operación enviada. Sigue las instrucciones en el dispositivo.')
+
+
+# Ejecución dentro del proceso (GUI, batch): salida, progreso y cancelación por trabajo
+
+class Job:
+    """Un comando de `tool.py` ejecutado dentro de este proceso (p.ej. desde la GUI).
+
+    Recibe la salida de `echo` y de los procesos hijos, guarda el progreso que
+    reportan los comandos y permite cancelar: marca `cancelled` y cierra los
+    procesos `adb`/`fastboot` o sockets que el comando tenga abiertos.
+    `on_output(job, text)` y `on_update(job)` son los ganchos para el llamador.
+    """
+
+    def __init__(self, args, title=None, device=None):
+        self.args = [str(a) for a in args]
+        self.title = title or ' '.join(self.args)
+        self.device = device
+        self.state = 'en cola'
+        self.exit_code = None
+        self.progress = None
+        self.started = self.finished = None
+        self.cancelled = threading.Event()
+        self.on_output = None
+        self.on_update = None
+        self._resources = set()
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        if self.on_output is not None:
+            self.on_output(self, text)
+        else:
+            click.echo(text, nl=False)
+
+    def set_progress(self, done, total):
+        self.progress = (done, total)
+        self._changed()
+
+    def set_state(self, state):
+        self.state = state
+        self._changed()
+
+    def _changed(self):
+        if self.on_update is not None:
+            self.on_update(self)
+
+    def attach(self, resource):
+        with self._lock:
+            self._resources.add(resource)
+        if self.cancelled.is_set():
+            self._stop(resource)
+
+    def detach(self, resource):
+        with self._lock:
+            self._resources.discard(resource)
+
+    @staticmethod
+    def _stop(resource):
+        try:
+            if hasattr(resource, 'kill'):
+                resource.kill()
+            else:
+                resource.close()
+        except OSError:
+            pass
+
+    def cancel(self):
+        self.cancelled.set()
+        with self._lock:
+            resources = list(self._resources)
+        for resource in resources:
+            self._stop(resource)
+        self._changed()
+
+
+def run_job(job):
+    """Ejecuta `job.args` como `tool.py ARGS` en este proceso y devuelve el código de salida.
+
+    Cada trabajo corre en su propio contexto, así que `--serial`, el modo flota
+    y la salida no se mezclan con otros trabajos simultáneos.
+    """
+    return contextvars.copy_context().run(_run_job, job)
+
+
+def _run_job(job):
+    _job_var.set(job)
+    job.started = time.time()
+    job.set_state('ejecutando')
+    try:
+        cli.main(args=job.args, prog_name='tool.py', standalone_mode=False)
+        code = 0
+    except SystemExit as e:
+        code = _exit_code(e)
+    except JobCancelled:
+        code = 130
+    except click.exceptions.Abort:
+        echo('Operación cancelada.')
+        code = 1
+    except click.ClickException as e:
+        echo(f'Error: {e.format_message()}')
+        code = e.exit_code
+    except Exception as e:
+        echo(f'❌ ERROR: {e}')
+        code = 1
+    job.exit_code = code
+    job.finished = time.time()
+    if job.cancelled.is_set():
+        job.set_state('cancelado')
+    else:
+        job.set_state('ok' if code == 0 else 'error')
+    return code
+
+
+# Modo batch / sesión: muchos comandos en un solo proceso
+
+def _run_steps(lines, on_error):
+    """Ejecuta cada línea de `lines` (pares `(nº de línea, texto)`) como un comando de `tool.py`.
+
+    Todos los pasos comparten el proceso: rutas de `adb`/`fastboot`, conexiones al
+    servidor adb, propiedades cacheadas y hashes. Por cada paso se emite una línea
+    JSON con el resultado y la salida. Devuelve el peor código de salida.
+    """
+    transport = TRANSPORT['mode']
+    worst = 0
+    step = 0
+    for number, line in lines:
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as e:
+            args, error = None, f'línea mal formada: {e}'
+        else:
+            error = None
+            if args and args[0] in ('batch', 'session'):
+                error = f'`{args[0]}` no se puede anidar'
+        if args == []:
+            continue
+        step += 1
+        record = {'step': step, 'line': number, 'args': args}
+        if error:
+            record.update(exit_code=2, ok=False, elapsed=0.0, output=f'{error}\n')
+        else:
+            output = []
+            job = Job(['--transport', transport] + args, title=line.strip())
+            job.on_output = lambda _job, text: output.append(text)
+            start = time.monotonic()
+            code = run_job(job)
+            record.update(exit_code=code, ok=code == 0, elapsed=round(time.monotonic() - start, 3),
+                          output=''.join(output))
+        click.echo(json.dumps(record, ensure_ascii=False))
+        if record['exit_code']:
+            worst = max(worst, record['exit_code'])
+            if on_error == 'stop':
+                break
+    return worst
+
+
+on_error_option = click.option('--on-error', type=click.Choice(['stop', 'continue']), default='stop', show_default=True,
+                               help='Qué hacer si un paso falla')
+
+
+@cli.command()
+@click.argument('script', type=click.File('r', encoding='utf-8'))
+@on_error_option
+def batch(script, on_error):
+    """Ejecuta los comandos de SCRIPT (uno por línea, `#` para comentarios) en un solo proceso.
+
+    Cada línea es lo que iría tras `tool.py` (p.ej. `-s SERIAL info`). Los pasos no
+    son interactivos: las operaciones peligrosas necesitan `--confirm`. Emite una
+    línea JSON por paso (`step`, `args`, `exit_code`, `ok`, `elapsed`, `output`).
+    Usa `-` para leer el script de stdin.
+    """
+    sys.exit(_run_steps(enumerate(script, 1), on_error))
+
+
+@cli.command()
+@on_error_option
+def session(on_error):
+    """Lee comandos de stdin y los ejecuta según llegan, respondiendo una línea JSON por paso.
+
+    Pensado para que otro programa mantenga abierto un único proceso de
+    `tool.py` y le vaya enviando comandos (mismo formato que `batch`).
+    """
+    try:
+        code = _run_steps(enumerate(sys.stdin, 1), on_error)
+    except KeyboardInterrupt:
+        code = 130
+    sys.exit(code)
 
 
 if __name__ == '__main__':